@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class BackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend'
+
+    def ready(self):
+        # Só nos servidores (AQUECER_CACHES é ligado pelo gunicorn.conf.py): comandos como
+        # `migrate` e os testes não pagam o custo do aquecimento
+        if getattr(settings, 'AQUECER_CACHES', False):
+            from .aquecimento import aquecer_modulos
+            aquecer_modulos()
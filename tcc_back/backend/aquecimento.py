@@ -0,0 +1,68 @@
+import importlib
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Aquecimento dos processos do servidor: com o gunicorn em `preload_app`, a aplicação é carregada
+# uma única vez no processo mestre e os workers, criados por fork, herdam os módulos já importados,
+# as rotas resolvidas, o painel do cPRA e a matriz MFI, em vez de pagar esse custo na primeira requisição.
+# `aquecer_modulos` roda em BackendConfig.ready(); `aquecer_dados` acessa o banco e por isso roda
+# depois da inicialização do Django (hook `when_ready` do gunicorn.conf.py).
+
+# Dependências opcionais usadas pelas respostas (JSON rápido, MessagePack, Arrow)
+MODULOS_OPCIONAIS = ('orjson', 'msgpack', 'pyarrow')
+
+
+def aquecer_modulos():
+    """
+    Importa as views (e com elas pandas, numpy e os motores de crossmatch), monta as rotas
+    e lê o painel de doadores do cPRA.
+    """
+    from .cpra import ErroPainel, carregar_painel
+
+    inicio = time.perf_counter()
+    get_resolver().url_patterns  # Importa as URLconfs e as views
+    for nome in MODULOS_OPCIONAIS:
+        try:
+            importlib.import_module(nome)
+        except ImportError:
+            pass
+    try:
+        carregar_painel()
+    except ErroPainel as erro:
+        logger.info("Aquecimento sem o painel do cPRA: %s", erro)
+    logger.info("Módulos aquecidos em %.0f ms", (time.perf_counter() - inicio) * 1000)
+
+
+def aquecer_dados():
+    """
+    Carrega a matriz MFI (motor 'matriz') e fecha as conexões abertas, para que nenhuma
+    conexão ou pool seja compartilhado com os workers criados depois.
+    """
+    from .crossmatch import matriz_mfi
+
+    inicio = time.perf_counter()
+    try:
+        if getattr(settings, 'CROSSMATCH_ENGINE', 'matriz') == 'matriz':
+            matriz_mfi.sincronizar()
+    except Exception:
+        # Banco indisponível ou sem migrações: os workers carregam a matriz na primeira requisição
+        logger.warning("Não foi possível carregar a matriz MFI no aquecimento", exc_info=True)
+    finally:
+        fechar_conexoes()
+    logger.info("Dados aquecidos em %.0f ms", (time.perf_counter() - inicio) * 1000)
+
+
+def fechar_conexoes():
+    """
+    Fecha as conexões do processo atual e, com o psycopg_pool, o próprio pool.
+    """
+    for conexao in connections.all(initialized_only=True):
+        conexao.close()
+        if hasattr(conexao, 'close_pool'):
+            conexao.close_pool()
@@ -0,0 +1,220 @@
+import csv
+import hashlib
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import ExameAlelo, ResumoPaciente, CpraPaciente
+from .crossmatch import LIMIAR_MFI
+from .metricas import medir
+
+logger = logging.getLogger(__name__)
+
+# Limite de memória (em bytes) da matriz intermediária pacientes x doadores x palavras
+MEMORIA_BLOCO = 64 * 1024 * 1024
+
+# Antígenos de uma célula do painel podem ser separados por espaços, vírgulas ou ponto e vírgula
+SEPARADORES_ANTIGENOS = re.compile(r'[\s,;]+')
+
+
+class ErroPainel(Exception):
+    """
+    Painel de doadores ausente ou inválido (retornado ao cliente como 503).
+    """
+
+
+def interpretar_antigeno(texto):
+    """
+    Converte um antígeno do painel ("A*02", "A*02:01", "DRB1*04") na chave (tipo, numero1)
+    usada pelos alelos dos exames. Retorna None para antígenos malformados.
+    """
+    if '*' not in texto:
+        return None
+    try:
+        return texto[:2], int(texto.split('*')[1].split(':')[0])
+    except ValueError:
+        return None
+
+
+def nome_antigeno(tipo, numero1):
+    return f"{tipo}{numero1:02d}"
+
+
+class PainelDoadores:
+    """
+    Fenótipos dos doadores de referência como bitsets: cada antígeno do painel
+    recebe um bit e cada doador é uma linha de palavras `uint64`.
+    """
+
+    def __init__(self, fenotipos, frequencias, identificacao):
+        self.bit_por_antigeno = {}
+        for fenotipo in fenotipos:
+            for antigeno in fenotipo:
+                self.bit_por_antigeno.setdefault(antigeno, len(self.bit_por_antigeno))
+        self.palavras = max(1, (len(self.bit_por_antigeno) + 63) // 64)
+
+        self.bits = np.zeros((len(fenotipos), self.palavras), dtype=np.uint64)
+        for i, fenotipo in enumerate(fenotipos):
+            self.bits[i] = self.mascara(fenotipo)
+        self.frequencias = np.asarray(frequencias, dtype=np.float64)
+        self.total = float(self.frequencias.sum())
+        self.identificacao = identificacao
+
+    def mascara(self, antigenos):
+        """
+        Bitset dos antígenos informados; antígenos ausentes do painel são ignorados.
+        """
+        mascara = np.zeros(self.palavras, dtype=np.uint64)
+        for antigeno in antigenos:
+            bit = self.bit_por_antigeno.get(antigeno)
+            if bit is not None:
+                mascara[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return mascara
+
+    def calcular(self, mascaras):
+        """
+        cPRA (0 a 100) de cada linha de `mascaras` (pacientes x palavras): um doador é
+        incompatível se compartilha algum bit com o paciente. Os pacientes são
+        processados em blocos para limitar a memória da operação vetorizada.
+        """
+        resultado = np.zeros(len(mascaras), dtype=np.float64)
+        if not len(mascaras) or not self.total:
+            return resultado
+        bloco = max(1, MEMORIA_BLOCO // (len(self.bits) * self.palavras * 8))
+        for inicio in range(0, len(mascaras), bloco):
+            parte = mascaras[inicio:inicio + bloco]
+            positivos = (parte[:, None, :] & self.bits[None, :, :]).any(axis=2)
+            resultado[inicio:inicio + bloco] = positivos @ self.frequencias / self.total * 100
+        return resultado
+
+
+def ler_painel(caminho):
+    """
+    Lê o painel em CSV com a coluna `antigenos` e, opcionalmente, `frequencia`.
+    """
+    if not caminho or not os.path.exists(caminho):
+        raise ErroPainel("Painel de doadores do cPRA não configurado.")
+
+    with open(caminho, 'rb') as arquivo:
+        identificacao = hashlib.sha256(arquivo.read()).hexdigest()[:16]
+
+    fenotipos, frequencias = [], []
+    with open(caminho, newline='', encoding='utf-8-sig') as arquivo:
+        leitor = csv.DictReader(arquivo)
+        if 'antigenos' not in (leitor.fieldnames or []):
+            raise ErroPainel("O painel de doadores deve ter a coluna 'antigenos'.")
+        for numero, linha in enumerate(leitor, start=2):
+            antigenos = [interpretar_antigeno(texto) for texto in SEPARADORES_ANTIGENOS.split(linha['antigenos'] or '') if texto]
+            try:
+                frequencia = float(linha.get('frequencia') or 1)
+            except ValueError:
+                raise ErroPainel(f"Frequência inválida na linha {numero} do painel de doadores.")
+            fenotipos.append({antigeno for antigeno in antigenos if antigeno is not None})
+            frequencias.append(frequencia)
+
+    if not fenotipos:
+        raise ErroPainel("O painel de doadores está vazio.")
+    logger.info("Painel de doadores do cPRA carregado: %d fenótipos (%s)", len(fenotipos), identificacao)
+    return PainelDoadores(fenotipos, frequencias, identificacao)
+
+
+_painel = {'chave': None, 'painel': None}
+_painel_lock = threading.Lock()
+
+
+def carregar_painel():
+    """
+    Retorna o painel de `settings.CPRA_PAINEL`, relendo o arquivo apenas quando ele muda.
+    """
+    caminho = getattr(settings, 'CPRA_PAINEL', None)
+    with _painel_lock:
+        try:
+            chave = (caminho, os.path.getmtime(caminho))
+        except (OSError, TypeError):
+            raise ErroPainel("Painel de doadores do cPRA não configurado.")
+        if _painel['chave'] != chave:
+            _painel['painel'] = ler_painel(caminho)
+            _painel['chave'] = chave
+        return _painel['painel']
+
+
+def antigenos_inaceitaveis(paciente_ids=None):
+    """
+    Antígenos (tipo, numero1) com MFI acima do limiar no último exame de cada paciente.
+    Retorna {paciente_id: (ultimo_exame_id, conjunto de antígenos)} para os pacientes com exames.
+    """
+    resumos = ResumoPaciente.objects.exclude(ultimo_exame=None)
+    if paciente_ids is not None:
+        resumos = resumos.filter(paciente_id__in=paciente_ids)
+    inaceitaveis = {paciente_id: (exame_id, set()) for paciente_id, exame_id in resumos.values_list('paciente_id', 'ultimo_exame_id')}
+
+    valores = (
+        ExameAlelo.objects.filter(exame_id__in=resumos.values('ultimo_exame_id'), valor__gte=LIMIAR_MFI)
+        .values_list('exame__paciente_id', 'alelo__tipo', 'alelo__numero1')
+    )
+    for paciente_id, tipo, numero1 in valores:
+        inaceitaveis[paciente_id][1].add((tipo, numero1))
+    return inaceitaveis
+
+
+def calcular_cpra(paciente_ids=None):
+    """
+    Calcula e grava o cPRA dos pacientes informados (ou de toda a lista de espera).
+    Pacientes sem exames não têm cPRA. Retorna a quantidade de pacientes calculados.
+    """
+    painel = carregar_painel()
+    inaceitaveis = antigenos_inaceitaveis(paciente_ids)
+    paciente_ids_calculados = list(inaceitaveis)
+
+    mascaras = np.zeros((len(paciente_ids_calculados), painel.palavras), dtype=np.uint64)
+    for i, paciente_id in enumerate(paciente_ids_calculados):
+        mascaras[i] = painel.mascara(inaceitaveis[paciente_id][1])
+    with medir('calculo'):
+        valores = painel.calcular(mascaras)
+
+    with transaction.atomic():
+        existentes = CpraPaciente.objects.all()
+        if paciente_ids is not None:
+            existentes = existentes.filter(paciente_id__in=list(paciente_ids))
+        existentes.delete()
+        CpraPaciente.objects.bulk_create([
+            CpraPaciente(
+                paciente_id=paciente_id,
+                cpra=float(valor),
+                antigenos_inaceitaveis=sorted(nome_antigeno(*antigeno) for antigeno in inaceitaveis[paciente_id][1]),
+                ultimo_exame_id=inaceitaveis[paciente_id][0],
+                painel=painel.identificacao,
+            )
+            for paciente_id, valor in zip(paciente_ids_calculados, valores)
+        ], batch_size=1000)
+    logger.info("cPRA calculado para %d pacientes", len(paciente_ids_calculados))
+    return len(paciente_ids_calculados)
+
+
+def atualizar_cpra(paciente_ids):
+    """
+    Recalcula o cPRA após uma alteração de exames, se houver painel configurado.
+    """
+    try:
+        calcular_cpra(paciente_ids)
+    except ErroPainel:
+        logger.debug("cPRA não recalculado: painel de doadores não configurado.")
+
+
+def cpra_atual(paciente_id):
+    """
+    Retorna o cPRA gravado do paciente, recalculando-o se ainda não existir ou se foi
+    calculado com outro exame ou outro painel. Retorna None se o paciente não tem exames.
+    """
+    painel = carregar_painel()
+    cpra = CpraPaciente.objects.filter(paciente_id=paciente_id).first()
+    ultimo_exame_id = ResumoPaciente.objects.filter(paciente_id=paciente_id).values_list('ultimo_exame_id', flat=True).first()
+    if cpra is None or cpra.ultimo_exame_id != ultimo_exame_id or cpra.painel != painel.identificacao:
+        calcular_cpra([paciente_id])
+        cpra = CpraPaciente.objects.filter(paciente_id=paciente_id).first()
+    return cpra
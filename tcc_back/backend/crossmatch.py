@@ -0,0 +1,726 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Paciente, Exame, ExameAlelo, Alelo, ResumoPaciente, Crossmatch, CrossmatchPatientResult, CrossmatchAlleleResult
+from .metricas import medir
+from .versoes import CROSSMATCHES, obter_versao, incrementar_versao, registrar_escrita
+
+logger = logging.getLogger(__name__)
+
+# Valores de MFI abaixo deste limite são considerados compatíveis
+LIMIAR_MFI = 1000
+
+# Campos do doador obrigatórios para gravar um crossmatch
+CAMPOS_DOADOR = ['donor_name', 'donor_sex', 'donor_birth_date', 'donor_blood_type']
+
+
+def pares_do_doador(alelos_especificos):
+    """
+    Converte a lista de alelos enviada pelo front-end em pares (tipo, numero1).
+    Alelos com número "0" são ignorados e pares repetidos aparecem uma única vez.
+    """
+    return list(dict.fromkeys(
+        (alelo['tipo'], int(alelo['numero']))
+        for alelo in alelos_especificos if str(alelo['numero']) != "0"
+    ))
+
+
+def ultimos_exames():
+    """
+    Queryset com o último exame de cada paciente (maior data; em empate, o menor id),
+    lido da tabela de resumos em vez de recalculado a cada consulta.
+    """
+    return Exame.objects.filter(id__in=ResumoPaciente.objects.values('ultimo_exame_id'))
+
+
+def crossmatch_pandas(pares, donor_blood_type):
+    """
+    Implementação original com DataFrames do pandas.
+    Retorna None quando não há pacientes com o tipo sanguíneo do doador.
+    """
+    pacientes = Paciente.objects.filter(tipo_sanguineo=donor_blood_type).values('id', 'nome', 'tipo_sanguineo')
+    pacientes_df = pd.DataFrame(list(pacientes))
+
+    if pacientes_df.empty:
+        return None
+
+    exames_df = pd.DataFrame(list(Exame.objects.all().values('id', 'paciente_id', 'data_exame')))
+
+    # Filtra os alelos que correspondem ao `tipo` e `numero1` enviados
+    exames_alelos_df = pd.DataFrame(list(
+        ExameAlelo.objects.select_related('alelo')
+        .filter(alelo__tipo__in=[f[0] for f in pares], alelo__numero1__in=[f[1] for f in pares])
+        .values('exame_id', 'alelo__nome', 'alelo__tipo', 'alelo__numero1', 'valor', 'exame__paciente_id')
+    ))
+    if exames_df.empty or exames_alelos_df.empty:
+        return {}
+
+    # O filtro acima combina tipos e números de pares diferentes; mantém apenas os pares exatos
+    chaves = pd.MultiIndex.from_frame(exames_alelos_df[['alelo__tipo', 'alelo__numero1']])
+    exames_alelos_df = exames_alelos_df[chaves.isin(pares)]
+
+    # Encontra o último exame de cada paciente
+    exames_df = exames_df.sort_values(['paciente_id', 'id'])
+    ultimos = exames_df.loc[exames_df.groupby('paciente_id')['data_exame'].idxmax()]
+
+    # Filtra os alelos específicos nos últimos exames de cada paciente com tipo sanguíneo igual ao do doador
+    exames_alelos_filtrados = exames_alelos_df[
+        exames_alelos_df['exame_id'].isin(ultimos['id']) &
+        exames_alelos_df['exame__paciente_id'].isin(pacientes_df['id'])
+    ]
+
+    nomes = dict(zip(pacientes_df['id'], pacientes_df['nome']))
+    pacientes_compatibilidade = {}
+    for paciente_id, grupo in exames_alelos_filtrados.groupby('exame__paciente_id'):
+        pacientes_compatibilidade[int(paciente_id)] = {
+            'nome': nomes[paciente_id],
+            'alelos_correspondentes': [
+                {'nome': nome, 'valor': float(valor), 'compatibilidade': bool(valor < LIMIAR_MFI)}
+                for nome, valor in zip(grupo['alelo__nome'], grupo['valor'])
+            ]
+        }
+    return pacientes_compatibilidade
+
+
+# Consulta única do motor SQL: último exame de cada paciente do tipo sanguíneo do doador
+# (da tabela de resumos), junção com os alelos do doador por (tipo, numero1) e agregação
+# dos alelos por paciente.
+# O CTE `doador` herda os tipos das colunas de `alelos` e recebe os pares via VALUES.
+SQL_CROSSMATCH = """
+WITH doador (tipo, numero1) AS (
+    SELECT tipo, numero1 FROM alelos WHERE 1 = 0
+    {valores}
+),
+agrupado AS (
+    SELECT p.id, p.nome, {agregacao} AS alelos
+    FROM pacientes p
+    JOIN resumos_pacientes r ON r.paciente_id = p.id
+    JOIN exames_alelos ea ON ea.exame_id = r.ultimo_exame_id
+    JOIN alelos a ON a.id = ea.alelo_id
+    JOIN doador d ON d.tipo = a.tipo AND d.numero1 = a.numero1
+    WHERE p.tipo_sanguineo = %s
+    GROUP BY p.id, p.nome
+)
+SELECT EXISTS (SELECT 1 FROM pacientes WHERE tipo_sanguineo = %s), g.id, g.nome, g.alelos
+FROM (SELECT 1 AS um) unica
+LEFT JOIN agrupado g ON 1 = 1
+ORDER BY g.id
+"""
+
+AGREGACAO_SQL = {
+    'postgresql': "json_agg(json_build_object('nome', a.nome, 'valor', ea.valor) ORDER BY ea.id)",
+    # O JSON do SQLite arredonda REAL para 15 dígitos; o texto com 17 dígitos preserva o valor exato
+    'sqlite': "json_group_array(json_object('nome', a.nome, 'valor', printf('%%!.17g', ea.valor)))",
+}
+
+
+def crossmatch_sql(pares, donor_blood_type):
+    """
+    Executa o crossmatch inteiro no banco de dados em uma única consulta.
+    Funciona em PostgreSQL e em SQLite (usado nos testes).
+    Retorna None quando não há pacientes com o tipo sanguíneo do doador.
+    """
+    valores = "UNION ALL VALUES " + ", ".join(["(%s, %s)"] * len(pares)) if pares else ""
+    sql = SQL_CROSSMATCH.format(valores=valores, agregacao=AGREGACAO_SQL[connection.vendor])
+    parametros = [v for par in pares for v in par] + [donor_blood_type, donor_blood_type]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        linhas = cursor.fetchall()
+
+    if not linhas[0][0]:
+        return None
+
+    pacientes_compatibilidade = {}
+    for _, paciente_id, nome, alelos in linhas:
+        if paciente_id is None:
+            continue
+        if isinstance(alelos, str):
+            alelos = json.loads(alelos)
+        valores = [float(alelo['valor']) for alelo in alelos]
+        pacientes_compatibilidade[paciente_id] = {
+            'nome': nome,
+            'alelos_correspondentes': [
+                {'nome': alelo['nome'], 'valor': valor, 'compatibilidade': valor < LIMIAR_MFI}
+                for alelo, valor in zip(alelos, valores)
+            ]
+        }
+    return pacientes_compatibilidade
+
+
+def _completar(vetor, tamanho, preenchimento):
+    if len(vetor) >= tamanho:
+        return vetor
+    return np.concatenate([vetor, np.full(tamanho - len(vetor), preenchimento, dtype=vetor.dtype)])
+
+
+class MatrizMFI:
+    """
+    Matriz residente em memória com o MFI do último exame de cada paciente.
+
+    Linhas são pacientes e colunas são alelos (`Alelo.id`); células sem valor
+    ficam com NaN. A matriz é sincronizada com o contador de versão global: as
+    alterações feitas neste processo são aplicadas incrementalmente e as feitas
+    por outros processos provocam uma recarga completa.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.carregada = False
+        self.versao = None
+
+    # --- Carga e atualização -------------------------------------------------
+
+    def carregar(self):
+        """
+        Reconstrói a matriz inteira a partir do banco de dados.
+        """
+        with self._lock:
+            versao = obter_versao()
+
+            pacientes = list(Paciente.objects.values_list('id', 'nome', 'tipo_sanguineo').order_by('id'))
+            alelos = list(Alelo.objects.values_list('id', 'nome', 'tipo', 'numero1').order_by('id'))
+            valores = list(
+                ExameAlelo.objects.filter(exame__in=ultimos_exames())
+                .values_list('exame__paciente_id', 'alelo_id', 'valor')
+                .order_by('id')
+            )
+
+            self.ids = np.array([p[0] for p in pacientes], dtype=np.int64)
+            self.nomes = np.array([p[1] for p in pacientes], dtype=object)
+            self.tipos_sanguineos = np.array([p[2] for p in pacientes], dtype=object)
+            self.linha_por_paciente = {pid: i for i, pid in enumerate(self.ids.tolist())}
+            self.n_pacientes = len(pacientes)
+
+            self.alelo_ids = np.array([a[0] for a in alelos], dtype=np.int64)
+            self.alelo_nomes = np.array([a[1] for a in alelos], dtype=object)
+            self.alelo_chaves = np.array([f"{a[2]}:{a[3]}" for a in alelos], dtype=object)
+            self.coluna_por_alelo = {aid: j for j, aid in enumerate(self.alelo_ids.tolist())}
+            self.n_alelos = len(alelos)
+
+            self.mfi = np.full((max(self.n_pacientes, 1), max(self.n_alelos, 1)), np.nan)
+            if valores:
+                linhas = np.fromiter((self.linha_por_paciente[v[0]] for v in valores), dtype=np.int64, count=len(valores))
+                colunas = np.fromiter((self.coluna_por_alelo[v[1]] for v in valores), dtype=np.int64, count=len(valores))
+                self.mfi[linhas, colunas] = np.fromiter((v[2] for v in valores), dtype=np.float64, count=len(valores))
+            self._garantir_capacidade(self.n_pacientes, self.n_alelos)
+
+            self.versao = versao
+            self.carregada = True
+            logger.info("Matriz MFI carregada: %d pacientes x %d alelos (versão %s)",
+                        self.n_pacientes, self.n_alelos, versao)
+
+    def _garantir_capacidade(self, linhas, colunas):
+        altura, largura = self.mfi.shape
+        if linhas > altura or colunas > largura:
+            # Cresce em potências de dois para amortizar as cópias
+            nova = np.full((altura if linhas <= altura else max(linhas, altura * 2),
+                            largura if colunas <= largura else max(colunas, largura * 2)), np.nan)
+            nova[:altura, :largura] = self.mfi
+            self.mfi = nova
+        self.ids = _completar(self.ids, self.mfi.shape[0], -1)
+        self.nomes = _completar(self.nomes, self.mfi.shape[0], None)
+        self.tipos_sanguineos = _completar(self.tipos_sanguineos, self.mfi.shape[0], None)
+        self.alelo_ids = _completar(self.alelo_ids, self.mfi.shape[1], -1)
+        self.alelo_nomes = _completar(self.alelo_nomes, self.mfi.shape[1], None)
+        self.alelo_chaves = _completar(self.alelo_chaves, self.mfi.shape[1], None)
+
+    def _coluna(self, alelo_id, nome, tipo, numero1):
+        coluna = self.coluna_por_alelo.get(alelo_id)
+        if coluna is None:
+            coluna = self.n_alelos
+            self._garantir_capacidade(self.n_pacientes, coluna + 1)
+            self.alelo_ids[coluna] = alelo_id
+            self.alelo_nomes[coluna] = nome
+            self.alelo_chaves[coluna] = f"{tipo}:{numero1}"
+            self.coluna_por_alelo[alelo_id] = coluna
+            self.n_alelos += 1
+        return coluna
+
+    def _remover_paciente(self, paciente_id):
+        linha = self.linha_por_paciente.pop(paciente_id, None)
+        if linha is None:
+            return
+        # Move a última linha para a posição removida para manter a matriz compacta
+        ultima = self.n_pacientes - 1
+        if linha != ultima:
+            self.mfi[linha] = self.mfi[ultima]
+            self.ids[linha] = self.ids[ultima]
+            self.nomes[linha] = self.nomes[ultima]
+            self.tipos_sanguineos[linha] = self.tipos_sanguineos[ultima]
+            self.linha_por_paciente[int(self.ids[linha])] = linha
+        self.mfi[ultima] = np.nan
+        self.ids[ultima] = -1
+        self.nomes[ultima] = None
+        self.tipos_sanguineos[ultima] = None
+        self.n_pacientes -= 1
+
+    def _atualizar_paciente(self, paciente_id):
+        paciente = Paciente.objects.filter(id=paciente_id).values_list('nome', 'tipo_sanguineo').first()
+        if paciente is None:
+            self._remover_paciente(paciente_id)
+            return
+
+        linha = self.linha_por_paciente.get(paciente_id)
+        if linha is None:
+            linha = self.n_pacientes
+            self._garantir_capacidade(linha + 1, self.n_alelos)
+            self.ids[linha] = paciente_id
+            self.linha_por_paciente[paciente_id] = linha
+            self.n_pacientes += 1
+        self.nomes[linha], self.tipos_sanguineos[linha] = paciente
+
+        ultimo = ResumoPaciente.objects.filter(paciente_id=paciente_id).values_list('ultimo_exame_id', flat=True).first()
+        valores = []
+        if ultimo is not None:
+            valores = list(
+                ExameAlelo.objects.filter(exame_id=ultimo)
+                .values_list('alelo_id', 'alelo__nome', 'alelo__tipo', 'alelo__numero1', 'valor')
+                .order_by('id')
+            )
+        colunas = [self._coluna(*v[:4]) for v in valores]
+        self.mfi[linha] = np.nan
+        if valores:
+            self.mfi[linha, colunas] = [v[4] for v in valores]
+
+    def registrar_alteracao(self, paciente_ids):
+        """
+        Deve ser chamado na transação que gravou alterações em pacientes ou exames.
+        Incrementa a versão global junto com os dados e, após a confirmação, atualiza
+        apenas as linhas afetadas.
+        """
+        self._registrar(paciente_ids, self._atualizar_paciente)
+
+    def registrar_remocao(self, paciente_ids):
+        """
+        Como `registrar_alteracao`, para pacientes excluídos: as linhas são removidas
+        da matriz sem consultar o banco.
+        """
+        self._registrar(paciente_ids, self._remover_paciente)
+
+    def _registrar(self, paciente_ids, aplicar_paciente):
+        # A versão é confirmada com os dados: se o processo cair antes do on_commit, os demais
+        # processos ainda veem a nova versão e recarregam as suas matrizes
+        nova_versao = incrementar_versao()
+
+        def aplicar():
+            with self._lock:
+                if not self.carregada or nova_versao != self.versao + 1:
+                    # Outro processo também alterou os dados: recarrega na próxima consulta
+                    self.carregada = False
+                    return
+                try:
+                    for paciente_id in paciente_ids:
+                        aplicar_paciente(paciente_id)
+                except Exception:
+                    # A escrita já foi confirmada: a matriz é apenas recarregada na próxima consulta
+                    logger.exception("Erro ao atualizar a matriz MFI; ela será recarregada")
+                    self.carregada = False
+                    return
+                self.versao = nova_versao
+
+        transaction.on_commit(aplicar)
+
+    def sincronizar(self):
+        """
+        Recarrega a matriz se ela ainda não foi carregada ou se está desatualizada.
+        """
+        with self._lock:
+            if not self.carregada or obter_versao() != self.versao:
+                self.carregar()
+
+    # --- Consulta ------------------------------------------------------------
+
+    def crossmatch(self, pares, donor_blood_type):
+        """
+        Executa o crossmatch com operações vetorizadas sobre a matriz.
+        Retorna None quando não há pacientes com o tipo sanguíneo do doador.
+        """
+        return self.crossmatch_lote([(pares, donor_blood_type)])[0]
+
+    def crossmatch_lote(self, consultas):
+        """
+        Executa o crossmatch de vários doadores, recebidos como (pares, tipo sanguíneo).
+        Os doadores do mesmo tipo sanguíneo são avaliados juntos com um produto de
+        matrizes (pacientes x alelos) por (alelos x doadores).
+        """
+        self.sincronizar()
+        resultados = [None] * len(consultas)
+        with self._lock:
+            n, m = self.n_pacientes, self.n_alelos
+
+            # Matriz doadores x alelos marcando os alelos de cada doador
+            doadores = np.zeros((len(consultas), m), dtype=bool)
+            for i, (pares, _) in enumerate(consultas):
+                doadores[i] = np.isin(self.alelo_chaves[:m], [f"{tipo}:{numero}" for tipo, numero in pares])
+            colunas = np.flatnonzero(doadores.any(axis=0))
+            doadores = doadores[:, colunas]
+
+            tipos = self.tipos_sanguineos[:n]
+            por_tipo = {}
+            for i, (_, donor_blood_type) in enumerate(consultas):
+                por_tipo.setdefault(donor_blood_type, []).append(i)
+
+            for donor_blood_type, indices in por_tipo.items():
+                linhas = np.flatnonzero(tipos == donor_blood_type)
+                if linhas.size == 0:
+                    continue
+                submatriz = self.mfi[np.ix_(linhas, colunas)]
+                presentes = ~np.isnan(submatriz)
+                # Quantidade de alelos de cada doador presentes no último exame de cada paciente
+                contagens = presentes.astype(np.float32) @ doadores[indices].T.astype(np.float32)
+                for k, i in enumerate(indices):
+                    selecionados = np.flatnonzero(contagens[:, k] > 0)
+                    resultados[i] = self._montar_resultado(
+                        linhas[selecionados], colunas, submatriz[selecionados], presentes[selecionados] & doadores[i]
+                    )
+        return resultados
+
+    def _montar_resultado(self, linhas, colunas, submatriz, presentes):
+        ids = self.ids[linhas]
+        nomes = self.nomes[linhas]
+        alelo_nomes = self.alelo_nomes[colunas]
+
+        pacientes_compatibilidade = {}
+        for i in np.argsort(ids, kind='stable'):
+            cols = np.flatnonzero(presentes[i])
+            valores = submatriz[i, cols]
+            pacientes_compatibilidade[int(ids[i])] = {
+                'nome': nomes[i],
+                'alelos_correspondentes': [
+                    {'nome': nome, 'valor': valor, 'compatibilidade': compativel}
+                    for nome, valor, compativel in zip(
+                        alelo_nomes[cols].tolist(), valores.tolist(), (valores < LIMIAR_MFI).tolist()
+                    )
+                ]
+            }
+        return pacientes_compatibilidade
+
+
+# Instância única por processo
+matriz_mfi = MatrizMFI()
+
+
+def registrar_alteracao(paciente_ids):
+    """
+    Notifica os motores de crossmatch de que os dados dos pacientes informados mudaram.
+    """
+    matriz_mfi.registrar_alteracao(list(paciente_ids))
+
+
+def registrar_remocao(paciente_ids):
+    """
+    Notifica os motores de crossmatch de que os pacientes informados foram excluídos.
+    """
+    matriz_mfi.registrar_remocao(list(paciente_ids))
+
+
+class CacheResultados:
+    """
+    Cache LRU dos resultados de crossmatch por processo.
+
+    A chave inclui a versão global dos dados: qualquer alteração registrada torna
+    as entradas antigas inalcançáveis, sem depender de tempo de expiração. Os
+    resultados são compartilhados entre as requisições e não devem ser alterados.
+    """
+
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self.versao = None
+        self.acertos = 0
+        self.falhas = 0
+
+    @staticmethod
+    def chave(pares, donor_blood_type, versao):
+        # Alelos do doador em qualquer ordem ou repetidos produzem o mesmo resultado
+        return versao, donor_blood_type, tuple(sorted(set(pares)))
+
+    def obter(self, chave):
+        with self._lock:
+            if chave[0] != self.versao:
+                # Os dados mudaram: nenhuma entrada anterior pode mais ser usada
+                self._entradas.clear()
+                self.versao = chave[0]
+            if chave in self._entradas:
+                self._entradas.move_to_end(chave)
+                self.acertos += 1
+                return True, self._entradas[chave]
+            self.falhas += 1
+            return False, None
+
+    def guardar(self, chave, resultado):
+        if self.tamanho <= 0:
+            return
+        with self._lock:
+            if chave[0] != self.versao:
+                return
+            self._entradas[chave] = resultado
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.tamanho:
+                self._entradas.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.acertos = self.falhas = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {'entradas': len(self._entradas), 'tamanho': self.tamanho,
+                    'acertos': self.acertos, 'falhas': self.falhas, 'versao': self.versao}
+
+
+cache_resultados = CacheResultados(getattr(settings, 'CROSSMATCH_CACHE_TAMANHO', 256))
+
+
+def _calcular_crossmatch(pares, donor_blood_type):
+    motor = getattr(settings, 'CROSSMATCH_ENGINE', 'matriz')
+    if motor == 'pandas':
+        return crossmatch_pandas(pares, donor_blood_type)
+    if motor == 'sql':
+        return crossmatch_sql(pares, donor_blood_type)
+    return matriz_mfi.crossmatch(pares, donor_blood_type)
+
+
+def executar_crossmatch(alelos_especificos, donor_blood_type):
+    """
+    Executa o crossmatch com o motor configurado em `settings.CROSSMATCH_ENGINE`.
+    Resultados repetidos para o mesmo doador e a mesma versão dos dados vêm do cache.
+    """
+    pares = pares_do_doador(alelos_especificos)
+    chave = cache_resultados.chave(pares, donor_blood_type, obter_versao())
+    encontrado, resultado = cache_resultados.obter(chave)
+    if not encontrado:
+        with medir('calculo'):
+            resultado = _calcular_crossmatch(pares, donor_blood_type)
+        cache_resultados.guardar(chave, resultado)
+    return resultado
+
+
+def executar_crossmatch_lote(doadores):
+    """
+    Executa o crossmatch de vários doadores com uma única carga dos dados.
+    Cada doador é um dicionário com `alelos` e `donor_blood_type`; o resultado de
+    cada um tem o mesmo formato de `executar_crossmatch`. Doadores já presentes no
+    cache não são recalculados.
+    """
+    consultas = [
+        (pares_do_doador(doador.get('alelos', [])), doador.get('donor_blood_type'))
+        for doador in doadores
+    ]
+    versao = obter_versao()
+    chaves = [cache_resultados.chave(pares, donor_blood_type, versao) for pares, donor_blood_type in consultas]
+    resultados = [None] * len(consultas)
+    pendentes = []
+    for i, chave in enumerate(chaves):
+        encontrado, resultados[i] = cache_resultados.obter(chave)
+        if not encontrado:
+            pendentes.append(i)
+    if not pendentes:
+        return resultados
+
+    if getattr(settings, 'CROSSMATCH_ENGINE', 'matriz') == 'matriz':
+        matriz = matriz_mfi
+    else:
+        # Nos demais motores, carrega uma matriz temporária compartilhada por todos os doadores
+        matriz = MatrizMFI()
+        with medir('calculo'):
+            matriz.carregar()
+    with medir('calculo'):
+        calculados = matriz.crossmatch_lote([consultas[i] for i in pendentes])
+    for i, resultado in zip(pendentes, calculados):
+        resultados[i] = resultado
+        cache_resultados.guardar(chaves[i], resultado)
+    return resultados
+
+
+def validar_resultados(pacientes_compatibilidade):
+    """
+    Verifica o formato dos resultados enviados pelo cliente.
+    Retorna a mensagem de erro ou None se estiverem completos.
+    """
+    if not isinstance(pacientes_compatibilidade, dict):
+        return "Resultados inválidos."
+    for paciente_id, dados in pacientes_compatibilidade.items():
+        if not isinstance(dados, dict) or 'nome' not in dados or 'alelos_correspondentes' not in dados:
+            return f"Dados do paciente {paciente_id} incompletos."
+        for alelo in dados['alelos_correspondentes']:
+            if not all(campo in alelo for campo in ('nome', 'valor', 'compatibilidade')):
+                return f"Dados do paciente {paciente_id} incompletos."
+    return None
+
+
+def empacotar_alelos(alelo_ids, valores, compatibilidades):
+    """
+    Empacota os alelos de um resultado de paciente nos campos binários de
+    `CrossmatchPatientResult`: ids em int64, MFI em float64 e compatibilidades em bits.
+    """
+    return (
+        np.asarray(alelo_ids, dtype='<i8').tobytes(),
+        np.asarray(valores, dtype='<f8').tobytes(),
+        np.packbits(np.asarray(compatibilidades, dtype=bool), bitorder='little').tobytes(),
+    )
+
+
+def desempacotar_alelos(resultado):
+    """
+    Operação inversa de `empacotar_alelos`: retorna (ids, valores, compatibilidades).
+    """
+    alelo_ids = np.frombuffer(bytes(resultado.alelos), dtype='<i8')
+    valores = np.frombuffer(bytes(resultado.valores), dtype='<f8')
+    compatibilidades = np.unpackbits(
+        np.frombuffer(bytes(resultado.compatibilidades), dtype=np.uint8), count=len(alelo_ids), bitorder='little'
+    ).astype(bool)
+    return alelo_ids, valores, compatibilidades
+
+
+def _consultas_alelos(resultados):
+    # Alelos empacotados já decodificados e as consultas dos nomes e dos alelos no formato antigo
+    decodificados = {id(resultado): desempacotar_alelos(resultado) for resultado in resultados if resultado.alelos is not None}
+    alelo_ids = {alelo_id for ids, _, _ in decodificados.values() for alelo_id in ids.tolist()}
+    nomes = Alelo.objects.filter(id__in=alelo_ids).values_list('id', 'nome') if alelo_ids else None
+    antigos = [resultado.pk for resultado in resultados if id(resultado) not in decodificados]
+    legados = CrossmatchAlleleResult.objects.filter(patient_result_id__in=antigos).order_by('id') if antigos else None
+    return decodificados, nomes, legados
+
+
+def _preencher_alelos(resultados, decodificados, nomes, legados):
+    por_resultado = {}
+    for alelo in legados:
+        por_resultado.setdefault(alelo.patient_result_id, []).append(alelo)
+
+    for resultado in resultados:
+        if id(resultado) in decodificados:
+            ids, valores, compatibilidades = decodificados[id(resultado)]
+            resultado.alelos_resultado = [
+                {'allele_name': nomes.get(alelo_id), 'allele_value': valor, 'compatibility': compativel}
+                for alelo_id, valor, compativel in zip(ids.tolist(), valores.tolist(), compatibilidades.tolist())
+            ]
+        else:
+            resultado.alelos_resultado = [
+                {'allele_name': alelo.allele_name, 'allele_value': alelo.allele_value, 'compatibility': alelo.compatibility}
+                for alelo in por_resultado.get(resultado.pk, [])
+            ]
+    return resultados
+
+
+def anexar_alelos(resultados):
+    """
+    Preenche `alelos_resultado` de cada `CrossmatchPatientResult` com a lista de alelos no
+    formato da API ({allele_name, allele_value, compatibility}). Os nomes dos alelos
+    empacotados são buscados em uma única consulta; resultados gravados no formato antigo
+    usam as linhas de `CrossmatchAlleleResult`.
+    """
+    decodificados, nomes, legados = _consultas_alelos(resultados)
+    return _preencher_alelos(
+        resultados, decodificados, dict(nomes) if nomes is not None else {}, list(legados) if legados is not None else [],
+    )
+
+
+async def anexar_alelos_async(resultados):
+    """
+    Mesmo que `anexar_alelos`, com o ORM assíncrono.
+    """
+    decodificados, nomes, legados = _consultas_alelos(resultados)
+    return _preencher_alelos(
+        resultados, decodificados,
+        {alelo_id: nome async for alelo_id, nome in nomes} if nomes is not None else {},
+        [alelo async for alelo in legados] if legados is not None else [],
+    )
+
+
+def _ids_dos_alelos(nomes):
+    """
+    Retorna {nome: Alelo.id} para os nomes informados que já existem no catálogo. O catálogo
+    só é alterado pela ingestão de exames: nomes desconhecidos ficam de fora.
+    """
+    return dict(Alelo.objects.filter(nome__in=list(nomes)).values_list('nome', 'id'))
+
+
+def salvar_resultado(doador, pacientes_compatibilidade):
+    """
+    Grava o crossmatch com os resultados dos pacientes em uma única transação, usando
+    inserções em lote. Os alelos de cada paciente são gravados em arrays empacotados;
+    apenas resultados com nomes de alelos fora do catálogo (enviados pelo cliente) usam
+    uma linha de `CrossmatchAlleleResult` por alelo. Retorna o `Crossmatch` criado.
+    """
+    pacientes = list(pacientes_compatibilidade.items())
+    with transaction.atomic():
+        crossmatch = Crossmatch.objects.create(
+            donor_id=doador.get('donor_id'),
+            donor_name=doador['donor_name'],
+            donor_sex=doador['donor_sex'],
+            donor_birth_date=doador['donor_birth_date'],
+            donor_blood_type=doador['donor_blood_type'],
+        )
+        catalogo = _ids_dos_alelos({alelo['nome'] for _, dados in pacientes for alelo in dados['alelos_correspondentes']})
+
+        resultados = []
+        legados = []
+        for paciente_id, dados in pacientes:
+            alelos = dados['alelos_correspondentes']
+            resultado = CrossmatchPatientResult(
+                crossmatch=crossmatch,
+                patient_id=paciente_id,
+                patient_name=dados['nome'],
+                total_compatible_alleles=sum(1 for alelo in alelos if alelo['compatibilidade']),
+                total_incompatible_alleles=sum(1 for alelo in alelos if not alelo['compatibilidade']),
+            )
+            if all(alelo['nome'] in catalogo for alelo in alelos):
+                resultado.alelos, resultado.valores, resultado.compatibilidades = empacotar_alelos(
+                    [catalogo[alelo['nome']] for alelo in alelos],
+                    [alelo['valor'] for alelo in alelos],
+                    [alelo['compatibilidade'] for alelo in alelos],
+                )
+            else:
+                legados.append((resultado, alelos))
+            resultados.append(resultado)
+
+        resultados = CrossmatchPatientResult.objects.bulk_create(resultados, batch_size=1000)
+        if legados and any(resultado.pk is None for resultado in resultados):
+            # Bancos sem RETURNING no INSERT em lote: os ids seguem a ordem de inserção
+            ids = CrossmatchPatientResult.objects.filter(crossmatch=crossmatch).order_by('id').values_list('id', flat=True)
+            for resultado, resultado_id in zip(resultados, ids):
+                resultado.pk = resultado_id
+
+        CrossmatchAlleleResult.objects.bulk_create([
+            CrossmatchAlleleResult(
+                patient_result=resultado,
+                allele_name=alelo['nome'],
+                allele_value=alelo['valor'],
+                compatibility=alelo['compatibilidade'],
+            )
+            for resultado, alelos in legados
+            for alelo in alelos
+        ], batch_size=2000)
+        registrar_escrita(CROSSMATCHES)
+
+    logger.info("Crossmatch %s gravado: %d pacientes, %d no formato antigo", crossmatch.id, len(resultados), len(legados))
+    return crossmatch
+
+
+def carregar_crossmatch(crossmatch_id):
+    """
+    Busca um crossmatch com os resultados dos pacientes e seus alelos já decodificados.
+    """
+    crossmatch = Crossmatch.objects.prefetch_related('patient_results').get(id=crossmatch_id)
+    anexar_alelos(list(crossmatch.patient_results.all()))
+    return crossmatch
+
+
+async def carregar_crossmatch_async(crossmatch_id):
+    """
+    Mesmo que `carregar_crossmatch`, com o ORM assíncrono.
+    """
+    crossmatch = await Crossmatch.objects.prefetch_related('patient_results').aget(id=crossmatch_id)
+    await anexar_alelos_async(list(crossmatch.patient_results.all()))
+    return crossmatch
@@ -0,0 +1,65 @@
+import logging
+
+from django.db import connections, router, transaction
+
+from .models import (
+    Paciente, Exame, ExameAlelo, ResumoPaciente, CpraPaciente,
+    Crossmatch, CrossmatchPatientResult, CrossmatchAlleleResult,
+)
+from .crossmatch import registrar_remocao
+from .versoes import PACIENTES, EXAMES, CROSSMATCHES, registrar_escrita
+
+logger = logging.getLogger(__name__)
+
+# Quantidade máxima de pacientes por requisição de exclusão em lote
+MAXIMO_LOTE = 1000
+
+
+def _apagar(queryset):
+    # DELETE direto no banco com as linhas do queryset em uma subconsulta, sem carregá-las
+    # nem percorrer a cascata do ORM (as tabelas dependentes são apagadas antes e não há
+    # sinais de exclusão registrados para esses modelos)
+    modelo = queryset.model
+    conexao = connections[router.db_for_write(modelo)]
+    subconsulta, parametros = queryset.values('pk').query.get_compiler(connection=conexao).as_sql()
+    tabela, chave = (conexao.ops.quote_name(nome) for nome in (modelo._meta.db_table, modelo._meta.pk.column))
+    with conexao.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {tabela} WHERE {chave} IN ({subconsulta})", parametros)
+        return cursor.rowcount
+
+
+def excluir_pacientes(paciente_ids):
+    """
+    Exclui os pacientes informados com seus exames, alelos de exames, resumos, cPRA e
+    resultados de crossmatch, em uma única transação e com um número fixo de comandos
+    SQL (independente da quantidade de exames e alelos). Crossmatches que ficam sem
+    nenhum paciente também são excluídos. Retorna a quantidade de linhas de cada tabela.
+    """
+    with transaction.atomic():
+        ids = list(Paciente.objects.filter(id__in=list(paciente_ids)).select_for_update().values_list('id', flat=True))
+        if not ids:
+            return {'pacientes': 0}
+
+        resultados = CrossmatchPatientResult.objects.filter(patient_id__in=ids)
+        crossmatch_ids = list(resultados.values_list('crossmatch_id', flat=True).distinct())
+
+        # Ordem das tabelas: dependentes antes das referenciadas
+        totais = {
+            'alelos_crossmatch': _apagar(CrossmatchAlleleResult.objects.filter(patient_result__patient_id__in=ids)),
+            'resultados_crossmatch': _apagar(resultados),
+            'alelos_exames': _apagar(ExameAlelo.objects.filter(exame__paciente_id__in=ids)),
+            'resumos': _apagar(ResumoPaciente.objects.filter(paciente_id__in=ids)),
+            'cpra': _apagar(CpraPaciente.objects.filter(paciente_id__in=ids)),
+            'exames': _apagar(Exame.objects.filter(paciente_id__in=ids)),
+            'pacientes': _apagar(Paciente.objects.filter(id__in=ids)),
+        }
+        totais['crossmatches'] = _apagar(
+            Crossmatch.objects.filter(id__in=crossmatch_ids)
+            .exclude(id__in=CrossmatchPatientResult.objects.values('crossmatch_id'))
+        ) if crossmatch_ids else 0
+
+        registrar_remocao(ids)
+        registrar_escrita(PACIENTES, EXAMES, CROSSMATCHES)
+
+    logger.info("Exclusão de pacientes: %s", totais)
+    return totais
@@ -0,0 +1,293 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Paciente, Exame, Alelo, ExameAlelo
+from .crossmatch import registrar_alteracao
+from .resumos import atualizar_resumos
+from .cpra import atualizar_cpra
+from .versoes import EXAMES, registrar_escrita
+from .relatorios import ErroRelatorio, ler_relatorio_bytes
+
+NOMES_MANIFESTO = ('manifesto.json', 'manifest.json')
+
+logger = logging.getLogger(__name__)
+
+
+def _consultar_catalogo(nomes, com_sufixo=()):
+    """
+    Retorna {nome: id} dos alelos informados que já existem no catálogo e, para os nomes
+    em `com_sufixo`, também das variantes com sufixo já criadas ("A*02:01.1", ...).
+    """
+    filtro = Q(nome__in=list(nomes))
+    for nome in com_sufixo:
+        filtro |= Q(nome__startswith=f"{nome}.")
+    return dict(Alelo.objects.filter(filtro).values_list('nome', 'id'))
+
+
+def _repetidos(relatorio):
+    return [nome for nome, vezes in Counter(linha.nome for linha in relatorio.linhas).items() if vezes > 1]
+
+
+def _inserir_exame(paciente, relatorio, catalogo, com_sufixo):
+    """
+    Insere o exame e seus alelos usando o catálogo já consultado. `com_sufixo` são os
+    nomes cujas variantes com sufixo já estão no catálogo; as que faltarem são consultadas aqui.
+
+    O catálogo não é alterado: os alelos criados são retornados para que quem chamou só os
+    inclua depois que a transação (ou savepoint) do exame for concluída.
+    """
+    exame, criado = Exame.objects.get_or_create(paciente=paciente, data_exame=relatorio.data_exame)
+
+    usados = set() if criado else set(
+        ExameAlelo.objects.filter(exame=exame).values_list('alelo__nome', flat=True)
+    )
+    faltantes = [nome for nome in {linha.nome for linha in relatorio.linhas} & usados if nome not in com_sufixo]
+    if faltantes:
+        catalogo.update(_consultar_catalogo((), faltantes))
+        com_sufixo.update(faltantes)
+
+    novos = {}
+    vinculos = []
+    for linha in relatorio.linhas:
+        nome = linha.nome
+        if nome in usados:
+            # Já existe uma entrada para esse alelo no exame: cria um alelo com sufixo
+            sufixo = 1
+            nome = f"{linha.nome}.{sufixo}"
+            while nome in catalogo or nome in novos:
+                sufixo += 1
+                nome = f"{linha.nome}.{sufixo}"
+        if nome not in catalogo and nome not in novos:
+            novos[nome] = Alelo(nome=nome, tipo=linha.tipo, numero1=linha.numero1, numero2=linha.numero2)
+        usados.add(nome)
+        vinculos.append((nome, linha.valor))
+
+    criados = {}
+    if novos:
+        # `nome` é único: alelos criados ao mesmo tempo por outro upload são apenas reaproveitados
+        Alelo.objects.bulk_create(novos.values(), batch_size=1000, ignore_conflicts=True)
+        criados = dict(Alelo.objects.filter(nome__in=list(novos)).values_list('nome', 'id'))
+
+    ExameAlelo.objects.bulk_create(
+        [ExameAlelo(exame=exame, alelo_id=criados.get(nome) or catalogo[nome], valor=valor) for nome, valor in vinculos],
+        batch_size=1000,
+    )
+    resultado = {
+        'exame_id': exame.id,
+        'inseridos': len(vinculos),
+        'ignorados': relatorio.ignorados,
+        'alelos_criados': len(novos),
+    }
+    return resultado, criados
+
+
+def _atualizar_pacientes(paciente_ids):
+    """
+    Recalcula resumos e cPRA dos pacientes e registra a escrita na transação atual.
+    """
+    atualizar_resumos(paciente_ids)
+    atualizar_cpra(paciente_ids)
+    registrar_alteracao(paciente_ids)
+    registrar_escrita(EXAMES)
+
+
+def gravar_exame(paciente, relatorio):
+    """
+    Grava o exame e seus alelos em uma única transação com inserções em lote.
+
+    Apenas os alelos do relatório são consultados no catálogo. Um alelo repetido no mesmo
+    exame recebe um novo `Alelo` com sufixo (".1", ".2", ...), como no fluxo original.
+    """
+    with transaction.atomic():
+        repetidos = set(_repetidos(relatorio))
+        catalogo = _consultar_catalogo({linha.nome for linha in relatorio.linhas}, repetidos)
+        resultado, _ = _inserir_exame(paciente, relatorio, catalogo, repetidos)
+        _atualizar_pacientes([paciente.id])
+
+    logger.info("Exame %s gravado: %d alelos inseridos, %d ignorados, %d alelos criados",
+                resultado['exame_id'], resultado['inseridos'], resultado['ignorados'], resultado['alelos_criados'])
+    return resultado
+
+
+def _ler_limitado(arquivo, nome, tamanho_maximo):
+    # O tamanho declarado no .zip não é confiável: lê no máximo um byte além do limite
+    conteudo = arquivo.read(tamanho_maximo + 1)
+    if len(conteudo) > tamanho_maximo:
+        raise ErroRelatorio(f"Arquivo {os.path.basename(nome)} excede o tamanho máximo permitido.")
+    return conteudo
+
+
+def preparar_lote(arquivos_enviados, manifesto=None):
+    """
+    Monta a lista de relatórios de um envio em lote.
+
+    `arquivos_enviados` pode conter planilhas e arquivos .zip; o manifesto (JSON no
+    formato {"nome_do_arquivo.xlsx": paciente_id}) vem no campo `manifesto` ou em um
+    arquivo manifesto.json dentro do .zip. Retorna [(nome, conteúdo, paciente_id)].
+    """
+    tamanho_maximo = getattr(settings, 'UPLOAD_LOTE_TAMANHO_MAXIMO', 20 * 1024 * 1024)
+    conteudos = []
+    for arquivo in arquivos_enviados:
+        if not arquivo.name.lower().endswith('.zip'):
+            conteudos.append((os.path.basename(arquivo.name), _ler_limitado(arquivo, arquivo.name, tamanho_maximo)))
+            continue
+        try:
+            with zipfile.ZipFile(arquivo) as pacote:
+                for info in pacote.infolist():
+                    nome = os.path.basename(info.filename)
+                    if info.is_dir() or info.filename.startswith('__MACOSX/') or nome.startswith('.'):
+                        continue
+                    if nome.lower() in NOMES_MANIFESTO and manifesto is None:
+                        with pacote.open(info) as entrada:
+                            manifesto = _ler_limitado(entrada, nome, tamanho_maximo)
+                    elif nome.lower() not in NOMES_MANIFESTO:
+                        with pacote.open(info) as entrada:
+                            conteudos.append((nome, _ler_limitado(entrada, nome, tamanho_maximo)))
+        except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, EOFError):
+            raise ErroRelatorio(f"Arquivo {arquivo.name} não é um .zip válido.")
+
+    if manifesto is None:
+        raise ErroRelatorio("Manifesto não enviado.")
+    try:
+        manifesto = {os.path.basename(nome): int(paciente_id) for nome, paciente_id in json.loads(manifesto).items()}
+    except (ValueError, TypeError, AttributeError):
+        raise ErroRelatorio("Manifesto inválido. Use o formato {\"arquivo.xlsx\": id_do_paciente}.")
+
+    return [(nome, conteudo, manifesto.get(nome)) for nome, conteudo in conteudos]
+
+
+_pool = {'executor': None}
+_pool_lock = threading.Lock()
+
+
+def _pool_leitura():
+    """
+    Retorna o pool de leitura do processo, criado na primeira importação em lote e
+    compartilhado pelas requisições seguintes (no máximo `UPLOAD_LOTE_PROCESSOS` processos).
+    """
+    with _pool_lock:
+        if _pool['executor'] is None:
+            # 'spawn' evita herdar conexões e locks do processo do servidor
+            _pool['executor'] = ProcessPoolExecutor(
+                max_workers=max(1, getattr(settings, 'UPLOAD_LOTE_PROCESSOS', os.cpu_count() or 1)),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool['executor']
+
+
+def _descartar_pool(executor):
+    # Um processo auxiliar morreu: o pool fica inutilizável e é recriado na próxima importação
+    with _pool_lock:
+        if _pool['executor'] is executor:
+            _pool['executor'] = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _ler_em_paralelo(arquivos):
+    """
+    Interpreta os relatórios em processos auxiliares, já que a leitura das planilhas
+    consome CPU e fica limitada pelo GIL em um único processo.
+    """
+    relatorios = [None] * len(arquivos)
+    processos = min(len(arquivos), getattr(settings, 'UPLOAD_LOTE_PROCESSOS', os.cpu_count() or 1))
+    if processos <= 1:
+        for i, (nome, conteudo) in enumerate(arquivos):
+            try:
+                relatorios[i] = ler_relatorio_bytes(nome, conteudo)
+            except Exception as e:
+                relatorios[i] = e
+        return relatorios
+
+    executor = _pool_leitura()
+    enviar = lambda executor: {executor.submit(ler_relatorio_bytes, nome, conteudo): i
+                               for i, (nome, conteudo) in enumerate(arquivos)}
+    try:
+        futuros = enviar(executor)
+    except BrokenProcessPool:
+        _descartar_pool(executor)
+        executor = _pool_leitura()
+        futuros = enviar(executor)
+    for futuro in as_completed(futuros):
+        try:
+            relatorios[futuros[futuro]] = futuro.result()
+        except BrokenProcessPool as e:
+            _descartar_pool(executor)
+            relatorios[futuros[futuro]] = e
+        except Exception as e:
+            relatorios[futuros[futuro]] = e
+    return relatorios
+
+
+def importar_lote(arquivos):
+    """
+    Importa vários relatórios recebidos como [(nome, conteúdo, paciente_id)].
+
+    A leitura é feita em paralelo e a gravação em transações com até
+    `UPLOAD_LOTE_TRANSACAO` exames; cada exame tem seu próprio savepoint, então um
+    erro não desfaz os demais. O catálogo de alelos é consultado uma vez para o lote, e
+    resumos, cPRA e versões são atualizados uma vez por transação. Retorna o resultado de cada arquivo na ordem recebida.
+    """
+    resultados = [{'arquivo': nome, 'paciente_id': paciente_id} for nome, _, paciente_id in arquivos]
+    pacientes = Paciente.objects.in_bulk([paciente_id for _, _, paciente_id in arquivos if paciente_id is not None])
+
+    validos = []
+    for i, (nome, conteudo, paciente_id) in enumerate(arquivos):
+        if paciente_id is None:
+            resultados[i].update(status='erro', erro="Arquivo sem paciente no manifesto.")
+        elif paciente_id not in pacientes:
+            resultados[i].update(status='erro', erro="Paciente não encontrado.")
+        else:
+            validos.append(i)
+
+    relatorios = _ler_em_paralelo([arquivos[i][:2] for i in validos])
+    pendentes = []
+    for i, relatorio in zip(validos, relatorios):
+        if isinstance(relatorio, ErroRelatorio):
+            resultados[i].update(status='erro', erro=str(relatorio))
+        elif isinstance(relatorio, Exception):
+            resultados[i].update(status='erro', erro=f"Erro ao processar o arquivo Excel: {str(relatorio)}")
+        else:
+            pendentes.append((i, relatorio))
+
+    # O catálogo é consultado uma vez para todo o lote
+    repetidos = {nome for _, relatorio in pendentes for nome in _repetidos(relatorio)}
+    catalogo = _consultar_catalogo({linha.nome for _, relatorio in pendentes for linha in relatorio.linhas}, repetidos)
+
+    tamanho = getattr(settings, 'UPLOAD_LOTE_TRANSACAO', 20)
+    for inicio in range(0, len(pendentes), tamanho):
+        gravados = []
+        try:
+            with transaction.atomic():
+                for i, relatorio in pendentes[inicio:inicio + tamanho]:
+                    try:
+                        with transaction.atomic():
+                            resultado, criados = _inserir_exame(pacientes[arquivos[i][2]], relatorio, catalogo, repetidos)
+                    except Exception as e:
+                        logger.error("Erro ao gravar o exame do arquivo %s: %s", arquivos[i][0], e)
+                        resultados[i].update(status='erro', erro=f"Erro ao processar o exame: {str(e)}")
+                        continue
+                    catalogo.update(criados)
+                    resultados[i].update(status='ok', **resultado)
+                    gravados.append(i)
+                if gravados:
+                    # Resumos, cPRA e versões uma vez por transação, para todos os pacientes dela
+                    _atualizar_pacientes(list(dict.fromkeys(arquivos[i][2] for i in gravados)))
+        except Exception as e:
+            # A transação inteira foi desfeita: nenhum exame dela foi gravado
+            logger.error("Erro ao atualizar os pacientes do lote: %s", e)
+            for i in gravados:
+                resultados[i] = {'arquivo': arquivos[i][0], 'paciente_id': arquivos[i][2], 'status': 'erro',
+                                 'erro': f"Erro ao processar o exame: {str(e)}"}
+            catalogo = _consultar_catalogo(catalogo, repetidos)
+    return resultados
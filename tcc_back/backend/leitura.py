@@ -0,0 +1,114 @@
+import json
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from .metricas import medir
+
+try:
+    import orjson
+except ImportError:  # Dependência opcional: sem ela, usa o módulo json da biblioteca padrão
+    orjson = None
+
+# Caminho rápido das views de leitura: as linhas são montadas com `.values()` (sem instanciar
+# modelos nem passar pelos serializers do DRF) e codificadas com o orjson. Cada função produz
+# exatamente os mesmos campos e formatos do serializer equivalente.
+
+
+def codificar_json(dados):
+    """
+    Codifica em JSON (UTF-8) com o orjson, se instalado, ou com o json da biblioteca padrão.
+    """
+    with medir('renderizacao'):
+        if orjson is not None:
+            return orjson.dumps(dados, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(dados, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def resposta_json(dados, status=200):
+    return HttpResponse(codificar_json(dados), status=status, content_type='application/json')
+
+
+def _data(valor):
+    # Mesmo formato do DateField do DRF
+    return valor.isoformat() if isinstance(valor, date) else valor
+
+
+CAMPOS_PACIENTE = ['id', 'nome', 'data_nascimento', 'tipo_sanguineo']
+CAMPOS_RESUMO = ['resumo__atualizado_em', 'resumo__ultimo_exame_id', 'resumo__data_exame',
+                 'resumo__mfi_maximo', 'resumo__positivos', 'resumo__total_positivos']
+
+
+def valores_pacientes(pacientes, sensibilizacao=False):
+    """
+    Queryset de dicionários com os campos usados por `linhas_pacientes` (pode ser paginado).
+    """
+    return pacientes.values(*CAMPOS_PACIENTE, *(CAMPOS_RESUMO if sensibilizacao else []))
+
+
+def linhas_pacientes(valores, sensibilizacao=False):
+    """
+    Equivalente a `PacienteSerializer` (ou `PacienteSensibilizacaoSerializer`).
+    """
+    linhas = []
+    for paciente in valores:
+        linha = {
+            'id': paciente['id'],
+            'nome': paciente['nome'],
+            'data_nascimento': _data(paciente['data_nascimento']),
+            'tipo_sanguineo': paciente['tipo_sanguineo'],
+        }
+        if sensibilizacao:
+            # Pacientes sem resumo vêm do LEFT JOIN com todos os campos nulos
+            linha['sensibilizacao'] = None if paciente['resumo__atualizado_em'] is None else {
+                'ultimo_exame_id': paciente['resumo__ultimo_exame_id'],
+                'data_exame': _data(paciente['resumo__data_exame']),
+                'mfi_maximo': paciente['resumo__mfi_maximo'],
+                'positivos': paciente['resumo__positivos'],
+                'total_positivos': paciente['resumo__total_positivos'],
+            }
+        linhas.append(linha)
+    return linhas
+
+
+CAMPOS_EXAME = ['id', 'paciente_id', 'data_exame']
+CAMPOS_EXAME_ALELO = ['id', 'alelo_id', 'alelo__nome', 'alelo__numero1', 'alelo__numero2', 'alelo__tipo', 'valor']
+
+
+def _linha_exame(valores):
+    exame_id, paciente_id, data_exame = valores
+    return {'id': exame_id, 'paciente_id': paciente_id, 'data_exame': _data(data_exame)}
+
+
+def _linha_exame_alelo(valores):
+    exame_alelo_id, alelo_id, nome, numero1, numero2, tipo, valor = valores
+    return {
+        'id': exame_alelo_id,
+        'alelo': {'id': alelo_id, 'nome': nome, 'numero1': numero1, 'numero2': numero2, 'tipo': tipo},
+        'valor': valor,
+    }
+
+
+def linhas_exames(exames):
+    """
+    Equivalente a `ExameSerializer`.
+    """
+    return [_linha_exame(valores) for valores in exames.values_list(*CAMPOS_EXAME)]
+
+
+def linhas_exames_alelos(exames_alelos):
+    """
+    Equivalente a `ExameAleloSerializer` (com o `AleloSerializer` aninhado), em uma única consulta.
+    """
+    return [_linha_exame_alelo(valores) for valores in exames_alelos.values_list(*CAMPOS_EXAME_ALELO)]
+
+
+# Versões com o ORM assíncrono (views_async)
+
+async def linhas_exames_async(exames):
+    return [_linha_exame(valores) async for valores in exames.values_list(*CAMPOS_EXAME)]
+
+
+async def linhas_exames_alelos_async(exames_alelos):
+    return [_linha_exame_alelo(valores) async for valores in exames_alelos.values_list(*CAMPOS_EXAME_ALELO)]
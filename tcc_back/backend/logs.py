@@ -0,0 +1,165 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Registro de logs fora do caminho da requisição: as views apenas enfileiram os registros
+# e uma thread por processo os escreve no console e no arquivo. Os níveis e a amostragem
+# por logger são configurados em `settings.LOGGING` (ver LOG_NIVEIS e LOG_AMOSTRAGEM).
+
+# Atributos padrão de um LogRecord; os demais vêm de `extra=` e são os campos estruturados
+ATRIBUTOS_PADRAO = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def ler_mapa(texto, conversao=str):
+    """
+    Interpreta configurações no formato "logger=valor,outro.logger=valor".
+    """
+    mapa = {}
+    for item in (texto or '').split(','):
+        if '=' in item:
+            nome, valor = item.split('=', 1)
+            mapa[nome.strip()] = conversao(valor.strip())
+    return mapa
+
+
+def campos_extras(record):
+    return {chave: valor for chave, valor in vars(record).items() if chave not in ATRIBUTOS_PADRAO}
+
+
+class FormatadorTexto(logging.Formatter):
+    """
+    Formato de texto com os campos estruturados (`extra=`) no fim da linha, como chave=valor.
+    """
+
+    def format(self, record):
+        linha = super().format(record)
+        extras = campos_extras(record)
+        if extras:
+            linha += ' ' + ' '.join(f"{chave}={valor}" for chave, valor in extras.items())
+        return linha
+
+
+class FormatadorJSON(logging.Formatter):
+    """
+    Uma linha JSON por registro, com os campos estruturados no mesmo objeto.
+    """
+
+    def format(self, record):
+        dados = {
+            'momento': self.formatTime(record),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensagem': record.getMessage(),
+            **campos_extras(record),
+        }
+        if record.exc_info:
+            dados['excecao'] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FiltroAmostragem(logging.Filter):
+    """
+    Mantém apenas uma fração dos registros abaixo de WARNING dos loggers configurados
+    (ex.: {"backend.views": 0.1} ou "backend.views=0.1"). O prefixo mais específico vale; avisos e erros
+    nunca são descartados.
+    """
+
+    def __init__(self, taxas=None):
+        super().__init__()
+        if isinstance(taxas, str):
+            taxas = ler_mapa(taxas, float)
+        self.taxas = sorted((taxas or {}).items(), key=lambda item: -len(item[0]))
+
+    def _taxa(self, nome):
+        for prefixo, taxa in self.taxas:
+            if nome == prefixo or nome.startswith(prefixo + '.'):
+                return taxa
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        taxa = self._taxa(record.name)
+        return taxa >= 1 or random.random() < taxa
+
+
+class ManipuladorFila(QueueHandler):
+    """
+    Enfileira os registros (sem bloquear a requisição) para uma thread que os escreve
+    no console e, se informado, em `arquivo`. Com a fila cheia, os registros abaixo de
+    WARNING são descartados; avisos e erros esperam no máximo `espera_aviso` segundos por
+    espaço. Os registros descartados são contados em `descartados`.
+    """
+
+    def __init__(self, arquivo=None, tamanho_fila=10000, formato='texto', espera_aviso=0.1):
+        super().__init__(queue.Queue(tamanho_fila))
+        self.tamanho_fila = tamanho_fila
+        self.arquivo = arquivo
+        self.formato = formato
+        self.espera_aviso = espera_aviso
+        self.descartados = 0
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._lock_descartados = threading.Lock()
+
+    def _destinos(self):
+        destinos = [logging.StreamHandler(sys.stderr)]
+        if self.arquivo:
+            destinos.append(logging.FileHandler(self.arquivo, encoding='utf-8'))
+        formatador = FormatadorJSON() if self.formato == 'json' else FormatadorTexto(
+            '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+        )
+        for destino in destinos:
+            destino.setFormatter(formatador)
+        return destinos
+
+    def _iniciar(self):
+        # A thread é criada no primeiro registro de cada processo (workers criados por fork
+        # não herdam threads do processo pai)
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                self.queue = queue.Queue(self.tamanho_fila)
+            self._listener = QueueListener(self.queue, *self._destinos())
+            self._listener.start()
+            self._pid = os.getpid()
+            atexit.register(self.parar)
+
+    def parar(self):
+        """
+        Escreve os registros pendentes e encerra a thread.
+        """
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                for destino in self._listener.handlers:
+                    destino.close()
+            self._listener = self._pid = None
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=self.espera_aviso)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            # A thread de escrita não acompanha (disco lento, console bloqueado): a requisição não espera
+            with self._lock_descartados:
+                self.descartados += 1
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._iniciar()
+        super().emit(record)
+
+    def close(self):
+        self.parar()
+        super().close()
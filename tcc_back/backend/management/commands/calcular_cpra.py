@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.cpra import ErroPainel, calcular_cpra
+
+
+class Command(BaseCommand):
+    help = "Calcula o cPRA de toda a lista de espera (ou dos pacientes informados) com o painel de `CPRA_PAINEL`."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paciente', type=int, action='append', dest='pacientes', help="Id do paciente (pode ser repetido).")
+
+    def handle(self, *args, **options):
+        try:
+            total = calcular_cpra(options['pacientes'])
+        except ErroPainel as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"cPRA calculado para {total} pacientes."))
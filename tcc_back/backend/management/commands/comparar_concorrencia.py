@@ -0,0 +1,162 @@
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend.models import Paciente, Exame, Crossmatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara sob ASGI (uvicorn) as views de leitura do DRF com as de views_async, com centenas "
+        "de clientes simultâneos, e mostra a vazão e a latência de cada nível de concorrência."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', default='50,200,500', help="Níveis de concorrência, separados por vírgula.")
+        parser.add_argument('--requisicoes', type=int, default=2000, help="Requisições medidas em cada nível.")
+        parser.add_argument('--workers', type=int, default=1, help="Processos do uvicorn.")
+        parser.add_argument('--porta', type=int, default=8775)
+        parser.add_argument('--usuario', help="Envia um token JWT deste usuário em todas as requisições.")
+        parser.add_argument('--semente', type=int, default=1)
+
+    def caminhos(self, quantidade, semente):
+        # Mistura das leituras migradas para views_async
+        aleatorio = random.Random(semente)
+        exames = list(Exame.objects.values_list('id', 'paciente_id')[:500])
+        crossmatches = list(Crossmatch.objects.values_list('id', flat=True)[:100])
+        if not exames:
+            raise CommandError("O banco não tem exames; gere dados antes de comparar (python manage.py gerar_dataset).")
+        pacientes = list(Paciente.objects.values_list('id', flat=True)[:500])
+        geradores = [
+            lambda: '/api/pacientes/?limite=50',
+            lambda: f'/api/pacientes/{aleatorio.choice(pacientes)}/',
+            lambda: f'/api/pacientes/{aleatorio.choice(pacientes)}/exames/',
+            lambda: '/api/pacientes/{1}/exames/{0}/alelos/'.format(*aleatorio.choice(exames)),
+            lambda: f'/api/exames/{aleatorio.choice(exames)[0]}/',
+        ]
+        if crossmatches:
+            geradores += [
+                lambda: '/api/vxm-history/?resumo=1&limite=5',
+                lambda: f'/api/vxm-details/{aleatorio.choice(crossmatches)}/',
+            ]
+        return [aleatorio.choice(geradores)() for _ in range(quantidade)]
+
+    async def cliente(self, porta, fila, cabecalhos, resultados):
+        # Cliente HTTP/1.1 mínimo com conexão persistente (keep-alive)
+        leitor = escritor = None
+        while True:
+            try:
+                caminho = fila.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            inicio = time.perf_counter()
+            try:
+                if escritor is None:
+                    leitor, escritor = await asyncio.open_connection('127.0.0.1', porta)
+                escritor.write(f"GET {caminho} HTTP/1.1\r\nHost: 127.0.0.1\r\n{cabecalhos}\r\n".encode())
+                await escritor.drain()
+                cabecalho = (await leitor.readuntil(b'\r\n\r\n')).decode('latin-1')
+                linhas = cabecalho.split('\r\n')
+                campos = dict(linha.split(': ', 1) for linha in linhas[1:] if ': ' in linha)
+                tamanho = int(next((valor for nome, valor in campos.items() if nome.lower() == 'content-length'), 0))
+                await leitor.readexactly(tamanho)
+                ok = linhas[0].split(' ')[1] == '200'
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                ok = False
+                if escritor is not None:
+                    escritor.close()
+                leitor = escritor = None
+            resultados.append((time.perf_counter() - inicio, ok))
+        if escritor is not None:
+            escritor.close()
+
+    async def carga(self, porta, caminhos, clientes, cabecalhos):
+        fila = asyncio.Queue()
+        for caminho in caminhos:
+            fila.put_nowait(caminho)
+        resultados = []
+        inicio = time.perf_counter()
+        await asyncio.gather(*(self.cliente(porta, fila, cabecalhos, resultados) for _ in range(clientes)))
+        return resultados, time.perf_counter() - inicio
+
+    def aguardar(self, processo, porta, limite=120):
+        inicio = time.perf_counter()
+        while time.perf_counter() - inicio < limite:
+            if processo.poll() is not None:
+                raise CommandError(f"O uvicorn terminou ao iniciar (código {processo.returncode}).")
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{porta}/metrics', timeout=5):
+                    return
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.05)
+        raise CommandError(f"O uvicorn não respondeu em {limite} s.")
+
+    def medir(self, assincronas, porta, workers, niveis, caminhos, cabecalhos):
+        comando = [sys.executable, '-m', 'uvicorn', 'tcc_back.asgi:application', '--host', '127.0.0.1',
+                   '--port', str(porta), '--workers', str(workers), '--no-access-log', '--log-level', 'warning']
+        ambiente = {**os.environ, 'VIEWS_ASSINCRONAS': str(assincronas), 'LOG_NIVEL': 'WARNING'}
+        processo = subprocess.Popen(comando, cwd=settings.BASE_DIR, env=ambiente,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        medicoes = {}
+        try:
+            self.aguardar(processo, porta)
+            asyncio.run(self.carga(porta, caminhos[:50], 10, cabecalhos))  # Aquecimento
+            for clientes in niveis:
+                resultados, total = asyncio.run(self.carga(porta, caminhos, clientes, cabecalhos))
+                duracoes = sorted(duracao for duracao, _ in resultados)
+                medicoes[clientes] = {
+                    'vazao': len(resultados) / total,
+                    'mediana': statistics.median(duracoes),
+                    'p95': duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.95))],
+                    'erros': sum(1 for _, ok in resultados if not ok),
+                }
+        finally:
+            processo.terminate()
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+        return medicoes
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError("O uvicorn não está instalado (pip install -r requirements.txt).")
+        niveis = [int(nivel) for nivel in options['clientes'].split(',')]
+        caminhos = self.caminhos(options['requisicoes'], options['semente'])
+        cabecalhos = ''
+        if options['usuario']:
+            try:
+                usuario = User.objects.get(username=options['usuario'])
+            except User.DoesNotExist:
+                raise CommandError(f"Usuário '{options['usuario']}' não encontrado.")
+            cabecalhos = f"Authorization: Bearer {AccessToken.for_user(usuario)}\r\n"
+
+        resultados = {}
+        for nome, assincronas in (('drf', False), ('async', True)):
+            self.stdout.write(f"Medindo views {nome}...")
+            resultados[nome] = self.medir(assincronas, options['porta'], options['workers'], niveis, caminhos, cabecalhos)
+
+        self.stdout.write(f"{'views':6} {'clientes':>8} {'req/s':>8} {'mediana (ms)':>13} {'p95 (ms)':>10} {'erros':>6}")
+        for nome, medicoes in resultados.items():
+            for clientes, r in medicoes.items():
+                self.stdout.write(
+                    f"{nome:6} {clientes:8d} {r['vazao']:8.1f} {r['mediana'] * 1000:13.1f} "
+                    f"{r['p95'] * 1000:10.1f} {r['erros']:6d}"
+                )
+        for clientes in niveis:
+            drf, assincronas = resultados['drf'][clientes], resultados['async'][clientes]
+            self.stdout.write(f"{clientes} clientes: vazão {assincronas['vazao'] / drf['vazao']:.2f}x")
@@ -0,0 +1,107 @@
+import copy
+import json
+import logging
+import logging.config
+import os
+import statistics
+import tempfile
+import time
+from contextlib import redirect_stderr
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+
+from backend.crossmatch import cache_resultados
+from backend.models import Paciente, ExameAlelo
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a latência do virtual crossmatch com o registro de logs anterior (FileHandler "
+        "síncrono em DEBUG, payload e resultado completos no log) e com o atual (fila, INFO, resumo)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=30, help="Requisições medidas em cada configuração.")
+        parser.add_argument('--alelos', type=int, default=12, help="Alelos do doador (os mais frequentes nos exames).")
+
+    def configuracao_anterior(self, pasta):
+        # Configuração anterior: tudo em DEBUG, escrito no console e no arquivo durante a requisição
+        return {
+            'version': 1,
+            'disable_existing_loggers': False,
+            'handlers': {
+                'console': {'level': 'DEBUG', 'class': 'logging.StreamHandler'},
+                'file': {'level': 'DEBUG', 'class': 'logging.FileHandler', 'filename': os.path.join(pasta, 'anterior.log')},
+            },
+            'loggers': {'': {'handlers': ['console', 'file'], 'level': 'DEBUG', 'propagate': True}},
+        }
+
+    def configuracao_atual(self, pasta):
+        configuracao = copy.deepcopy(settings.LOGGING)
+        for manipulador in configuracao['handlers'].values():
+            if 'arquivo' in manipulador:
+                manipulador['arquivo'] = os.path.join(pasta, 'atual.log')
+        return configuracao
+
+    def medir(self, cliente, corpo, repeticoes, registros_anteriores):
+        logger = logging.getLogger('backend.views')
+        duracoes = []
+        for _ in range(repeticoes):
+            # Sem o cache de resultados, cada requisição executa o crossmatch completo
+            cache_resultados.limpar()
+            inicio = time.perf_counter()
+            resposta = cliente.post('/api/newvxm/virtual_crossmatch/', corpo, content_type='application/json')
+            duracao = time.perf_counter() - inicio
+            if resposta.status_code != 200:
+                raise CommandError(f"O virtual crossmatch respondeu {resposta.status_code}: {resposta.content[:200]!r}")
+            if registros_anteriores:
+                # Registros que a view fazia antes: payload e resultado completos em INFO. O resultado
+                # é reconstruído fora da medição; só a formatação e a escrita entram no tempo.
+                pacientes_compatibilidade = json.loads(resposta.content)
+                inicio = time.perf_counter()
+                logger.info(f"Payload recebido: {json.dumps(corpo)}")
+                logger.info(f"Tipo sanguíneo do doador: {corpo['donor_blood_type']}")
+                logger.info(f"Compatibilidade dos pacientes: {pacientes_compatibilidade}")
+                duracao += time.perf_counter() - inicio
+            duracoes.append(duracao)
+        duracoes.sort()
+        return statistics.median(duracoes), duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.95))]
+
+    def handle(self, *args, **options):
+        alelos = list(
+            ExameAlelo.objects.values('alelo__tipo', 'alelo__numero1')
+            .annotate(total=Count('id')).order_by('-total')[:options['alelos']]
+        )
+        tipo_sanguineo = (
+            Paciente.objects.values('tipo_sanguineo').annotate(total=Count('id')).order_by('-total')
+            .values_list('tipo_sanguineo', flat=True).first()
+        )
+        if not alelos or tipo_sanguineo is None:
+            raise CommandError("O banco não tem exames; gere dados antes de comparar.")
+        corpo = {
+            'donor_blood_type': tipo_sanguineo,
+            'alelos': [{'tipo': alelo['alelo__tipo'], 'numero': alelo['alelo__numero1']} for alelo in alelos],
+        }
+
+        cliente = Client()
+        resultados = {}
+        with tempfile.TemporaryDirectory() as pasta, open(os.devnull, 'w') as nulo, redirect_stderr(nulo):
+            try:
+                for nome, configuracao, registros_anteriores in (
+                    ('anterior', self.configuracao_anterior(pasta), True),
+                    ('atual', self.configuracao_atual(pasta), False),
+                ):
+                    logging.config.dictConfig(configuracao)
+                    self.medir(cliente, corpo, 3, registros_anteriores)  # Aquecimento (matriz MFI, conexões)
+                    resultados[nome] = self.medir(cliente, corpo, options['repeticoes'], registros_anteriores)
+            finally:
+                logging.config.dictConfig(settings.LOGGING)
+
+        self.stdout.write(f"{'configuração':14} {'mediana (ms)':>13} {'p95 (ms)':>10}")
+        for nome, (mediana, p95) in resultados.items():
+            self.stdout.write(f"{nome:14} {mediana * 1000:13.2f} {p95 * 1000:10.2f}")
+        anterior, atual = resultados['anterior'][0], resultados['atual'][0]
+        self.stdout.write(f"Economia na mediana: {(anterior - atual) * 1000:.2f} ms ({(1 - atual / anterior) * 100:.0f}%)")
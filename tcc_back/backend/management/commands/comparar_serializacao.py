@@ -0,0 +1,66 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.http import JsonResponse
+from django.test.utils import CaptureQueriesContext
+
+from backend.leitura import codificar_json, valores_pacientes, linhas_pacientes, linhas_exames, linhas_exames_alelos
+from backend.models import Paciente, Exame, ExameAlelo
+from backend.serializers import (
+    PacienteSerializer, PacienteSensibilizacaoSerializer, ExameSerializer, ExameAleloSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = "Compara o caminho rápido das views de leitura (.values() + orjson) com os serializers do DRF."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=5, help="Execuções de cada caminho (vale a menor).")
+        parser.add_argument('--limite', type=int, default=500, help="Pacientes na página da lista de pacientes.")
+
+    def medir(self, funcao, repeticoes):
+        melhor = None
+        for _ in range(repeticoes):
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                conteudo = funcao()
+                duracao = time.perf_counter() - inicio
+            melhor = duracao if melhor is None else min(melhor, duracao)
+        return melhor, len(consultas), conteudo
+
+    def handle(self, *args, **options):
+        exame = Exame.objects.annotate(total=Count('exames_alelos')).order_by('-total').first()
+        if exame is None:
+            raise CommandError("O banco não tem exames; gere dados antes de comparar.")
+        pacientes = Paciente.objects.order_by('nome', 'id')[:options['limite']]
+        pacientes_resumo = Paciente.objects.select_related('resumo').order_by('nome', 'id')[:options['limite']]
+        exames_alelos = ExameAlelo.objects.filter(exame_id=exame.id).order_by('alelo__nome')
+        exames = Exame.objects.all().order_by('-data_exame')
+
+        def drf(serializer, queryset):
+            return lambda: JsonResponse(serializer(queryset.all(), many=True).data, safe=False,
+                                        json_dumps_params={'ensure_ascii': False}).content
+
+        casos = [
+            ('lista de pacientes', drf(PacienteSerializer, pacientes),
+             lambda: codificar_json(linhas_pacientes(valores_pacientes(pacientes)))),
+            ('pacientes com sensibilização', drf(PacienteSensibilizacaoSerializer, pacientes_resumo),
+             lambda: codificar_json(linhas_pacientes(valores_pacientes(pacientes, True), True))),
+            ('exames (todos)', drf(ExameSerializer, exames),
+             lambda: codificar_json(linhas_exames(exames))),
+            (f'alelos do exame {exame.id}', drf(ExameAleloSerializer, exames_alelos),
+             lambda: codificar_json(linhas_exames_alelos(exames_alelos))),
+        ]
+
+        self.stdout.write(f"{'caso':32} {'DRF (ms)':>10} {'consultas':>10} {'rápido (ms)':>12} {'consultas':>10} {'ganho':>7}  iguais")
+        for nome, atual, rapido in casos:
+            tempo_atual, consultas_atual, conteudo_atual = self.medir(atual, options['repeticoes'])
+            tempo_rapido, consultas_rapido, conteudo_rapido = self.medir(rapido, options['repeticoes'])
+            iguais = json.loads(conteudo_atual) == json.loads(conteudo_rapido)
+            self.stdout.write(
+                f"{nome:32} {tempo_atual * 1000:10.2f} {consultas_atual:10d} {tempo_rapido * 1000:12.2f} "
+                f"{consultas_rapido:10d} {tempo_atual / max(tempo_rapido, 1e-9):6.1f}x  {'sim' if iguais else 'NÃO'}"
+            )
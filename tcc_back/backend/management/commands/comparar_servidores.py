@@ -0,0 +1,157 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from backend.models import Paciente, ExameAlelo
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara sob carga local o servidor anterior (runserver, uma conexão nova por requisição, "
+        "sem aquecimento) com o de produção (gunicorn.conf.py: workers pré-carregados e aquecidos, "
+        "conexões persistentes ou em pool)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=16, help="Clientes simultâneos.")
+        parser.add_argument('--requisicoes', type=int, default=400, help="Requisições medidas em cada servidor.")
+        parser.add_argument('--workers', type=int, help="Workers do gunicorn (padrão: o do gunicorn.conf.py).")
+        parser.add_argument('--porta', type=int, default=8765, help="Porta do primeiro servidor (o segundo usa a seguinte).")
+        parser.add_argument('--doadores', type=int, default=20, help="Doadores distintos no virtual crossmatch.")
+        parser.add_argument('--semente', type=int, default=1)
+
+    def servidores(self, porta, workers):
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        producao = {'GUNICORN_BIND': f'127.0.0.1:{porta + 1}', 'GUNICORN_ACCESSLOG': ''}
+        if workers:
+            producao['WEB_CONCURRENCY'] = str(workers)
+        return [
+            ('anterior', porta, [sys.executable, manage, 'runserver', '--noreload', f'127.0.0.1:{porta}'],
+             {'DB_POOL': 'False', 'DB_CONN_MAX_AGE': '0', 'AQUECER_CACHES': 'False'}),
+            ('producao', porta + 1, [sys.executable, '-m', 'gunicorn', '-c', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')],
+             producao),
+        ]
+
+    def requisicoes(self, quantidade, doadores, semente):
+        # Mistura de leituras e de virtual crossmatches com doadores variados
+        aleatorio = random.Random(semente)
+        leituras = ['/api/pacientes/?limite=50', '/api/vxm-history/?limite=50', '/api/cpra/', '/api/exames/']
+        lista = []
+        for i in range(quantidade):
+            if i % 2:
+                lista.append(('GET', aleatorio.choice(leituras), None))
+            else:
+                lista.append(('POST', '/api/newvxm/virtual_crossmatch/', aleatorio.choice(doadores)))
+        return lista
+
+    def doadores(self, quantidade, semente):
+        frequentes = list(
+            ExameAlelo.objects.values('alelo__tipo', 'alelo__numero1')
+            .annotate(total=Count('id')).order_by('-total')[:60]
+        )
+        tipos = list(Paciente.objects.values_list('tipo_sanguineo', flat=True).distinct())
+        if not frequentes or not tipos:
+            raise CommandError("O banco não tem exames; gere dados antes de comparar (python manage.py gerar_dataset).")
+        aleatorio = random.Random(semente)
+        return [
+            json.dumps({
+                'donor_blood_type': aleatorio.choice(tipos),
+                'alelos': [
+                    {'tipo': alelo['alelo__tipo'], 'numero': alelo['alelo__numero1']}
+                    for alelo in aleatorio.sample(frequentes, min(12, len(frequentes)))
+                ],
+            }).encode('utf-8')
+            for _ in range(quantidade)
+        ]
+
+    def enviar(self, base, requisicao):
+        metodo, caminho, corpo = requisicao
+        pedido = urllib.request.Request(base + caminho, data=corpo, method=metodo,
+                                        headers={'Content-Type': 'application/json'})
+        inicio = time.perf_counter()
+        try:
+            with urllib.request.urlopen(pedido, timeout=120) as resposta:
+                resposta.read()
+                ok = resposta.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - inicio, ok
+
+    def aguardar(self, processo, base, limite=120):
+        inicio = time.perf_counter()
+        while time.perf_counter() - inicio < limite:
+            if processo.poll() is not None:
+                raise CommandError(f"O servidor terminou ao iniciar (código {processo.returncode}).")
+            try:
+                with urllib.request.urlopen(base + '/metrics', timeout=5):
+                    return time.perf_counter() - inicio
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.05)
+        raise CommandError(f"O servidor não respondeu em {limite} s.")
+
+    def medir(self, comando, ambiente, base, requisicoes, clientes, primeira):
+        processo = subprocess.Popen(
+            comando, cwd=settings.BASE_DIR, env={**os.environ, **ambiente},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            inicializacao = self.aguardar(processo, base)
+            # Primeira requisição de cálculo: sem aquecimento, inclui a carga da matriz MFI
+            duracao_primeira, _ = self.enviar(base, primeira)
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(clientes) as executor:
+                resultados = list(executor.map(lambda requisicao: self.enviar(base, requisicao), requisicoes))
+            total = time.perf_counter() - inicio
+        finally:
+            processo.terminate()
+            try:
+                processo.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+        duracoes = sorted(duracao for duracao, _ in resultados)
+        return {
+            'inicializacao': inicializacao,
+            'primeira': duracao_primeira,
+            'vazao': len(resultados) / total,
+            'mediana': statistics.median(duracoes),
+            'p95': duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.95))],
+            'erros': sum(1 for _, ok in resultados if not ok),
+        }
+
+    def handle(self, *args, **options):
+        doadores = self.doadores(options['doadores'], options['semente'])
+        requisicoes = self.requisicoes(options['requisicoes'], doadores, options['semente'])
+        primeira = ('POST', '/api/newvxm/virtual_crossmatch/', doadores[0])
+
+        resultados = {}
+        for nome, porta, comando, ambiente in self.servidores(options['porta'], options['workers']):
+            self.stdout.write(f"Medindo {nome}...")
+            resultados[nome] = self.medir(comando, ambiente, f'http://127.0.0.1:{porta}', requisicoes,
+                                          options['clientes'], primeira)
+
+        self.stdout.write(
+            f"{'servidor':10} {'início (s)':>10} {'1ª req (ms)':>12} {'req/s':>8} "
+            f"{'mediana (ms)':>13} {'p95 (ms)':>10} {'erros':>6}"
+        )
+        for nome, r in resultados.items():
+            self.stdout.write(
+                f"{nome:10} {r['inicializacao']:10.2f} {r['primeira'] * 1000:12.1f} {r['vazao']:8.1f} "
+                f"{r['mediana'] * 1000:13.1f} {r['p95'] * 1000:10.1f} {r['erros']:6d}"
+            )
+        anterior, producao = resultados['anterior'], resultados['producao']
+        self.stdout.write(
+            f"Vazão {producao['vazao'] / anterior['vazao']:.1f}x; p95 {anterior['p95'] * 1000:.0f} -> "
+            f"{producao['p95'] * 1000:.0f} ms"
+        )
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.models import Paciente
+from backend.sinteticos import (
+    PACIENTES_POR_ESCALA, CROSSMATCHES_POR_ESCALA, Carregador, gerar_dataset, limpar_dados,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        f"Gera uma base sintética de centro transplantador: {PACIENTES_POR_ESCALA} pacientes e "
+        f"{CROSSMATCHES_POR_ESCALA} crossmatches por unidade de escala, com o painel completo em cada exame."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--semente', type=int, default=42, help="Semente do gerador (mesma semente, mesmos dados).")
+        parser.add_argument('--escala', type=float, default=1.0, help="Fator de escala do volume gerado.")
+        parser.add_argument('--lote', type=int, default=1000, help="Pacientes gravados por transação.")
+        parser.add_argument('--limpar', action='store_true', help="Apaga pacientes, exames e crossmatches existentes antes de gerar.")
+        parser.add_argument('--sem-copy', action='store_true', help="Usa INSERT em lote mesmo no PostgreSQL.")
+
+    def handle(self, *args, **options):
+        if options['escala'] <= 0 or options['lote'] <= 0:
+            raise CommandError("--escala e --lote devem ser positivos.")
+        if options['limpar']:
+            limpar_dados()
+        elif Paciente.objects.exists():
+            self.stdout.write(self.style.WARNING("O banco já tem pacientes: os dados gerados serão acrescentados."))
+
+        carregador = Carregador(usar_copy=False if options['sem_copy'] else None)
+        self.stdout.write(f"Carregando com {'COPY' if carregador.usar_copy else 'INSERT em lote'}")
+        inicio = time.perf_counter()
+        linhas = gerar_dataset(options['semente'], options['escala'], options['lote'], carregador, self.stdout.write)
+        duracao = time.perf_counter() - inicio
+
+        for tabela, quantidade in linhas.items():
+            self.stdout.write(f"  {tabela:28} {quantidade:>12,}")
+        total = sum(linhas.values())
+        self.stdout.write(self.style.SUCCESS(f"{total:,} linhas em {duracao:.1f} s ({total / duracao:,.0f} linhas/s)."))
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from backend.tarefas import reservar_proxima, executar_tarefa
+
+
+class Command(BaseCommand):
+    help = "Processa a fila de tarefas assíncronas (uploads de exames e crossmatches)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concorrencia', type=int, default=1, help="Tarefas executadas em paralelo por este worker.")
+        parser.add_argument('--intervalo', type=float, default=2.0, help="Segundos de espera quando a fila está vazia.")
+        parser.add_argument('--uma-vez', action='store_true', help="Processa as tarefas disponíveis e encerra.")
+
+    def handle(self, *args, **options):
+        parar = threading.Event()
+
+        def trabalhar():
+            while not parar.is_set():
+                close_old_connections()
+                try:
+                    tarefa = reservar_proxima()
+                except DatabaseError as e:
+                    self.stderr.write(f"Erro ao reservar tarefa: {e}")
+                    parar.wait(options['intervalo'])
+                    continue
+                if tarefa is None:
+                    if options['uma_vez']:
+                        break
+                    parar.wait(options['intervalo'])
+                    continue
+                tarefa = executar_tarefa(tarefa)
+                self.stdout.write(f"Tarefa {tarefa.id} ({tarefa.tipo}): {tarefa.status}")
+
+        threads = [threading.Thread(target=trabalhar) for _ in range(max(options['concorrencia'], 1))]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            self.stdout.write("Encerrando após as tarefas em andamento...")
+            parar.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.resumos import reconstruir_resumos
+
+
+class Command(BaseCommand):
+    help = "Recalcula do zero o resumo de sensibilização (último exame e MFI por tipo) de todos os pacientes."
+
+    def handle(self, *args, **options):
+        total = reconstruir_resumos()
+        self.stdout.write(self.style.SUCCESS(f"{total} resumos de pacientes reconstruídos."))
@@ -0,0 +1,364 @@
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+# Resumo de cada requisição (nível DEBUG; habilitar com LOG_NIVEIS=backend.requisicoes=DEBUG)
+logger_requisicoes = logging.getLogger('backend.requisicoes')
+
+# Instrumentação por requisição: o middleware mede as consultas SQL (quantidade e tempo)
+# e o tempo total; as views e os motores marcam trechos com `medir('calculo')`. Os tempos
+# vão no cabeçalho Server-Timing e são agregados em histogramas expostos em /metrics
+# (formato texto do Prometheus). Os histogramas são por processo: com vários workers
+# (gunicorn), cada processo grava as suas séries em um arquivo de METRICAS_DIRETORIO e
+# /metrics soma os arquivos de todos os processos, qualquer que seja o worker que responde.
+
+# Limites (em segundos) dos baldes dos histogramas de tempo
+BALDES_TEMPO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Limites dos baldes do histograma de quantidade de consultas por requisição
+BALDES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Consultas guardadas por requisição para o log de requisições lentas
+MAXIMO_CONSULTAS_LOG = 50
+
+# Intervalo mínimo (em segundos) entre as gravações das séries de um processo no diretório compartilhado
+INTERVALO_GRAVACAO = 1.0
+
+# Trechos medidos: consultas SQL, cálculo (pandas/numpy, sem o SQL feito durante ele) e
+# serialização da resposta
+TRECHOS = ('db', 'calculo', 'renderizacao')
+
+
+class Medicao:
+    """
+    Tempos acumulados (em segundos) de uma requisição.
+    """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.tempos = dict.fromkeys(TRECHOS, 0.0)
+        self.consultas = 0
+        self.sql = []  # (duração, sql) das primeiras consultas
+
+    def registrar_consulta(self, sql, duracao):
+        self.consultas += 1
+        self.tempos['db'] += duracao
+        if len(self.sql) < MAXIMO_CONSULTAS_LOG:
+            self.sql.append((duracao, sql))
+
+    def somar(self, trecho, inicio, db):
+        # Tempo desde `inicio`, sem as consultas feitas desde que o tempo em SQL era `db`
+        decorrido = time.perf_counter() - inicio - (self.tempos['db'] - db)
+        self.tempos[trecho] = self.tempos.get(trecho, 0.0) + decorrido
+
+
+_medicao_atual = contextvars.ContextVar('medicao_atual', default=None)
+
+
+@contextmanager
+def medir(trecho):
+    """
+    Soma o tempo do bloco ao trecho informado da requisição atual, descontando o tempo das
+    consultas SQL feitas dentro dele (sem efeito fora de uma requisição).
+    """
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        yield
+        return
+    inicio, db = time.perf_counter(), medicao.tempos['db']
+    try:
+        yield
+    finally:
+        medicao.somar(trecho, inicio, db)
+
+
+class Histograma:
+    """
+    Histograma cumulativo no formato do Prometheus, com uma série por combinação de rótulos.
+    """
+
+    def __init__(self, nome, descricao, baldes, rotulos):
+        self.nome = nome
+        self.descricao = descricao
+        self.baldes = baldes
+        self.rotulos = rotulos
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *rotulos):
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * (len(self.baldes) + 1), 0.0]
+            serie[0][bisect_left(self.baldes, valor)] += 1
+            serie[1] += valor
+
+    def series(self):
+        """
+        Cópia das séries: {rotulos: (contagens por balde, soma)}.
+        """
+        with self._lock:
+            return {rotulos: (list(contagens), soma) for rotulos, (contagens, soma) in self._series.items()}
+
+    def exportar(self, series=None):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        series = self.series() if series is None else series
+        for rotulos, (contagens, soma) in sorted(series.items()):
+            base = ','.join(f'{nome}="{valor}"' for nome, valor in zip(self.rotulos, rotulos))
+            separador = ',' if base else ''
+            acumulado = 0
+            for limite, quantidade in zip([*self.baldes, '+Inf'], contagens):
+                acumulado += quantidade
+                linhas.append(f'{self.nome}_bucket{{{base}{separador}le="{limite}"}} {acumulado}')
+            linhas.append(f"{self.nome}_sum{{{base}}} {soma}")
+            linhas.append(f"{self.nome}_count{{{base}}} {acumulado}")
+        return linhas
+
+
+DURACAO = Histograma('http_requisicao_duracao_segundos', 'Tempo total da requisição.', BALDES_TEMPO, ('view', 'metodo', 'status'))
+DURACAO_TRECHO = Histograma('http_requisicao_trecho_segundos', 'Tempo da requisição por trecho (db, calculo, renderizacao).', BALDES_TEMPO, ('view', 'trecho'))
+CONSULTAS = Histograma('http_requisicao_consultas_sql', 'Consultas SQL por requisição.', BALDES_CONSULTAS, ('view',))
+HISTOGRAMAS = [DURACAO, DURACAO_TRECHO, CONSULTAS]
+
+
+# --- Métricas de vários processos -----------------------------------------------------------
+
+_gravacao = {'pid': None, 'caminho': None, 'ultima': 0.0, 'agendada': False}
+_gravacao_lock = threading.Lock()
+
+
+def _diretorio():
+    return getattr(settings, 'METRICAS_DIRETORIO', '') or None
+
+
+def _estado_processo():
+    from .crossmatch import cache_resultados
+
+    estatisticas = cache_resultados.estatisticas()
+    return {
+        'pid': os.getpid(),
+        'histogramas': {
+            histograma.nome: [[list(rotulos), contagens, soma] for rotulos, (contagens, soma) in histograma.series().items()]
+            for histograma in HISTOGRAMAS
+        },
+        'cache': {nome: estatisticas[nome] for nome in ('acertos', 'falhas', 'entradas')},
+    }
+
+
+def gravar_metricas(forcar=False):
+    """
+    Grava as séries deste processo no seu arquivo de METRICAS_DIRETORIO (sem efeito se não
+    configurado). Sem `forcar`, grava no máximo uma vez por INTERVALO_GRAVACAO e agenda a
+    gravação das observações feitas no intervalo.
+    """
+    diretorio = _diretorio()
+    if diretorio is None:
+        return
+    with _gravacao_lock:
+        if _gravacao['pid'] != os.getpid() or os.path.dirname(_gravacao['caminho']) != diretorio:
+            # Primeira gravação do processo (um worker criado por fork não herda o arquivo do mestre);
+            # o sufixo evita reaproveitar o arquivo de um processo encerrado com o mesmo pid
+            _gravacao.update(pid=os.getpid(), ultima=0.0, agendada=False,
+                             caminho=os.path.join(diretorio, f"metricas_{os.getpid()}_{uuid.uuid4().hex[:8]}.json"))
+        espera = _gravacao['ultima'] + INTERVALO_GRAVACAO - time.monotonic()
+        if not forcar and espera > 0:
+            if not _gravacao['agendada']:
+                temporizador = threading.Timer(espera, gravar_metricas, kwargs={'forcar': True})
+                temporizador.daemon = True
+                temporizador.start()
+                _gravacao['agendada'] = True
+            return
+        _gravacao.update(ultima=time.monotonic(), agendada=False)
+        caminho = _gravacao['caminho']
+
+    temporario = f"{caminho}.tmp"
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(_estado_processo(), arquivo)
+        # Substituição atômica: /metrics nunca lê um arquivo pela metade
+        os.replace(temporario, caminho)
+    except OSError:
+        logger.exception("Não foi possível gravar as métricas em %s", diretorio)
+
+
+def limpar_metricas():
+    """
+    Apaga os arquivos de métricas dos processos anteriores (chamado na inicialização do servidor).
+    """
+    diretorio = _diretorio()
+    if diretorio is None:
+        return
+    for caminho in glob.glob(os.path.join(diretorio, 'metricas_*.json*')):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def _processo_ativo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _estados_processos():
+    # Estado de cada processo: apenas o atual sem METRICAS_DIRETORIO; senão, todos os arquivos
+    # (inclusive de workers já reiniciados, cujas contagens continuam valendo)
+    if _diretorio() is None:
+        return [_estado_processo()]
+    gravar_metricas(forcar=True)
+    estados = []
+    for caminho in sorted(glob.glob(os.path.join(_diretorio(), 'metricas_*.json'))):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                estados.append(json.load(arquivo))
+        except (OSError, ValueError):
+            # Arquivo apagado entre a listagem e a leitura
+            continue
+    return estados
+
+
+def _nome_view(request):
+    # Nome da rota (e não o caminho) para limitar a quantidade de séries
+    correspondencia = getattr(request, 'resolver_match', None)
+    return (correspondencia.url_name or correspondencia.view_name) if correspondencia else 'sem_rota'
+
+
+def _server_timing(medicao, total):
+    partes = [f'db;dur={medicao.tempos["db"] * 1000:.1f};desc="{medicao.consultas} consultas"']
+    partes.extend(
+        f'{trecho};dur={medicao.tempos[trecho] * 1000:.1f}'
+        for trecho in TRECHOS[1:] if medicao.tempos[trecho]
+    )
+    partes.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(partes)
+
+
+class MetricasMiddleware:
+    """
+    Mede cada requisição, adiciona o cabeçalho Server-Timing, alimenta os histogramas
+    e registra no log as requisições mais lentas que `REQUISICAO_LENTA_MS`.
+    Funciona em modo síncrono (WSGI) e assíncrono (ASGI, ver views_async).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limiar_lenta = getattr(settings, 'REQUISICAO_LENTA_MS', 1000) / 1000
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def _consulta(self, execute, sql, params, many, context):
+        medicao = _medicao_atual.get()
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if medicao is not None:
+                medicao.registrar_consulta(sql, time.perf_counter() - inicio)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self.__acall__(request)
+        medicao = Medicao()
+        token = _medicao_atual.set(medicao)
+        try:
+            with connection.execute_wrapper(self._consulta):
+                response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        return self._finalizar(request, response, medicao)
+
+    def _instalar(self):
+        connection.execute_wrappers.append(self._consulta)
+
+    def _remover(self):
+        connection.execute_wrappers.remove(self._consulta)
+
+    async def __acall__(self, request):
+        medicao = Medicao()
+        token = _medicao_atual.set(medicao)
+        # O ORM assíncrono executa as consultas na thread da requisição (sync_to_async), que tem
+        # a sua própria conexão: o wrapper é instalado e removido nessa thread
+        await sync_to_async(self._instalar)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self._remover)()
+            _medicao_atual.reset(token)
+        return self._finalizar(request, response, medicao)
+
+    def _finalizar(self, request, response, medicao):
+        # Respostas do DRF são renderizadas depois da view (ver `process_template_response`)
+        if hasattr(request, '_fim_view'):
+            medicao.somar('renderizacao', *request._fim_view)
+        total = time.perf_counter() - medicao.inicio
+
+        response['Server-Timing'] = _server_timing(medicao, total)
+        view = _nome_view(request)
+        DURACAO.observar(total, view, request.method, str(response.status_code))
+        CONSULTAS.observar(medicao.consultas, view)
+        for trecho, duracao in medicao.tempos.items():
+            DURACAO_TRECHO.observar(duracao, view, trecho)
+        gravar_metricas()
+
+        if logger_requisicoes.isEnabledFor(logging.DEBUG):
+            logger_requisicoes.debug("%s %s", request.method, request.path, extra={
+                'view': view, 'status': response.status_code, 'duracao_ms': round(total * 1000, 1),
+                'consultas': medicao.consultas, 'db_ms': round(medicao.tempos['db'] * 1000, 1),
+            })
+        if total >= self.limiar_lenta:
+            consultas = '\n'.join(f"  {duracao * 1000:.1f} ms  {sql}" for duracao, sql in medicao.sql)
+            logger.warning("Requisição lenta: %s %s %.0f ms (%d consultas, %.0f ms em SQL)\n%s",
+                           request.method, request.get_full_path(), total * 1000,
+                           medicao.consultas, medicao.tempos['db'] * 1000, consultas)
+        return response
+
+    def process_template_response(self, request, response):
+        # Chamado entre o fim da view e a renderização da resposta
+        medicao = _medicao_atual.get()
+        if medicao is not None:
+            request._fim_view = (time.perf_counter(), medicao.tempos['db'])
+        return response
+
+
+def metricas(request):
+    """
+    Histogramas das requisições e estatísticas do cache de crossmatch no formato texto do
+    Prometheus, somados entre os processos quando METRICAS_DIRETORIO está configurado.
+    """
+    estados = _estados_processos()
+    linhas = []
+    for histograma in HISTOGRAMAS:
+        series = {}
+        for estado in estados:
+            for rotulos, contagens, soma in estado['histogramas'].get(histograma.nome, []):
+                total = series.setdefault(tuple(rotulos), ([0] * (len(histograma.baldes) + 1), 0.0))
+                series[tuple(rotulos)] = ([a + b for a, b in zip(total[0], contagens)], total[1] + soma)
+        linhas.extend(histograma.exportar(series))
+
+    # Contadores somam todos os processos; o número de entradas, apenas os processos em execução
+    ativos = [estado for estado in estados if estado['pid'] == os.getpid() or _processo_ativo(estado['pid'])]
+    for nome, tipo, considerados in (('acertos', 'counter', estados), ('falhas', 'counter', estados), ('entradas', 'gauge', ativos)):
+        linhas.append(f"# TYPE crossmatch_cache_{nome} {tipo}")
+        linhas.append(f"crossmatch_cache_{nome} {sum(estado['cache'][nome] for estado in considerados)}")
+    return HttpResponse('\n'.join(linhas) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_versoes_dados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarefa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('status', models.CharField(default='pendente', max_length=20)),
+                ('parametros', models.JSONField(default=dict)),
+                ('arquivo', models.BinaryField(null=True)),
+                ('arquivo_nome', models.CharField(blank=True, max_length=255)),
+                ('status_http', models.IntegerField(null=True)),
+                ('resultado', models.JSONField(null=True)),
+                ('erro', models.TextField(blank=True)),
+                ('tentativas', models.IntegerField(default=0)),
+                ('max_tentativas', models.IntegerField(default=3)),
+                ('disponivel_em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('criada_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciada_em', models.DateTimeField(null=True)),
+                ('concluida_em', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'tarefas',
+                'indexes': [models.Index(fields=['status', 'disponivel_em'], name='tarefas_status_1d8d5f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+# Índice trigram para a busca por trecho do nome (icontains gera UPPER(nome) LIKE UPPER('%...%')).
+# Só existe no PostgreSQL; no SQLite a busca usa o índice (nome, id) apenas para a ordenação.
+def criar_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS pacientes_nome_trgm_idx ON pacientes USING gin (UPPER(nome) gin_trgm_ops)"
+    )
+
+
+def remover_indice_trigram(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS pacientes_nome_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_tarefas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['nome', 'id'], name='pacientes_nome_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['data_nascimento'], name='pacientes_nascimento_idx'),
+        ),
+        migrations.RunPython(criar_indice_trigram, remover_indice_trigram),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:40
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+# Antes de tornar `Alelo.nome` único, junta alelos com o mesmo nome no de menor id
+def unificar_alelos_duplicados(apps, schema_editor):
+    Alelo = apps.get_model('backend', 'Alelo')
+    ExameAlelo = apps.get_model('backend', 'ExameAlelo')
+    duplicados = Alelo.objects.values('nome').annotate(total=Count('id'), manter=Min('id')).filter(total__gt=1)
+    for duplicado in duplicados:
+        outros = Alelo.objects.filter(nome=duplicado['nome']).exclude(id=duplicado['manter'])
+        ExameAlelo.objects.filter(alelo__in=outros).update(alelo_id=duplicado['manter'])
+        outros.delete()
+
+
+class Migration(migrations.Migration):
+    # Separada da migração dos índices: no PostgreSQL, alterar uma tabela na mesma
+    # transação em que suas linhas foram modificadas falha por eventos de trigger pendentes
+
+    dependencies = [
+        ('backend', '0004_pacientes_busca'),
+    ]
+
+    operations = [
+        migrations.RunPython(unificar_alelos_duplicados, migrations.RunPython.noop),
+    ]
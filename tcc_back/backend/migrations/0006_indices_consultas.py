@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_unificar_alelos_duplicados'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alelo',
+            name='nome',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='alelo',
+            index=models.Index(fields=['tipo', 'numero1'], name='alelos_tipo_numero1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exame',
+            index=models.Index(fields=['paciente', '-data_exame', 'id'], name='exames_paciente_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examealelo',
+            index=models.Index(fields=['exame', 'alelo'], name='exames_alelos_exame_alelo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['tipo_sanguineo'], name='pacientes_tipo_sanguineo_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+# Valor de `crossmatch.LIMIAR_MFI` quando esta migração foi criada
+LIMIAR_MFI = 1000
+
+
+# Preenche os resumos dos pacientes existentes (mesmo cálculo de `backend.resumos`)
+def preencher_resumos(apps, schema_editor):
+    Exame = apps.get_model('backend', 'Exame')
+    ExameAlelo = apps.get_model('backend', 'ExameAlelo')
+    ResumoPaciente = apps.get_model('backend', 'ResumoPaciente')
+
+    resumos = {}
+    for paciente_id, exame_id, data_exame in Exame.objects.order_by('paciente_id', '-data_exame', 'id').values_list('paciente_id', 'id', 'data_exame'):
+        if paciente_id not in resumos:
+            resumos[paciente_id] = ResumoPaciente(paciente_id=paciente_id, ultimo_exame_id=exame_id, data_exame=data_exame,
+                                                  mfi_maximo={}, positivos={}, total_positivos=0)
+
+    por_exame = {resumo.ultimo_exame_id: resumo for resumo in resumos.values()}
+    exame_ids = list(por_exame)
+    for inicio in range(0, len(exame_ids), 500):
+        agregados = (
+            ExameAlelo.objects.filter(exame_id__in=exame_ids[inicio:inicio + 500])
+            .values('exame_id', 'alelo__tipo')
+            .annotate(maximo=Max('valor'), positivos=Count('id', filter=Q(valor__gte=LIMIAR_MFI)))
+            .order_by()
+        )
+        for agregado in agregados:
+            resumo = por_exame[agregado['exame_id']]
+            resumo.mfi_maximo[agregado['alelo__tipo']] = agregado['maximo']
+            resumo.positivos[agregado['alelo__tipo']] = agregado['positivos']
+            resumo.total_positivos += agregado['positivos']
+    ResumoPaciente.objects.bulk_create(resumos.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoPaciente',
+            fields=[
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo', serialize=False, to='backend.paciente')),
+                ('data_exame', models.DateField(null=True)),
+                ('mfi_maximo', models.JSONField(default=dict)),
+                ('positivos', models.JSONField(default=dict)),
+                ('total_positivos', models.IntegerField(default=0)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('ultimo_exame', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.exame')),
+            ],
+            options={
+                'db_table': 'resumos_pacientes',
+            },
+        ),
+        migrations.RunPython(preencher_resumos, migrations.RunPython.noop),
+    ]
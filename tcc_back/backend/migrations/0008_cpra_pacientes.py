@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_resumos_pacientes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CpraPaciente',
+            fields=[
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cpra', serialize=False, to='backend.paciente')),
+                ('cpra', models.FloatField()),
+                ('antigenos_inaceitaveis', models.JSONField(default=list)),
+                ('painel', models.CharField(max_length=64)),
+                ('calculado_em', models.DateTimeField(auto_now=True)),
+                ('ultimo_exame', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='backend.exame')),
+            ],
+            options={
+                'db_table': 'cpra_pacientes',
+                'indexes': [models.Index(fields=['-cpra', 'paciente'], name='cpra_pacientes_cpra_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_cpra_pacientes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crossmatchpatientresult',
+            name='alelos',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='crossmatchpatientresult',
+            name='compatibilidades',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='crossmatchpatientresult',
+            name='valores',
+            field=models.BinaryField(null=True),
+        ),
+    ]
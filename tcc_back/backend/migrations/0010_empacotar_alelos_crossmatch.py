@@ -0,0 +1,72 @@
+from django.db import migrations
+import numpy as np
+
+TAMANHO_BLOCO = 500
+
+
+# Converte as linhas de CrossmatchAlleleResult em arrays empacotados (mesmo formato de
+# `crossmatch.empacotar_alelos`). Resultados com nomes de alelos fora do catálogo continuam
+# no formato antigo.
+def empacotar(apps, schema_editor):
+    Alelo = apps.get_model('backend', 'Alelo')
+    CrossmatchPatientResult = apps.get_model('backend', 'CrossmatchPatientResult')
+    CrossmatchAlleleResult = apps.get_model('backend', 'CrossmatchAlleleResult')
+
+    catalogo = dict(Alelo.objects.values_list('nome', 'id'))
+    ids = list(CrossmatchPatientResult.objects.filter(alelos__isnull=True).order_by('id').values_list('id', flat=True))
+    for inicio in range(0, len(ids), TAMANHO_BLOCO):
+        bloco = ids[inicio:inicio + TAMANHO_BLOCO]
+        grupos = {resultado_id: [] for resultado_id in bloco}
+        linhas = (
+            CrossmatchAlleleResult.objects.filter(patient_result_id__in=bloco)
+            .order_by('patient_result_id', 'id')
+            .values_list('patient_result_id', 'allele_name', 'allele_value', 'compatibility')
+        )
+        for resultado_id, nome, valor, compativel in linhas:
+            grupos[resultado_id].append((nome, valor, compativel))
+
+        convertidos = []
+        for resultado_id, alelos in grupos.items():
+            if not all(nome in catalogo for nome, _, _ in alelos):
+                continue
+            convertidos.append(CrossmatchPatientResult(
+                id=resultado_id,
+                alelos=np.asarray([catalogo[nome] for nome, _, _ in alelos], dtype='<i8').tobytes(),
+                valores=np.asarray([valor for _, valor, _ in alelos], dtype='<f8').tobytes(),
+                compatibilidades=np.packbits(np.asarray([c for _, _, c in alelos], dtype=bool), bitorder='little').tobytes(),
+            ))
+        CrossmatchPatientResult.objects.bulk_update(convertidos, ['alelos', 'valores', 'compatibilidades'])
+        CrossmatchAlleleResult.objects.filter(patient_result_id__in=[resultado.id for resultado in convertidos]).delete()
+
+
+def desempacotar(apps, schema_editor):
+    Alelo = apps.get_model('backend', 'Alelo')
+    CrossmatchPatientResult = apps.get_model('backend', 'CrossmatchPatientResult')
+    CrossmatchAlleleResult = apps.get_model('backend', 'CrossmatchAlleleResult')
+
+    nomes = dict(Alelo.objects.values_list('id', 'nome'))
+    resultados = CrossmatchPatientResult.objects.filter(alelos__isnull=False).order_by('id')
+    for resultado in resultados.iterator(chunk_size=TAMANHO_BLOCO):
+        alelo_ids = np.frombuffer(bytes(resultado.alelos), dtype='<i8')
+        valores = np.frombuffer(bytes(resultado.valores), dtype='<f8')
+        compatibilidades = np.unpackbits(np.frombuffer(bytes(resultado.compatibilidades), dtype=np.uint8),
+                                         count=len(alelo_ids), bitorder='little').astype(bool)
+        CrossmatchAlleleResult.objects.bulk_create([
+            CrossmatchAlleleResult(patient_result_id=resultado.id, allele_name=nomes.get(alelo_id, ''),
+                                   allele_value=valor, compatibility=compativel)
+            for alelo_id, valor, compativel in zip(alelo_ids.tolist(), valores.tolist(), compatibilidades.tolist())
+        ])
+    resultados.update(alelos=None, valores=None, compatibilidades=None)
+
+
+class Migration(migrations.Migration):
+    # Separada da migração que cria os campos: no PostgreSQL, alterar uma tabela na mesma
+    # transação em que suas linhas foram modificadas falha por eventos de trigger pendentes
+
+    dependencies = [
+        ('backend', '0009_alelos_empacotados'),
+    ]
+
+    operations = [
+        migrations.RunPython(empacotar, desempacotar),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.2 on 2026-10-18 04:37
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+# A reserva de tarefas passa a usar a trava própria (tabela `travas`) em vez de um registro de
+# `versoes_dados`, e as tarefas em execução recebem o sinal de vida a partir do início da execução.
+def migrar_trava(apps, schema_editor):
+    Trava = apps.get_model('backend', 'Trava')
+    Tarefa = apps.get_model('backend', 'Tarefa')
+    VersaoDados = apps.get_model('backend', 'VersaoDados')
+
+    Trava.objects.get_or_create(chave='fila_tarefas')
+    VersaoDados.objects.filter(chave='fila_tarefas').delete()
+    Tarefa.objects.filter(status='executando', ultimo_sinal__isnull=True).update(ultimo_sinal=F('iniciada_em'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_empacotar_alelos_crossmatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trava',
+            fields=[
+                ('chave', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('obtida_em', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'travas',
+            },
+        ),
+        migrations.AddField(
+            model_name='tarefa',
+            name='ultimo_sinal',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(migrar_trava, migrations.RunPython.noop),
+    ]
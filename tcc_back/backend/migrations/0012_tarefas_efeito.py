@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_tarefas_sinal_de_vida'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tarefa',
+            name='efeito',
+            field=models.JSONField(null=True),
+        ),
+    ]
@@ -11,6 +11,11 @@ class Paciente(models.Model):
 
     class Meta:
         db_table = 'pacientes'  # Nome da tabela no banco de dados
+        indexes = [
+            models.Index(fields=['nome', 'id'], name='pacientes_nome_id_idx'),  # Ordenação e paginação da lista
+            models.Index(fields=['data_nascimento'], name='pacientes_nascimento_idx'),  # Filtro por faixa de nascimento
+            models.Index(fields=['tipo_sanguineo'], name='pacientes_tipo_sanguineo_idx'),  # Filtro do crossmatch
+        ]
 
     def __str__(self):
         return self.nome
@@ -23,6 +28,10 @@ class Exame(models.Model):
 
     class Meta:
         db_table = 'exames'  # Nome da tabela no banco de dados
+        indexes = [
+            # Exames de um paciente do mais recente para o mais antigo (último exame e listagem)
+            models.Index(fields=['paciente', '-data_exame', 'id'], name='exames_paciente_data_idx'),
+        ]
 
     def __str__(self):
         return f"Exame {self.id} - Paciente {self.paciente_id} - Data {self.data_exame}"
@@ -30,13 +39,16 @@ class Exame(models.Model):
 
 # Modelo de alelos
 class Alelo(models.Model):
-    nome = models.CharField(max_length=100)  # Nome do alelo (ex.: "A01:01")
+    nome = models.CharField(max_length=100, unique=True)  # Nome do alelo (ex.: "A01:01")
     numero1 = models.IntegerField()  # Parte numérica 1
     numero2 = models.IntegerField()  # Parte numérica 2
     tipo = models.CharField(max_length=2)  # Tipo do alelo (ex.: 'A', 'B', etc.)
 
     class Meta:
         db_table = 'alelos'  # Nome da tabela no banco de dados
+        indexes = [
+            models.Index(fields=['tipo', 'numero1'], name='alelos_tipo_numero1_idx'),  # Alelos do doador no crossmatch
+        ]
 
     def __str__(self):
         return self.nome
@@ -50,6 +62,47 @@ class ExameAlelo(models.Model):
 
     class Meta:
         db_table = 'exames_alelos'  # Nome da tabela no banco de dados
+        indexes = [
+            models.Index(fields=['exame', 'alelo'], name='exames_alelos_exame_alelo_idx'),  # Alelos de um exame
+        ]
+
+
+# Resumo de sensibilização de cada paciente, calculado a partir do último exame
+# (mantido por `backend.resumos`; pacientes sem exames não têm resumo)
+class ResumoPaciente(models.Model):
+    paciente = models.OneToOneField(Paciente, on_delete=models.CASCADE, primary_key=True, related_name='resumo')  # Paciente resumido
+    ultimo_exame = models.ForeignKey(Exame, on_delete=models.SET_NULL, null=True, related_name='+')  # Último exame (maior data; em empate, o menor id)
+    data_exame = models.DateField(null=True)  # Data do último exame
+    mfi_maximo = models.JSONField(default=dict)  # Maior MFI por tipo de alelo (ex.: {"A*": 5321.0})
+    positivos = models.JSONField(default=dict)  # Alelos com MFI acima do limiar, por tipo de alelo
+    total_positivos = models.IntegerField(default=0)  # Total de alelos com MFI acima do limiar
+    atualizado_em = models.DateTimeField(auto_now=True)  # Momento do último cálculo
+
+    class Meta:
+        db_table = 'resumos_pacientes'  # Nome da tabela no banco de dados
+
+    def __str__(self):
+        return f"Resumo do Paciente {self.paciente_id} - Exame {self.ultimo_exame_id}"
+
+
+# cPRA (calculated panel-reactive antibody) de cada paciente: porcentagem do painel de
+# doadores de referência com ao menos um antígeno inaceitável para o paciente (mantido por `backend.cpra`)
+class CpraPaciente(models.Model):
+    paciente = models.OneToOneField(Paciente, on_delete=models.CASCADE, primary_key=True, related_name='cpra')  # Paciente avaliado
+    cpra = models.FloatField()  # Porcentagem (0 a 100) do painel com crossmatch positivo
+    antigenos_inaceitaveis = models.JSONField(default=list)  # Antígenos com MFI acima do limiar no último exame (ex.: ["A*02", "DR04"])
+    ultimo_exame = models.ForeignKey(Exame, on_delete=models.SET_NULL, null=True, related_name='+')  # Exame usado no cálculo
+    painel = models.CharField(max_length=64)  # Identificação (hash) do painel de doadores usado
+    calculado_em = models.DateTimeField(auto_now=True)  # Momento do cálculo
+
+    class Meta:
+        db_table = 'cpra_pacientes'  # Nome da tabela no banco de dados
+        indexes = [
+            models.Index(fields=['-cpra', 'paciente'], name='cpra_pacientes_cpra_idx'),  # Lista ordenada pelo cPRA
+        ]
+
+    def __str__(self):
+        return f"cPRA do Paciente {self.paciente_id}: {self.cpra:.2f}%"
 
 
 # Modelo para registros de Crossmatch
@@ -75,6 +128,11 @@ class CrossmatchPatientResult(models.Model):
     patient_name = models.CharField(max_length=100)  # Nome do paciente
     total_compatible_alleles = models.IntegerField()  # Total de alelos compatíveis
     total_incompatible_alleles = models.IntegerField()  # Total de alelos incompatíveis
+    # Alelos do resultado em arrays empacotados (ver `crossmatch.empacotar_alelos`), no lugar de
+    # uma linha de CrossmatchAlleleResult por alelo. Nulos nos resultados gravados no formato antigo.
+    alelos = models.BinaryField(null=True)  # Ids dos alelos (`Alelo.id`), int64 little-endian
+    valores = models.BinaryField(null=True)  # MFI de cada alelo, float64 little-endian
+    compatibilidades = models.BinaryField(null=True)  # Compatibilidade de cada alelo, um bit por alelo
 
     class Meta:
         db_table = 'crossmatchpatientresult'  # Nome da tabela no banco de dados
@@ -95,3 +153,60 @@ class CrossmatchAlleleResult(models.Model):
 
     def __str__(self):
         return f"Alelo {self.allele_name} - Compatível: {self.compatibility}"
+
+
+# Modelo de contadores de versão dos dados (usado para invalidar caches entre processos)
+class VersaoDados(models.Model):
+    chave = models.CharField(max_length=50, primary_key=True)  # Nome do conjunto de dados versionado
+    versao = models.BigIntegerField(default=0)  # Incrementado a cada alteração
+    atualizado_em = models.DateTimeField(auto_now=True)  # Momento da última alteração
+
+    class Meta:
+        db_table = 'versoes_dados'  # Nome da tabela no banco de dados
+
+    def __str__(self):
+        return f"{self.chave} - v{self.versao}"
+
+
+# Modelo de tarefas assíncronas (uploads e crossmatches executados fora da requisição)
+class Tarefa(models.Model):
+    PENDENTE = 'pendente'
+    EXECUTANDO = 'executando'
+    CONCLUIDA = 'concluida'
+    FALHOU = 'falhou'
+
+    tipo = models.CharField(max_length=50)  # Tipo da tarefa (ex.: 'upload_excel', 'virtual_crossmatch')
+    status = models.CharField(max_length=20, default=PENDENTE)  # Situação atual da tarefa
+    parametros = models.JSONField(default=dict)  # Dados da requisição original
+    arquivo = models.BinaryField(null=True)  # Conteúdo do arquivo enviado, quando houver
+    arquivo_nome = models.CharField(max_length=255, blank=True)  # Nome do arquivo enviado
+    status_http = models.IntegerField(null=True)  # Status que a requisição síncrona teria retornado
+    resultado = models.JSONField(null=True)  # Corpo da resposta da requisição síncrona
+    efeito = models.JSONField(null=True)  # Registro da escrita feita pela tarefa (ex.: {"exame_id": 1}), gravado na mesma transação
+    erro = models.TextField(blank=True)  # Último erro inesperado
+    tentativas = models.IntegerField(default=0)  # Execuções já iniciadas
+    max_tentativas = models.IntegerField(default=3)  # Limite de execuções
+    disponivel_em = models.DateTimeField(default=now)  # Momento a partir do qual pode ser executada
+    criada_em = models.DateTimeField(auto_now_add=True)  # Data de criação
+    iniciada_em = models.DateTimeField(null=True)  # Início da última execução
+    ultimo_sinal = models.DateTimeField(null=True)  # Último sinal de vida do worker que executa a tarefa
+    concluida_em = models.DateTimeField(null=True)  # Fim da execução
+
+    class Meta:
+        db_table = 'tarefas'  # Nome da tabela no banco de dados
+        indexes = [models.Index(fields=['status', 'disponivel_em'])]
+
+    def __str__(self):
+        return f"Tarefa {self.id} - {self.tipo} ({self.status})"
+
+
+# Registros usados como travas entre processos (ex.: a reserva de tarefas pelos workers)
+class Trava(models.Model):
+    chave = models.CharField(max_length=50, primary_key=True)  # Nome da trava
+    obtida_em = models.DateTimeField(null=True)  # Última vez em que a trava foi obtida
+
+    class Meta:
+        db_table = 'travas'  # Nome da tabela no banco de dados
+
+    def __str__(self):
+        return self.chave
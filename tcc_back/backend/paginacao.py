@@ -0,0 +1,108 @@
+import base64
+import json
+from datetime import date, datetime
+
+from django.db.models import Q
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+
+class ErroPaginacao(Exception):
+    """
+    Cursor ou limite inválido (retornado ao cliente como 400).
+    """
+
+
+def codificar_cursor(valores):
+    valores = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in valores]
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+def decodificar_cursor(cursor, tamanho):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ErroPaginacao("Cursor inválido.")
+    if not isinstance(valores, list) or len(valores) != tamanho:
+        raise ErroPaginacao("Cursor inválido.")
+    return valores
+
+
+def paginacao_solicitada(request):
+    """
+    Nas listas que antes retornavam todos os itens, a paginação é opcional: só é aplicada
+    quando o cliente informa `limite` ou `cursor`, e sem eles a resposta continua sendo a lista.
+    """
+    return 'limite' in request.GET or 'cursor' in request.GET
+
+
+def ler_limite(request, padrao=LIMITE_PADRAO):
+    try:
+        limite = int(request.GET.get('limite', padrao))
+    except ValueError:
+        raise ErroPaginacao("Limite inválido.")
+    if limite < 1:
+        raise ErroPaginacao("Limite inválido.")
+    return min(limite, LIMITE_MAXIMO)
+
+
+def _apos(ordenacao, valores):
+    """
+    Condição "vem depois do cursor" para a ordenação informada, ex.:
+    ['-data', '-id'] -> data < x OR (data = x AND id < y).
+    """
+    condicao = Q()
+    iguais = Q()
+    for campo, valor in zip(ordenacao, valores):
+        nome = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        condicao |= iguais & Q(**{f"{nome}__{operador}": valor})
+        iguais &= Q(**{nome: valor})
+    return condicao
+
+
+def _valor(item, campo):
+    nome = campo.lstrip('-')
+    return item[nome] if isinstance(item, dict) else getattr(item, nome)
+
+
+def _consulta_pagina(queryset, ordenacao, cursor, limite):
+    queryset = queryset.order_by(*ordenacao)
+    if cursor:
+        queryset = queryset.filter(_apos(ordenacao, decodificar_cursor(cursor, len(ordenacao))))
+    return queryset[:limite + 1]
+
+
+def _cortar_pagina(itens, ordenacao, limite):
+    proximo = None
+    if len(itens) > limite:
+        itens = itens[:limite]
+        proximo = codificar_cursor([_valor(itens[-1], campo) for campo in ordenacao])
+    return itens, proximo
+
+
+def paginar(queryset, ordenacao, cursor=None, limite=LIMITE_PADRAO):
+    """
+    Paginação por chave (keyset): em vez de OFFSET, cada página começa após os
+    valores de ordenação do último item da página anterior. A ordenação deve
+    terminar em um campo único (ex.: 'id') para que o cursor seja inequívoco.
+    Retorna (itens da página, cursor da próxima página ou None).
+    """
+    return _cortar_pagina(list(_consulta_pagina(queryset, ordenacao, cursor, limite)), ordenacao, limite)
+
+
+async def paginar_async(queryset, ordenacao, cursor=None, limite=LIMITE_PADRAO):
+    """
+    Mesmo que `paginar`, com o ORM assíncrono.
+    """
+    itens = [item async for item in _consulta_pagina(queryset, ordenacao, cursor, limite)]
+    return _cortar_pagina(itens, ordenacao, limite)
+
+
+def url_proxima_pagina(request, proximo):
+    if proximo is None:
+        return None
+    parametros = request.GET.copy()
+    parametros['cursor'] = proximo
+    return request.build_absolute_uri(f"{request.path}?{parametros.urlencode()}")
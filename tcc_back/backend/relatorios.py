@@ -0,0 +1,232 @@
+import io
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Layout do relatório do equipamento (linhas e colunas contadas a partir de 1, como no Excel)
+LINHA_CABECALHO = 1  # Cabeçalho da planilha, ignorado na busca por "TEST DATE"
+LINHA_INICIAL_ALELOS = 11  # Primeira linha com alelos
+COLUNA_VALOR = 16  # Coluna P ('normal')
+COLUNA_ALELO = 36  # Coluna AJ ('Allele Specificity')
+DESLOCAMENTO_DATA = 4  # A data fica quatro colunas à direita de "TEST DATE"
+
+# Alelo lido do relatório, já separado em tipo e números
+LinhaAlelo = namedtuple('LinhaAlelo', ['nome', 'tipo', 'numero1', 'numero2', 'valor'])
+
+# Conteúdo do relatório necessário para gravar o exame
+Relatorio = namedtuple('Relatorio', ['data_exame', 'linhas', 'ignorados'])
+
+
+class ErroRelatorio(Exception):
+    """
+    Erro no arquivo ou no conteúdo do relatório (retornado ao cliente como 400).
+    """
+
+
+def converter_data(valor):
+    """
+    Converte a data do exame, que pode vir como texto (dd/mm/aaaa) ou como data do Excel.
+    """
+    try:
+        if isinstance(valor, str):
+            return datetime.strptime(valor, "%d/%m/%Y").date()
+        elif isinstance(valor, datetime):
+            return valor.date()
+        raise ValueError
+    except ValueError:
+        raise ErroRelatorio("Data do exame ausente ou em formato incorreto.")
+
+
+def _celula(linha, coluna):
+    # `coluna` é contada a partir de 1; células fora da linha são vazias
+    return linha[coluna - 1] if len(linha) >= coluna else None
+
+
+def _buscar_data(linhas):
+    """
+    Percorre as linhas até encontrar a célula "TEST DATE" e retorna a data do exame.
+    """
+    for linha in linhas:
+        for coluna, valor in enumerate(linha, start=1):
+            if valor is not None and 'test date' in str(valor).lower():
+                return converter_data(_celula(linha, coluna + DESLOCAMENTO_DATA))
+    raise ErroRelatorio("Campo 'TEST DATE' não encontrado.")
+
+
+class RelatorioXlsx:
+    """
+    Leitura em streaming (modo somente leitura do openpyxl) de relatórios .xlsx.
+    """
+
+    def __init__(self, arquivo):
+        import openpyxl
+
+        self.workbook = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        self.planilha = self.workbook.worksheets[0]
+
+    def data_exame(self):
+        return _buscar_data(self.planilha.iter_rows(min_row=LINHA_CABECALHO + 1, values_only=True))
+
+    def celulas(self):
+        # Lê apenas o intervalo P:AJ a partir da primeira linha de alelos
+        for linha in self.planilha.iter_rows(min_row=LINHA_INICIAL_ALELOS, min_col=COLUNA_VALOR,
+                                             max_col=COLUNA_ALELO, values_only=True):
+            yield _celula(linha, COLUNA_ALELO - COLUNA_VALOR + 1), _celula(linha, 1)
+
+    def fechar(self):
+        self.workbook.close()
+
+
+class RelatorioXls:
+    """
+    Leitura de relatórios .xls com o xlrd, carregando a planilha sob demanda e
+    acessando apenas as colunas necessárias.
+    """
+
+    def __init__(self, arquivo):
+        import xlrd
+
+        self.xlrd = xlrd
+        self.workbook = xlrd.open_workbook(file_contents=arquivo.read(), on_demand=True)
+        self.planilha = self.workbook.sheet_by_index(0)
+
+    def _valor(self, celula):
+        if celula.ctype == self.xlrd.XL_CELL_EMPTY:
+            return None
+        if celula.ctype == self.xlrd.XL_CELL_DATE:
+            return self.xlrd.xldate.xldate_as_datetime(celula.value, self.workbook.datemode)
+        return celula.value
+
+    def data_exame(self):
+        linhas = (
+            [self._valor(celula) for celula in self.planilha.row(indice)]
+            for indice in range(LINHA_CABECALHO, self.planilha.nrows)
+        )
+        return _buscar_data(linhas)
+
+    def celulas(self):
+        if self.planilha.ncols < COLUNA_ALELO:
+            return
+        inicio = LINHA_INICIAL_ALELOS - 1
+        alelos = self.planilha.col_slice(COLUNA_ALELO - 1, start_rowx=inicio)
+        valores = self.planilha.col_slice(COLUNA_VALOR - 1, start_rowx=inicio)
+        for alelo, valor in zip(alelos, valores):
+            yield self._valor(alelo), self._valor(valor)
+
+    def fechar(self):
+        self.workbook.release_resources()
+
+
+def abrir_relatorio(arquivo):
+    """
+    Abre o relatório conforme a extensão do arquivo (.xls ou .xlsx).
+    """
+    extensao = arquivo.name.split('.')[-1].lower()
+    leitores = {'xlsx': RelatorioXlsx, 'xls': RelatorioXls}
+    if extensao not in leitores:
+        raise ErroRelatorio("Formato de arquivo não suportado. Use arquivos .xls ou .xlsx.")
+    try:
+        return leitores[extensao](arquivo)
+    except Exception as e:
+        raise ErroRelatorio(f"Erro ao processar o arquivo Excel: {str(e)}")
+
+
+def ler_celulas(arquivo):
+    """
+    Localiza a data do exame e retorna (data_exame, gerador de pares (alelo, valor)).
+    O gerador lê as linhas sob demanda e fecha o arquivo ao terminar.
+    """
+    relatorio = abrir_relatorio(arquivo)
+    try:
+        data_exame = relatorio.data_exame()
+    except ErroRelatorio:
+        relatorio.fechar()
+        raise
+    except Exception as e:
+        relatorio.fechar()
+        raise ErroRelatorio(f"Erro ao processar o arquivo Excel: {str(e)}")
+
+    def celulas():
+        try:
+            yield from relatorio.celulas()
+        finally:
+            relatorio.fechar()
+
+    return data_exame, celulas()
+
+
+def interpretar_alelo(nome):
+    """
+    Separa um alelo no formato "A*02:01" em (tipo, numero1, numero2).
+    Retorna None para alelos malformados.
+    """
+    if '*' not in nome:
+        return None
+    tipo = nome[:2]  # Apenas os dois primeiros caracteres formam o campo `tipo`
+    try:
+        numero1, numero2 = map(int, nome.split('*')[1].split(':'))
+    except ValueError:
+        return None
+    return tipo, numero1, numero2
+
+
+def extrair_linhas(celulas):
+    """
+    Interpreta os pares (célula de alelos, valor) do relatório.
+    Retorna a lista de alelos válidos e a quantidade de alelos ignorados.
+    """
+    linhas = []
+    ignorados = 0
+    for alelo_celula, normal_value in celulas:
+        alelo_celula = str(alelo_celula).strip() if alelo_celula is not None else ''
+        # Ignorar células que só têm "-" ou espaços
+        if alelo_celula in ["-", ""]:
+            continue
+
+        # Separar múltiplos valores no campo de alelo
+        for main_alelo in alelo_celula.split(","):
+            main_alelo = main_alelo.strip()
+            if main_alelo in ["-", ""]:
+                continue
+
+            partes = interpretar_alelo(main_alelo)
+            if partes is None:
+                logger.warning("Alelo malformado ignorado: %s", main_alelo)
+                ignorados += 1
+                continue
+
+            # Converter o valor para float, substituindo vírgula por ponto
+            try:
+                valor = float(str(normal_value).replace(',', '.'))
+            except ValueError:
+                logger.warning("Valor incorreto para o alelo %s: %s", main_alelo, normal_value)
+                ignorados += 1
+                continue
+
+            linhas.append(LinhaAlelo(main_alelo, *partes, valor))
+    return linhas, ignorados
+
+
+def ler_relatorio(arquivo):
+    """
+    Lê e interpreta o relatório inteiro antes de qualquer gravação no banco.
+    Apenas a data do exame e as colunas de alelos e valores são lidas do arquivo.
+    """
+    data_exame, celulas = ler_celulas(arquivo)
+    try:
+        linhas, ignorados = extrair_linhas(celulas)
+    except Exception as e:
+        raise ErroRelatorio(f"Erro ao processar o arquivo Excel: {str(e)}")
+    return Relatorio(data_exame, linhas, ignorados)
+
+
+def ler_relatorio_bytes(nome, conteudo):
+    """
+    Versão de `ler_relatorio` para processos auxiliares: recebe o nome e o conteúdo do arquivo.
+    Este módulo não depende do Django para poder ser importado nesses processos.
+    """
+    arquivo = io.BytesIO(conteudo)
+    arquivo.name = nome
+    return ler_relatorio(arquivo)
@@ -0,0 +1,142 @@
+import importlib
+import json
+from collections import namedtuple
+
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+
+from .crossmatch import anexar_alelos
+from .leitura import CAMPOS_EXAME_ALELO
+
+# Formatos binários das respostas de crossmatch e de alelos: em vez de um dicionário
+# por alelo, os dados vão em colunas (Arrow IPC) ou em listas por coluna (MessagePack).
+# JSON continua sendo o padrão; o formato é escolhido pelo cabeçalho Accept. Os pacotes
+# msgpack e pyarrow são opcionais e importados apenas quando o formato é pedido.
+
+# Dados colunares de uma resposta: {nome da coluna: lista de valores} e metadados (JSON)
+Tabela = namedtuple('Tabela', ['colunas', 'metadados'])
+
+
+class MsgpackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    modulo = 'msgpack'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import msgpack
+
+        if isinstance(data, Tabela):
+            data = {'metadados': data.metadados, 'colunas': data.colunas}
+        return msgpack.packb(data, use_bin_type=True, default=str)
+
+
+class ArrowRenderer(BaseRenderer):
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+    modulo = 'pyarrow'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import pyarrow as pa
+
+        if not isinstance(data, Tabela):
+            # Respostas de erro (ex.: {"error": "..."}) viram uma tabela de uma linha
+            data = Tabela({chave: [str(valor)] for chave, valor in data.items()}, {})
+        colunas = {}
+        for nome, valores in data.colunas.items():
+            coluna = pa.array(valores)
+            # Textos repetidos (nomes de pacientes e alelos) são codificados como dicionário
+            colunas[nome] = coluna.dictionary_encode() if pa.types.is_string(coluna.type) else coluna
+        tabela = pa.table(colunas).replace_schema_metadata({'metadados': json.dumps(data.metadados, default=str)})
+
+        destino = pa.BufferOutputStream()
+        with pa.ipc.new_stream(destino, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+        return destino.getvalue().to_pybytes()
+
+
+# Renderizadores das views com suporte aos formatos binários
+RENDERIZADORES = [JSONRenderer, BrowsableAPIRenderer, ArrowRenderer, MsgpackRenderer]
+
+
+def formato_binario(request):
+    """
+    Retorna 'arrow' ou 'msgpack' se o cliente pediu um formato binário, ou None para JSON.
+    Responde 406 se a biblioteca do formato pedido não estiver instalada.
+    """
+    renderizador = getattr(request, 'accepted_renderer', None)
+    modulo = getattr(renderizador, 'modulo', None)
+    if modulo is None:
+        return None
+    try:
+        importlib.import_module(modulo)
+    except ImportError:
+        # O erro é devolvido em JSON, já que o formato pedido não pode ser gerado
+        request.accepted_renderer, request.accepted_media_type = JSONRenderer(), JSONRenderer.media_type
+        raise NotAcceptable(f"Formato {renderizador.media_type} indisponível: o pacote '{modulo}' não está instalado.")
+    return renderizador.format
+
+
+def tabela_crossmatch(pacientes_compatibilidade):
+    """
+    Resultado de `executar_crossmatch` com uma linha por alelo correspondente de cada paciente.
+    """
+    colunas = {'paciente_id': [], 'paciente_nome': [], 'alelo': [], 'valor': [], 'compatibilidade': []}
+    for paciente_id, dados in pacientes_compatibilidade.items():
+        for alelo in dados['alelos_correspondentes']:
+            colunas['paciente_id'].append(paciente_id)
+            colunas['paciente_nome'].append(dados['nome'])
+            colunas['alelo'].append(alelo['nome'])
+            colunas['valor'].append(alelo['valor'])
+            colunas['compatibilidade'].append(alelo['compatibilidade'])
+    return Tabela(colunas, {})
+
+
+def _tabela_exames_alelos(linhas):
+    nomes = ['id', 'alelo_id', 'alelo_nome', 'numero1', 'numero2', 'tipo', 'valor']
+    return Tabela({nome: [linha[i] for linha in linhas] for i, nome in enumerate(nomes)}, {})
+
+
+def tabela_exames_alelos(exames_alelos):
+    """
+    Alelos de um exame (mesmos campos de `ExameAleloSerializer`, com o alelo achatado).
+    """
+    return _tabela_exames_alelos(list(exames_alelos.values_list(*CAMPOS_EXAME_ALELO)))
+
+
+async def tabela_exames_alelos_async(exames_alelos):
+    return _tabela_exames_alelos([linha async for linha in exames_alelos.values_list(*CAMPOS_EXAME_ALELO)])
+
+
+def tabela_vxm(crossmatch):
+    """
+    Crossmatch gravado: os dados do doador vão nos metadados e cada alelo de cada paciente é
+    uma linha. Pacientes sem alelos aparecem em uma linha com os campos do alelo nulos.
+    """
+    colunas = {
+        'patient_id': [], 'patient_name': [], 'total_compatible_alleles': [], 'total_incompatible_alleles': [],
+        'allele_name': [], 'allele_value': [], 'compatibility': [],
+    }
+    for resultado in crossmatch.patient_results.all():
+        if not hasattr(resultado, 'alelos_resultado'):
+            anexar_alelos([resultado])
+        for alelo in resultado.alelos_resultado or [{}]:
+            colunas['patient_id'].append(resultado.patient_id)
+            colunas['patient_name'].append(resultado.patient_name)
+            colunas['total_compatible_alleles'].append(resultado.total_compatible_alleles)
+            colunas['total_incompatible_alleles'].append(resultado.total_incompatible_alleles)
+            for campo in ('allele_name', 'allele_value', 'compatibility'):
+                colunas[campo].append(alelo.get(campo))
+    metadados = {
+        'id': crossmatch.id,
+        'donor_id': crossmatch.donor_id,
+        'donor_name': crossmatch.donor_name,
+        'donor_sex': crossmatch.donor_sex,
+        'donor_birth_date': crossmatch.donor_birth_date.isoformat(),
+        'donor_blood_type': crossmatch.donor_blood_type,
+        'date_performed': crossmatch.date_performed.isoformat(),
+    }
+    return Tabela(colunas, metadados)
@@ -0,0 +1,72 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from .models import Paciente, Exame, ExameAlelo, ResumoPaciente
+from .crossmatch import LIMIAR_MFI
+from .versoes import EXAMES, incrementar_versao, registrar_escrita
+
+logger = logging.getLogger(__name__)
+
+# Quantidade de pacientes calculados por consulta na reconstrução completa
+TAMANHO_BLOCO = 500
+
+
+def _calcular(paciente_ids):
+    """
+    Calcula os resumos dos pacientes informados (apenas os que têm exames).
+    """
+    ultimos = {}
+    exames = (
+        Exame.objects.filter(paciente_id__in=paciente_ids)
+        .order_by('paciente_id', '-data_exame', 'id')
+        .values_list('paciente_id', 'id', 'data_exame')
+    )
+    for paciente_id, exame_id, data_exame in exames:
+        # O primeiro exame de cada paciente na ordenação é o mais recente
+        if paciente_id not in ultimos:
+            ultimos[paciente_id] = ResumoPaciente(paciente_id=paciente_id, ultimo_exame_id=exame_id, data_exame=data_exame)
+
+    por_exame = {resumo.ultimo_exame_id: resumo for resumo in ultimos.values()}
+    agregados = (
+        ExameAlelo.objects.filter(exame_id__in=list(por_exame))
+        .values('exame_id', 'alelo__tipo')
+        .annotate(maximo=Max('valor'), positivos=Count('id', filter=Q(valor__gte=LIMIAR_MFI)))
+        .order_by()
+    )
+    for agregado in agregados:
+        resumo = por_exame[agregado['exame_id']]
+        resumo.mfi_maximo[agregado['alelo__tipo']] = agregado['maximo']
+        resumo.positivos[agregado['alelo__tipo']] = agregado['positivos']
+        resumo.total_positivos += agregado['positivos']
+    return list(ultimos.values())
+
+
+def atualizar_resumos(paciente_ids):
+    """
+    Recalcula os resumos dos pacientes informados. Deve ser chamado na mesma
+    transação que alterou seus exames, para que o resumo nunca fique defasado.
+    """
+    paciente_ids = list(paciente_ids)
+    with transaction.atomic():
+        ResumoPaciente.objects.filter(paciente_id__in=paciente_ids).delete()
+        ResumoPaciente.objects.bulk_create(_calcular(paciente_ids))
+
+
+def reconstruir_resumos():
+    """
+    Apaga e recalcula os resumos de todos os pacientes. Retorna a quantidade de resumos.
+    """
+    total = 0
+    with transaction.atomic():
+        ResumoPaciente.objects.all().delete()
+        paciente_ids = list(Paciente.objects.filter(exames__isnull=False).distinct().order_by('id').values_list('id', flat=True))
+        for inicio in range(0, len(paciente_ids), TAMANHO_BLOCO):
+            resumos = ResumoPaciente.objects.bulk_create(_calcular(paciente_ids[inicio:inicio + TAMANHO_BLOCO]))
+            total += len(resumos)
+        # Os motores de crossmatch leem o último exame do resumo: força a recarga em todos os processos
+        incrementar_versao()
+        registrar_escrita(EXAMES)
+    logger.info("Resumos de pacientes reconstruídos: %d", total)
+    return total
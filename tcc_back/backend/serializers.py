@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import Paciente, Exame, Alelo, ExameAlelo, Crossmatch, CrossmatchPatientResult, CrossmatchAlleleResult
+from .models import Paciente, Exame, Alelo, ExameAlelo, ResumoPaciente, CpraPaciente, Crossmatch, CrossmatchPatientResult, CrossmatchAlleleResult, Tarefa
 from django.contrib.auth.models import User
+from .crossmatch import anexar_alelos
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,6 +20,24 @@ class PacienteSerializer(serializers.ModelSerializer):
         model = Paciente
         fields = ['id', 'nome', 'data_nascimento', 'tipo_sanguineo']
 
+class ResumoPacienteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ResumoPaciente
+        fields = ['ultimo_exame_id', 'data_exame', 'mfi_maximo', 'positivos', 'total_positivos']
+
+
+class PacienteSensibilizacaoSerializer(PacienteSerializer):
+    # Pacientes sem exames não têm resumo e recebem `sensibilizacao: null`
+    sensibilizacao = ResumoPacienteSerializer(source='resumo', read_only=True, allow_null=True)
+
+    class Meta(PacienteSerializer.Meta):
+        fields = PacienteSerializer.Meta.fields + ['sensibilizacao']
+
+class CpraPacienteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CpraPaciente
+        fields = ['paciente_id', 'cpra', 'antigenos_inaceitaveis', 'ultimo_exame_id', 'painel', 'calculado_em']
+
 class ExameSerializer(serializers.ModelSerializer):
     class Meta:
         model = Exame
@@ -44,12 +63,19 @@ class CrossmatchAlleleResultSerializer(serializers.ModelSerializer):
 
 
 class CrossmatchPatientResultSerializer(serializers.ModelSerializer):
-    allele_results = CrossmatchAlleleResultSerializer(many=True, read_only=True)
+    # Mesmo formato de CrossmatchAlleleResultSerializer, lido dos arrays empacotados
+    # (ou das linhas de CrossmatchAlleleResult nos resultados gravados no formato antigo)
+    allele_results = serializers.SerializerMethodField()
 
     class Meta:
         model = CrossmatchPatientResult
         fields = ['patient_id', 'patient_name', 'total_compatible_alleles', 'total_incompatible_alleles', 'allele_results']
 
+    def get_allele_results(self, resultado):
+        if not hasattr(resultado, 'alelos_resultado'):
+            anexar_alelos([resultado])
+        return resultado.alelos_resultado
+
 
 class CrossmatchSerializer(serializers.ModelSerializer):
     patient_results = CrossmatchPatientResultSerializer(many=True, read_only=True)
@@ -57,3 +83,23 @@ class CrossmatchSerializer(serializers.ModelSerializer):
     class Meta:
         model = Crossmatch
         fields = ['id', 'donor_id', 'donor_name', 'donor_sex', 'donor_birth_date', 'donor_blood_type', 'date_performed', 'patient_results']
+
+
+class CrossmatchPatientResultResumoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CrossmatchPatientResult
+        fields = ['patient_id', 'patient_name', 'total_compatible_alleles', 'total_incompatible_alleles']
+
+
+class CrossmatchResumoSerializer(serializers.ModelSerializer):
+    patient_results = CrossmatchPatientResultResumoSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Crossmatch
+        fields = ['id', 'donor_id', 'donor_name', 'donor_sex', 'donor_birth_date', 'donor_blood_type', 'date_performed', 'patient_results']
+
+
+class TarefaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tarefa
+        fields = ['id', 'tipo', 'status', 'tentativas', 'max_tentativas', 'erro', 'criada_em', 'iniciada_em', 'concluida_em', 'status_http', 'resultado']
@@ -0,0 +1,301 @@
+import io
+import json
+import logging
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    Paciente, Exame, Alelo, ExameAlelo, ResumoPaciente, CpraPaciente,
+    Crossmatch, CrossmatchPatientResult, CrossmatchAlleleResult,
+)
+from .crossmatch import LIMIAR_MFI, empacotar_alelos
+from .cpra import ErroPainel, calcular_cpra
+from .resumos import reconstruir_resumos
+from .versoes import DADOS, PACIENTES, EXAMES, CROSSMATCHES, incrementar_versao, registrar_escrita
+
+logger = logging.getLogger(__name__)
+
+# Gerador de uma base sintética com o formato de um grande centro transplantador. As linhas
+# são gravadas diretamente nas tabelas (COPY no PostgreSQL, INSERT em lote nos demais
+# bancos), sem instanciar modelos. A mesma semente e a mesma escala geram os mesmos dados.
+
+# Painel de antígenos únicos (single antigen) completo: todos os alelos em todos os exames
+PAINEL_SAB = {
+    'A*': [(n, 1) for n in (1, 2, 3, 11, 23, 24, 25, 26, 29, 30, 31, 32, 33, 34, 36, 43, 66, 68, 69, 74, 80)],
+    'B*': [(n, 1) for n in (7, 8, 13, 14, 15, 18, 27, 35, 37, 38, 39, 40, 41, 42, 44, 45, 46, 47, 48, 49, 50,
+                            51, 52, 53, 54, 55, 56, 57, 58, 59, 67, 73, 78, 81, 82)],
+    'C*': [(n, 2) for n in (1, 2, 3, 4, 5, 6, 7, 8, 12, 14, 15, 16, 17, 18)],
+    'DRB1*': [(n, 1) for n in (1, 3, 4, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16)],
+    'DQB1*': [(n, 1) for n in (2, 3, 4, 5, 6)] + [(n, 2) for n in (2, 3, 5, 6)],
+    'DPB1*': [(n, 1) for n in (1, 2, 3, 4, 5, 6, 9, 10, 11, 13, 14, 17, 18, 19)],
+}
+
+# Frequência dos tipos sanguíneos na população
+TIPOS_SANGUINEOS = {'O+': 0.36, 'A+': 0.34, 'B+': 0.08, 'AB+': 0.025, 'O-': 0.09, 'A-': 0.08, 'B-': 0.02, 'AB-': 0.005}
+
+# Mediana do MFI de fundo (alelos negativos) por locus; classe II tem fundo mais alto
+FUNDO_MFI = {'A*': 150, 'B*': 200, 'C*': 100, 'DR': 250, 'DQ': 350, 'DP': 150}
+# MFI mediano dos alelos positivos
+MFI_POSITIVO = 6000
+MFI_MAXIMO = 25000
+
+# Perfis de sensibilização: (fração dos pacientes, fração dos alelos do painel positivos)
+PERFIS_SENSIBILIZACAO = [(0.55, 0.01), (0.30, 0.10), (0.15, 0.45)]
+
+# Volume da escala 1: pacientes e crossmatches gravados (cerca de dez anos de um por semana)
+PACIENTES_POR_ESCALA = 5000
+CROSSMATCHES_POR_ESCALA = 520
+# Período coberto pelos exames e pelo histórico de crossmatches
+INICIO_HISTORICO = date(2015, 1, 1)
+FIM_HISTORICO = date(2025, 1, 1)
+
+PRIMEIROS_NOMES = [
+    'Ana', 'Maria', 'Joana', 'Beatriz', 'Fernanda', 'Juliana', 'Camila', 'Patrícia', 'Luiza', 'Helena',
+    'João', 'José', 'Carlos', 'Paulo', 'Pedro', 'Lucas', 'Marcos', 'Rafael', 'Gabriel', 'Antônio',
+]
+SOBRENOMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima', 'Gomes',
+    'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes', 'Vieira', 'Barbosa',
+]
+
+
+def _texto_copy(valor):
+    # Formato texto do COPY: \N para nulo e barras, tabulações e quebras de linha escapadas
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(valor).hex()
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, (dict, list)):
+        valor = json.dumps(valor)
+    texto = str(valor)
+    if isinstance(valor, str):
+        texto = texto.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return texto
+
+
+class Carregador:
+    """
+    Grava linhas (tuplas na ordem de `colunas`) diretamente nas tabelas: com COPY FROM STDIN
+    no PostgreSQL ou com um INSERT executado em lote (executemany) nos demais bancos.
+    """
+
+    TIPOS_NATIVOS = {'AutoField', 'BigAutoField', 'IntegerField', 'BigIntegerField', 'FloatField', 'ForeignKey', 'BooleanField'}
+
+    def __init__(self, usar_copy=None):
+        self.usar_copy = connection.vendor == 'postgresql' if usar_copy is None else usar_copy
+        self.linhas = Counter()
+
+    def proximo_id(self, modelo):
+        ultimo = modelo.objects.order_by('-pk').values_list('pk', flat=True).first()
+        return (ultimo or 0) + 1
+
+    def inserir(self, modelo, colunas, linhas):
+        campos = [modelo._meta.get_field(coluna) for coluna in colunas]
+        tabela = connection.ops.quote_name(modelo._meta.db_table)
+        nomes = ', '.join(connection.ops.quote_name(campo.column) for campo in campos)
+        with connection.cursor() as cursor:
+            if self.usar_copy:
+                texto = ''.join('\t'.join(_texto_copy(valor) for valor in linha) + '\n' for linha in linhas)
+                quantidade = texto.count('\n')
+                sql = f"COPY {tabela} ({nomes}) FROM STDIN"
+                bruto = cursor.cursor
+                if hasattr(bruto, 'copy_expert'):  # psycopg2
+                    bruto.copy_expert(sql, io.StringIO(texto))
+                else:  # psycopg 3
+                    with bruto.copy(sql) as copia:
+                        copia.write(texto)
+            else:
+                # Apenas colunas que não são números precisam da conversão do campo (datas, binários, JSON)
+                conversores = [
+                    None if campo.get_internal_type() in self.TIPOS_NATIVOS
+                    else (lambda valor, campo=campo: campo.get_db_prep_value(valor, connection))
+                    for campo in campos
+                ]
+                if any(conversores):
+                    linhas = [
+                        tuple(valor if conversor is None else conversor(valor) for conversor, valor in zip(conversores, linha))
+                        for linha in linhas
+                    ]
+                linhas = list(linhas)
+                quantidade = len(linhas)
+                sql = f"INSERT INTO {tabela} ({nomes}) VALUES ({', '.join(['%s'] * len(campos))})"
+                cursor.executemany(sql, linhas)
+        self.linhas[modelo._meta.db_table] += quantidade
+
+    def reiniciar_sequencias(self, modelos):
+        """
+        Ajusta as sequências de ids após inserir linhas com ids explícitos (PostgreSQL).
+        """
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), modelos):
+                cursor.execute(sql)
+
+
+def limpar_dados():
+    """
+    Apaga pacientes, exames e crossmatches (os alelos do catálogo são mantidos).
+    """
+    # DELETE direto em cada tabela, das dependentes para as referenciadas, sem carregar as
+    # linhas nem percorrer a cascata do ORM
+    with transaction.atomic(), connection.cursor() as cursor:
+        for modelo in (ExameAlelo, CrossmatchAlleleResult, CrossmatchPatientResult, Crossmatch,
+                       ResumoPaciente, CpraPaciente, Exame, Paciente):
+            cursor.execute(f"DELETE FROM {connection.ops.quote_name(modelo._meta.db_table)}")
+        # Caches, ETags e a matriz MFI dos processos em execução
+        registrar_escrita(DADOS, PACIENTES, EXAMES, CROSSMATCHES)
+
+
+def _alelos_do_painel():
+    """
+    Garante que os alelos do painel existam e retorna (ids, índice do locus de cada alelo, loci).
+    """
+    novos = [
+        Alelo(nome=f"{locus}{numero1:02d}:{numero2:02d}", tipo=locus[:2], numero1=numero1, numero2=numero2)
+        for locus, alelos in PAINEL_SAB.items() for numero1, numero2 in alelos
+    ]
+    Alelo.objects.bulk_create(novos, ignore_conflicts=True)
+    ids = dict(Alelo.objects.filter(nome__in=[alelo.nome for alelo in novos]).values_list('nome', 'id'))
+    loci = list(FUNDO_MFI)
+    return (
+        np.array([ids[alelo.nome] for alelo in novos], dtype=np.int64),
+        np.array([loci.index(alelo.tipo) for alelo in novos]),
+        loci,
+    )
+
+
+def _valores_mfi(gerador, positivos, indices_loci, loci):
+    """
+    MFI de uma matriz de exames x alelos: ruído de fundo log-normal por locus e, nos
+    alelos positivos, valores altos limitados à saturação do equipamento.
+    """
+    fundo = np.array([FUNDO_MFI[locus] for locus in loci], dtype=np.float64)[indices_loci]
+    valores = gerador.lognormal(np.log(fundo), 0.8, size=positivos.shape)
+    altos = gerador.lognormal(np.log(MFI_POSITIVO), 0.6, size=positivos.shape)
+    return np.round(np.minimum(np.where(positivos, altos, valores), MFI_MAXIMO), 2)
+
+
+def gerar_dataset(semente=42, escala=1.0, lote=1000, carregador=None, progresso=None):
+    """
+    Gera pacientes, exames com o painel completo e o histórico de crossmatches.
+    Retorna a quantidade de linhas gravadas por tabela.
+    """
+    carregador = carregador or Carregador()
+    progresso = progresso or (lambda mensagem: None)
+    gerador = np.random.default_rng(semente)
+    alelo_ids, indices_loci, loci = _alelos_do_painel()
+    tipos, frequencias = list(TIPOS_SANGUINEOS), np.array(list(TIPOS_SANGUINEOS.values()))
+    frequencias /= frequencias.sum()
+    dias_historico = (FIM_HISTORICO - INICIO_HISTORICO).days
+
+    total_pacientes = max(1, round(PACIENTES_POR_ESCALA * escala))
+    primeiro_paciente = carregador.proximo_id(Paciente)
+    proximo_exame = carregador.proximo_id(Exame)
+    proximo_exame_alelo = carregador.proximo_id(ExameAlelo)
+
+    # Dados dos pacientes usados depois no histórico de crossmatches
+    perfis = gerador.choice([taxa for _, taxa in PERFIS_SENSIBILIZACAO], size=total_pacientes,
+                            p=[fracao for fracao, _ in PERFIS_SENSIBILIZACAO])
+    tipos_pacientes = gerador.choice(len(tipos), size=total_pacientes, p=frequencias)
+    nomes = [
+        f"{PRIMEIROS_NOMES[a]} {SOBRENOMES[b]} {SOBRENOMES[c]}"
+        for a, b, c in zip(gerador.integers(len(PRIMEIROS_NOMES), size=total_pacientes),
+                           gerador.integers(len(SOBRENOMES), size=total_pacientes),
+                           gerador.integers(len(SOBRENOMES), size=total_pacientes))
+    ]
+
+    for inicio in range(0, total_pacientes, lote):
+        fim = min(inicio + lote, total_pacientes)
+        pacientes, exames, exames_alelos = [], [], []
+        nascimentos = gerador.integers(0, 75 * 365, size=fim - inicio)
+        quantidades = np.minimum(1 + gerador.poisson(2, size=fim - inicio), 8)
+        for i, deslocamento, quantidade in zip(range(inicio, fim), nascimentos, quantidades):
+            paciente_id = primeiro_paciente + i
+            pacientes.append((paciente_id, nomes[i], date(1940, 1, 1) + timedelta(days=int(deslocamento)), tipos[tipos_pacientes[i]]))
+
+            # Especificidades do paciente: positivas em todos os exames, com variação entre eles
+            positivos = gerador.random(len(alelo_ids)) < perfis[i]
+            matriz = _valores_mfi(gerador, np.broadcast_to(positivos, (quantidade, len(alelo_ids))), indices_loci, loci)
+            dia = int(gerador.integers(0, dias_historico - 200 * quantidade))
+            for k in range(quantidade):
+                exames.append((proximo_exame, paciente_id, INICIO_HISTORICO + timedelta(days=dia)))
+                exames_alelos.extend(zip(range(proximo_exame_alelo, proximo_exame_alelo + len(alelo_ids)),
+                                         [proximo_exame] * len(alelo_ids), alelo_ids.tolist(), matriz[k].tolist()))
+                proximo_exame_alelo += len(alelo_ids)
+                proximo_exame += 1
+                dia += int(gerador.integers(60, 200))
+
+        with transaction.atomic():
+            carregador.inserir(Paciente, ['id', 'nome', 'data_nascimento', 'tipo_sanguineo'], pacientes)
+            carregador.inserir(Exame, ['id', 'paciente_id', 'data_exame'], exames)
+            carregador.inserir(ExameAlelo, ['id', 'exame_id', 'alelo_id', 'valor'], exames_alelos)
+        progresso(f"Pacientes {fim}/{total_pacientes}: {len(exames)} exames, {len(exames_alelos)} alelos")
+
+    # Histórico de crossmatches: doadores tipados em dois alelos por locus e, para cada um,
+    # os candidatos do mesmo tipo sanguíneo avaliados naquela data
+    total_crossmatches = round(CROSSMATCHES_POR_ESCALA * escala)
+    primeiro_crossmatch = carregador.proximo_id(Crossmatch)
+    proximo_resultado = carregador.proximo_id(CrossmatchPatientResult)
+    pacientes_por_tipo = [np.flatnonzero(tipos_pacientes == t) for t in range(len(tipos))]
+    datas = np.sort(gerador.integers(0, dias_historico * 24 * 3600, size=total_crossmatches))
+    inicio_historico = datetime.combine(INICIO_HISTORICO, datetime.min.time())
+    if settings.USE_TZ:
+        inicio_historico = timezone.make_aware(inicio_historico, timezone.get_default_timezone())
+    posicoes_locus = [np.flatnonzero(indices_loci == i) for i in range(len(loci))]
+
+    for inicio in range(0, total_crossmatches, max(1, lote // 10)):
+        fim = min(inicio + max(1, lote // 10), total_crossmatches)
+        crossmatches, resultados = [], []
+        for j in range(inicio, fim):
+            crossmatch_id = primeiro_crossmatch + j
+            tipo = int(gerador.choice(len(tipos), p=frequencias))
+            crossmatches.append((
+                crossmatch_id, 100000 + crossmatch_id, f"Doador {crossmatch_id:06d}", str(gerador.choice(['M', 'F'])),
+                date(1950, 1, 1) + timedelta(days=int(gerador.integers(0, 55 * 365))), tipos[tipo],
+                inicio_historico + timedelta(seconds=int(datas[j])),
+            ))
+            tipagem = np.concatenate([gerador.choice(posicoes, 2, replace=False) for posicoes in posicoes_locus if len(posicoes) >= 2])
+            candidatos = pacientes_por_tipo[tipo]
+            if not len(candidatos):
+                continue
+            candidatos = gerador.choice(candidatos, size=min(len(candidatos), int(gerador.integers(20, 200))), replace=False)
+            positivos = gerador.random((len(candidatos), len(tipagem))) < perfis[candidatos][:, None]
+            valores = _valores_mfi(gerador, positivos, indices_loci[tipagem], loci)
+            for paciente, linha in zip(candidatos.tolist(), valores):
+                compatibilidades = linha < LIMIAR_MFI
+                alelos, mfi, bits = empacotar_alelos(alelo_ids[tipagem], linha, compatibilidades)
+                resultados.append((
+                    proximo_resultado, crossmatch_id, primeiro_paciente + paciente, nomes[paciente],
+                    int(compatibilidades.sum()), int((~compatibilidades).sum()), alelos, mfi, bits,
+                ))
+                proximo_resultado += 1
+
+        with transaction.atomic():
+            carregador.inserir(Crossmatch, ['id', 'donor_id', 'donor_name', 'donor_sex', 'donor_birth_date',
+                                            'donor_blood_type', 'date_performed'], crossmatches)
+            carregador.inserir(CrossmatchPatientResult, ['id', 'crossmatch_id', 'patient_id', 'patient_name',
+                                                         'total_compatible_alleles', 'total_incompatible_alleles',
+                                                         'alelos', 'valores', 'compatibilidades'], resultados)
+        progresso(f"Crossmatches {fim}/{total_crossmatches}: {len(resultados)} resultados de pacientes")
+
+    carregador.reiniciar_sequencias([Paciente, Exame, ExameAlelo, Crossmatch, CrossmatchPatientResult])
+
+    # Dados derivados e versões (caches, ETags e a matriz MFI dos processos em execução)
+    progresso("Reconstruindo os resumos dos pacientes")
+    reconstruir_resumos()
+    try:
+        calcular_cpra()
+    except ErroPainel:
+        logger.info("cPRA não calculado: painel de doadores não configurado.")
+    for chave in (DADOS, PACIENTES, EXAMES, CROSSMATCHES):
+        incrementar_versao(chave)
+    return dict(carregador.linhas)
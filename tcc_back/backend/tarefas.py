@@ -0,0 +1,243 @@
+import io
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils.timezone import now
+
+from .models import Paciente, Tarefa, Trava
+from .crossmatch import executar_crossmatch, salvar_resultado, carregar_crossmatch
+from .ingestao import gravar_exame
+from .cpra import ErroPainel, calcular_cpra
+from .serializers import CrossmatchSerializer
+from .relatorios import ErroRelatorio, ler_relatorio
+
+logger = logging.getLogger(__name__)
+
+# Trava (registro de `Trava`) usada para serializar a reserva de tarefas entre os workers
+TRAVA_FILA = 'fila_tarefas'
+
+
+def enfileirar(tipo, parametros, arquivo=None):
+    """
+    Cria uma tarefa pendente. `arquivo` é o arquivo enviado na requisição, se houver.
+    """
+    tarefa = Tarefa.objects.create(
+        tipo=tipo,
+        parametros=parametros,
+        arquivo=arquivo.read() if arquivo else None,
+        arquivo_nome=arquivo.name if arquivo else '',
+        max_tentativas=getattr(settings, 'TAREFAS_MAX_TENTATIVAS', 3),
+    )
+    logger.info("Tarefa %s (%s) enfileirada", tarefa.id, tipo)
+    return tarefa
+
+
+# --- Executores ---------------------------------------------------------------
+# Cada executor retorna (status_http, corpo) como a view síncrona correspondente. Uma tarefa
+# pode ser executada mais de uma vez (repetição após erro ou reserva perdida): as escritas
+# passam por `_gravar_uma_vez`, que registra o seu efeito na tarefa na mesma transação.
+
+def _gravar_uma_vez(tarefa, gravar):
+    """
+    Executa a escrita `gravar()`, que retorna um registro serializável em JSON do que foi
+    gravado, e guarda esse registro em `Tarefa.efeito` na mesma transação. Se uma execução
+    anterior da tarefa já gravou, retorna o registro dela sem gravar de novo.
+    """
+    with transaction.atomic():
+        # A trava da tarefa serializa execuções simultâneas (ex.: a de um worker que perdeu a reserva)
+        efeito = Tarefa.objects.select_for_update().filter(id=tarefa.id).values_list('efeito', flat=True).first()
+        if efeito is not None:
+            logger.info("Tarefa %s: escrita já feita por uma execução anterior", tarefa.id)
+            return efeito
+        efeito = gravar()
+        Tarefa.objects.filter(id=tarefa.id).update(efeito=efeito)
+    return efeito
+
+
+def executar_upload_excel(tarefa):
+    arquivo = io.BytesIO(bytes(tarefa.arquivo))
+    arquivo.name = tarefa.arquivo_nome
+    try:
+        relatorio = ler_relatorio(arquivo)
+    except ErroRelatorio as e:
+        return 400, {"error": str(e)}
+
+    paciente = Paciente.objects.filter(id=tarefa.parametros['patient_id']).first()
+    if paciente is None:
+        return 404, {"error": "Paciente não encontrado"}
+
+    resultado = _gravar_uma_vez(tarefa, lambda: gravar_exame(paciente, relatorio))
+    return 201, {"message": "Exame e alelos processados com sucesso.", **resultado}
+
+
+def executar_virtual_crossmatch(tarefa):
+    try:
+        pacientes_compatibilidade = executar_crossmatch(
+            tarefa.parametros.get('alelos', []), tarefa.parametros.get('donor_blood_type')
+        )
+    except (KeyError, ValueError, TypeError) as e:
+        return 400, {"error": f"Dados de doador inválidos: {str(e)}"}
+    if pacientes_compatibilidade is None:
+        return 404, {"message": "Nenhum paciente encontrado com o tipo sanguíneo compatível."}
+    if tarefa.parametros.get('persist'):
+        efeito = _gravar_uma_vez(tarefa, lambda: {
+            'crossmatch_id': salvar_resultado(tarefa.parametros, pacientes_compatibilidade).id,
+        })
+        return 201, CrossmatchSerializer(carregar_crossmatch(efeito['crossmatch_id'])).data
+    return 200, pacientes_compatibilidade
+
+
+def executar_calcular_cpra(tarefa):
+    try:
+        calculados = calcular_cpra(tarefa.parametros.get('paciente_ids'))
+    except ErroPainel as e:
+        return 503, {"error": str(e)}
+    return 200, {"calculados": calculados}
+
+
+EXECUTORES = {
+    'upload_excel': executar_upload_excel,
+    'virtual_crossmatch': executar_virtual_crossmatch,
+    'calcular_cpra': executar_calcular_cpra,
+}
+
+
+# --- Fila -----------------------------------------------------------------------
+# Cada execução é uma reserva (lease): o worker renova `ultimo_sinal` periodicamente e, se
+# deixar de renovar por `TAREFAS_TEMPO_LIMITE` segundos (ex.: o processo foi encerrado), a
+# tarefa volta à fila na próxima reserva de qualquer worker. A tentativa em que a reserva foi
+# obtida identifica o dono: um worker que perdeu a reserva não grava mais o resultado.
+
+def _tempo_limite():
+    return getattr(settings, 'TAREFAS_TEMPO_LIMITE', 120)
+
+
+def recuperar_abandonadas():
+    """
+    Devolve à fila as tarefas em execução sem sinal de vida há mais que `TAREFAS_TEMPO_LIMITE`
+    segundos; as que já esgotaram as tentativas são marcadas como falha.
+    """
+    limite = now() - timedelta(seconds=_tempo_limite())
+    abandonadas = Tarefa.objects.filter(status=Tarefa.EXECUTANDO, ultimo_sinal__lt=limite)
+    falhas = abandonadas.filter(tentativas__gte=F('max_tentativas')).update(
+        status=Tarefa.FALHOU, erro="Tempo limite de execução excedido.", concluida_em=now()
+    )
+    devolvidas = abandonadas.update(status=Tarefa.PENDENTE, disponivel_em=now())
+    if falhas or devolvidas:
+        logger.warning("Tarefas abandonadas: %d devolvidas à fila, %d marcadas como falha", devolvidas, falhas)
+
+
+def reservar_proxima():
+    """
+    Reserva a próxima tarefa disponível, respeitando o limite global de tarefas
+    simultâneas (`TAREFAS_CONCORRENCIA_MAXIMA`). Antes disso, devolve à fila as tarefas
+    abandonadas, que deixariam de ocupar o limite. Retorna None se não houver.
+    """
+    with transaction.atomic():
+        # Trava um registro fixo para que a recuperação, a contagem e a reserva sejam atômicas
+        # entre os workers. Um UPDATE (em vez de SELECT ... FOR UPDATE) também trava o SQLite.
+        if not Trava.objects.filter(chave=TRAVA_FILA).update(obtida_em=now()):
+            Trava.objects.get_or_create(chave=TRAVA_FILA)
+            Trava.objects.filter(chave=TRAVA_FILA).update(obtida_em=now())
+
+        recuperar_abandonadas()
+        executando = Tarefa.objects.filter(status=Tarefa.EXECUTANDO).count()
+        if executando >= getattr(settings, 'TAREFAS_CONCORRENCIA_MAXIMA', 4):
+            return None
+
+        tarefa = (
+            Tarefa.objects.filter(status=Tarefa.PENDENTE, disponivel_em__lte=now())
+            .order_by('disponivel_em', 'id')
+            .first()
+        )
+        if tarefa is None:
+            return None
+        inicio = now()
+        Tarefa.objects.filter(id=tarefa.id).update(
+            status=Tarefa.EXECUTANDO, iniciada_em=inicio, ultimo_sinal=inicio, tentativas=F('tentativas') + 1
+        )
+    tarefa.refresh_from_db()
+    return tarefa
+
+
+def _da_reserva(tarefa):
+    # Registro da tarefa enquanto esta execução (tentativa) ainda é a dona da reserva
+    return Tarefa.objects.filter(id=tarefa.id, status=Tarefa.EXECUTANDO, tentativas=tarefa.tentativas)
+
+
+def renovar_reserva(tarefa):
+    """
+    Atualiza o sinal de vida da execução. Retorna False se a reserva foi perdida.
+    """
+    return bool(_da_reserva(tarefa).update(ultimo_sinal=now()))
+
+
+@contextmanager
+def manter_reserva(tarefa):
+    """
+    Renova a reserva em uma thread a cada quarto de `TAREFAS_TEMPO_LIMITE` enquanto o bloco executa.
+    """
+    parar = threading.Event()
+
+    def renovar():
+        try:
+            while not parar.wait(_tempo_limite() / 4):
+                if not renovar_reserva(tarefa):
+                    logger.warning("Tarefa %s: reserva perdida durante a execução", tarefa.id)
+                    break
+        except DatabaseError as e:
+            logger.error("Tarefa %s: erro ao renovar a reserva: %s", tarefa.id, e)
+        finally:
+            connection.close()  # Conexão própria desta thread
+
+    thread = threading.Thread(target=renovar, name=f'reserva-tarefa-{tarefa.id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        parar.set()
+        thread.join()
+
+
+def _concluir(tarefa, **campos):
+    # Grava o fim da execução apenas se a reserva ainda pertence a ela
+    if not _da_reserva(tarefa).update(**campos):
+        logger.warning("Tarefa %s (tentativa %d): reserva perdida, resultado descartado", tarefa.id, tarefa.tentativas)
+        tarefa.refresh_from_db()
+        return False
+    for campo, valor in campos.items():
+        setattr(tarefa, campo, valor)
+    return True
+
+
+def executar_tarefa(tarefa):
+    """
+    Executa uma tarefa reservada, renovando a reserva enquanto executa. Erros inesperados
+    são repetidos com espera exponencial até `max_tentativas`; depois disso a tarefa é
+    marcada como falha.
+    """
+    try:
+        with manter_reserva(tarefa):
+            status_http, resultado = EXECUTORES[tarefa.tipo](tarefa)
+    except Exception as e:
+        logger.error("Erro na tarefa %s (tentativa %d): %s", tarefa.id, tarefa.tentativas, e)
+        if tarefa.tentativas < tarefa.max_tentativas:
+            _concluir(tarefa, status=Tarefa.PENDENTE, erro=str(e),
+                      disponivel_em=now() + timedelta(seconds=2 ** tarefa.tentativas))
+        else:
+            _concluir(tarefa, status=Tarefa.FALHOU, erro=str(e), concluida_em=now())
+        return tarefa
+
+    concluida = _concluir(
+        tarefa, status=Tarefa.CONCLUIDA, status_http=status_http, resultado=resultado,
+        arquivo=None,  # O arquivo não é mais necessário
+        concluida_em=now(),
+    )
+    if concluida:
+        logger.info("Tarefa %s concluída com status %s", tarefa.id, status_http)
+    return tarefa
@@ -1,3 +1,1913 @@
-from django.test import TestCase
+import csv
+import glob
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .cpra import calcular_cpra, cpra_atual
+from .crossmatch import (
+    LIMIAR_MFI, MatrizMFI, ultimos_exames, pares_do_doador, crossmatch_pandas, crossmatch_sql, cache_resultados,
+    executar_crossmatch, executar_crossmatch_lote, salvar_resultado, carregar_crossmatch, empacotar_alelos,
+    desempacotar_alelos,
+)
+from .exclusao import excluir_pacientes
+from .ingestao import gravar_exame, importar_lote, preparar_lote
+from .logs import FiltroAmostragem, FormatadorJSON, FormatadorTexto, ManipuladorFila
+from .models import (
+    Paciente, Exame, Alelo, ExameAlelo, Crossmatch, CrossmatchPatientResult, CrossmatchAlleleResult, CpraPaciente,
+    ResumoPaciente, Tarefa, Trava,
+)
+from .paginacao import LIMITE_PADRAO, paginar
+from .relatorios import (
+    LINHA_INICIAL_ALELOS, COLUNA_VALOR, COLUNA_ALELO, DESLOCAMENTO_DATA, ErroRelatorio, LinhaAlelo, Relatorio,
+    interpretar_alelo, ler_relatorio_bytes,
+)
+from .resumos import reconstruir_resumos
+from .serializers import CrossmatchSerializer, PacienteSerializer
+from .sinteticos import PAINEL_SAB, Carregador, gerar_dataset, limpar_dados
+from .tarefas import enfileirar
+from . import ingestao, metricas, tarefas
+from .versoes import incrementar_versao, obter_versao, registrar_escrita
+from . import views, views_async
+
+TIPOS_SANGUINEOS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+LOCI = ['A*', 'B*', 'C*', 'DR', 'DQ', 'DP']
+
+
+class IndicesConsultasTest(TestCase):
+    """
+    Verifica com EXPLAIN que a consulta principal de cada view usa um índice,
+    e não uma varredura completa da tabela, com um volume de dados realista.
+    """
+
+    PACIENTES = 1000
+    EXAMES_POR_PACIENTE = 2
+    ALELOS_POR_EXAME = 40
+
+    @classmethod
+    def setUpTestData(cls):
+        aleatorio = random.Random(42)
+        Alelo.objects.bulk_create([
+            Alelo(nome=f"{locus}{numero1:02d}:{numero2:02d}", tipo=locus, numero1=numero1, numero2=numero2)
+            for locus in LOCI for numero1 in range(1, 41) for numero2 in range(1, 3)
+        ])
+        alelos = list(Alelo.objects.values_list('id', flat=True))
+
+        Paciente.objects.bulk_create([
+            Paciente(nome=f"Paciente {i:05d}", data_nascimento=date(1950, 1, 1) + timedelta(days=i * 7),
+                     tipo_sanguineo=aleatorio.choice(TIPOS_SANGUINEOS))
+            for i in range(cls.PACIENTES)
+        ])
+        Exame.objects.bulk_create([
+            Exame(paciente_id=paciente_id, data_exame=date(2020, 1, 1) + timedelta(days=aleatorio.randint(0, 1500)))
+            for paciente_id in Paciente.objects.values_list('id', flat=True)
+            for _ in range(cls.EXAMES_POR_PACIENTE)
+        ])
+        ExameAlelo.objects.bulk_create([
+            ExameAlelo(exame_id=exame_id, alelo_id=alelo_id, valor=aleatorio.uniform(0, 15000))
+            for exame_id in Exame.objects.values_list('id', flat=True)
+            for alelo_id in aleatorio.sample(alelos, cls.ALELOS_POR_EXAME)
+        ], batch_size=5000)
+        reconstruir_resumos()
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.paciente = Paciente.objects.order_by('id').first()
+        cls.exame = Exame.objects.filter(paciente=cls.paciente).first()
+
+    def plano(self, sql, parametros=()):
+        prefixo = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Em tabelas pequenas o PostgreSQL pode preferir a varredura mesmo com índice;
+                # desabilitá-la mostra se existe um índice capaz de atender a consulta.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(prefixo + sql, parametros)
+            return '\n'.join(str(linha[-1]) for linha in cursor.fetchall())
+
+    def assertUsaIndice(self, consulta, tabela, parametros=()):
+        if not isinstance(consulta, str):
+            consulta, parametros = consulta.query.sql_with_params()
+        plano = self.plano(consulta, parametros)
+        if connection.vendor == 'sqlite':
+            varreduras = [linha for linha in plano.splitlines() if linha.strip() == f"SCAN {tabela}"]
+            self.assertFalse(varreduras, f"Varredura completa de {tabela}:\n{plano}")
+            self.assertIn(tabela, plano)
+        else:
+            self.assertNotIn(f"Seq Scan on {tabela}", plano, plano)
+
+    def test_lista_pacientes_usa_indice_de_ordenacao(self):
+        pagina = Paciente.objects.order_by('nome', 'id')[:51]
+        self.assertUsaIndice(pagina, 'pacientes')
+
+    def test_lista_pacientes_pagina_seguinte_usa_indice(self):
+        _, cursor = paginar(Paciente.objects.all(), ['nome', 'id'], limite=50)
+        pacientes = Paciente.objects.order_by('nome', 'id').filter(nome__gt='Paciente 00500')[:51]
+        self.assertIsNotNone(cursor)
+        self.assertUsaIndice(pacientes, 'pacientes')
+
+    def test_crossmatch_filtra_pacientes_por_tipo_sanguineo(self):
+        self.assertUsaIndice(Paciente.objects.filter(tipo_sanguineo='A+').values('id', 'nome'), 'pacientes')
+
+    def test_crossmatch_busca_alelos_por_tipo_e_numero(self):
+        self.assertUsaIndice(Alelo.objects.filter(tipo='A*', numero1=2), 'alelos')
+
+    def test_ingestao_busca_alelo_por_nome(self):
+        self.assertUsaIndice(Alelo.objects.filter(nome='A*02:01'), 'alelos')
+
+    def test_ultimo_exame_do_paciente(self):
+        ultimo = Exame.objects.filter(paciente=self.paciente).order_by('-data_exame', 'id')[:1]
+        self.assertUsaIndice(ultimo, 'exames')
+
+    def test_exames_por_paciente(self):
+        self.assertUsaIndice(Exame.objects.filter(paciente_id=self.paciente.id).order_by('-data_exame'), 'exames')
+
+    def test_alelos_do_exame(self):
+        self.assertUsaIndice(ExameAlelo.objects.filter(exame_id=self.exame.id), 'exames_alelos')
+
+    def test_alelo_no_exame(self):
+        self.assertUsaIndice(ExameAlelo.objects.filter(exame_id=self.exame.id, alelo_id=1), 'exames_alelos')
+
+    def test_matriz_mfi_carrega_apenas_ultimos_exames(self):
+        valores = ExameAlelo.objects.filter(exame__in=ultimos_exames()).values_list('exame__paciente_id', 'alelo_id', 'valor')
+        self.assertUsaIndice(valores, 'exames_alelos')
+
+    def test_motor_sql_nao_varre_exames_alelos(self):
+        executadas = []
+
+        def capturar(execute, sql, params, many, context):
+            executadas.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capturar):
+            self.assertIsNotNone(crossmatch_sql([('A*', 2), ('B*', 7)], 'A+'))
+        sql, parametros = executadas[-1]
+        if connection.vendor == 'sqlite':
+            sql = sql.replace('%s', '?').replace('%%', '%')
+        self.assertUsaIndice(sql, 'exames_alelos', parametros)
+
+
+# --- Motores de crossmatch ----------------------------------------------------------------
+
+class MotoresCrossmatchTest(TestCase):
+    """
+    Os motores pandas, SQL e matriz MFI (individual e em lote) devem retornar exatamente
+    o mesmo resultado, inclusive nos casos de borda do último exame e do limiar de MFI.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        alelos = {}
+        for nome in ['A*02:01', 'A*02:06', 'A*24:02', 'B*07:02', 'B*44:03', 'DRB1*04:01', 'DRB1*15:01']:
+            tipo, numero1, numero2 = interpretar_alelo(nome)
+            alelos[nome] = Alelo.objects.create(nome=nome, tipo=tipo, numero1=numero1, numero2=numero2)
+
+        def exame(paciente, data_exame, valores):
+            registro = Exame.objects.create(paciente=paciente, data_exame=data_exame)
+            # Ordem de inserção diferente da ordem dos alelos no catálogo
+            ExameAlelo.objects.bulk_create([ExameAlelo(exame=registro, alelo=alelos[nome], valor=valor)
+                                            for nome, valor in reversed(valores.items())])
+            return registro
+
+        criar = lambda nome, tipo: Paciente.objects.create(nome=nome, data_nascimento=date(1980, 1, 1), tipo_sanguineo=tipo)
+        cls.empate = criar('Empate na data', 'O+')
+        # Dois exames na mesma data: vale o de menor id
+        exame(cls.empate, date(2024, 5, 1), {'A*02:01': 5000.0, 'B*07:02': 200.0})
+        exame(cls.empate, date(2024, 5, 1), {'A*02:01': 10.0, 'B*07:02': 9000.0})
+        exame(cls.empate, date(2023, 1, 1), {'A*02:01': 1.0, 'A*24:02': 1.0})
+
+        cls.sem_exames = criar('Sem exames', 'O+')
+
+        cls.limiar = criar('No limiar', 'O+')
+        exame(cls.limiar, date(2022, 1, 1), {'A*02:01': 15000.0})
+        exame(cls.limiar, date(2024, 1, 1), {'A*02:01': LIMIAR_MFI, 'A*02:06': LIMIAR_MFI - 0.01,
+                                             'B*07:02': 999.999999999, 'DRB1*04:01': 0.0})
+
+        cls.sem_alelos_do_doador = criar('Sem alelos do doador', 'O+')
+        exame(cls.sem_alelos_do_doador, date(2024, 2, 1), {'B*44:03': 3000.0, 'DRB1*15:01': 100.0})
+
+        cls.outro_tipo = criar('Outro tipo sanguíneo', 'A+')
+        exame(cls.outro_tipo, date(2024, 3, 1), {'A*02:01': 7000.0, 'B*07:02': 50.0})
+        reconstruir_resumos()
+
+        # Pares repetidos (inclusive como texto) e alelos com número "0", que são ignorados
+        cls.doador = [{'tipo': 'A*', 'numero': 2}, {'tipo': 'A*', 'numero': '2'}, {'tipo': 'B*', 'numero': 7},
+                      {'tipo': 'DR', 'numero': 4}, {'tipo': 'B*', 'numero': 7}, {'tipo': 'C*', 'numero': '0'}]
+
+    def motores(self, alelos, donor_blood_type):
+        pares = pares_do_doador(alelos)
+        resultados = {
+            'pandas': crossmatch_pandas(pares, donor_blood_type),
+            'sql': crossmatch_sql(pares, donor_blood_type),
+            'matriz': MatrizMFI().crossmatch(pares, donor_blood_type),
+        }
+        for motor in ('pandas', 'sql', 'matriz'):
+            # Matriz nova: a do processo pode ter sido carregada por outro teste com a mesma versão
+            with override_settings(CROSSMATCH_ENGINE=motor), patch('backend.crossmatch.matriz_mfi', MatrizMFI()):
+                cache_resultados.limpar()
+                resultados[f'lote ({motor})'] = executar_crossmatch_lote(
+                    [{'alelos': alelos, 'donor_blood_type': donor_blood_type}])[0]
+        return resultados
+
+    def assertMotoresIguais(self, alelos, donor_blood_type):
+        resultados = self.motores(alelos, donor_blood_type)
+        referencia = resultados.pop('sql')
+        for motor, resultado in resultados.items():
+            self.assertEqual(resultado, referencia, motor)
+        return referencia
+
+    def test_resultado_esperado(self):
+        resultado = self.assertMotoresIguais(self.doador, 'O+')
+
+        def alelos(paciente):
+            return {alelo['nome']: (alelo['valor'], alelo['compatibilidade'])
+                    for alelo in resultado[paciente.id]['alelos_correspondentes']}
+
+        self.assertEqual(sorted(resultado), sorted([self.empate.id, self.limiar.id]))
+        self.assertEqual(alelos(self.empate), {'A*02:01': (5000.0, False), 'B*07:02': (200.0, True)})
+        self.assertEqual(alelos(self.limiar), {
+            'A*02:01': (LIMIAR_MFI, False), 'A*02:06': (LIMIAR_MFI - 0.01, True),
+            'B*07:02': (999.999999999, True), 'DRB1*04:01': (0.0, True),
+        })
+        self.assertEqual(resultado[self.limiar.id]['nome'], 'No limiar')
+
+    def test_tipo_sanguineo_sem_pacientes(self):
+        resultados = self.motores(self.doador, 'AB-')
+        self.assertEqual(resultados, dict.fromkeys(resultados))
+
+    def test_doador_sem_alelos_nos_exames(self):
+        self.assertEqual(self.assertMotoresIguais([{'tipo': 'C*', 'numero': 3}], 'O+'), {})
+        self.assertEqual(self.assertMotoresIguais([], 'O+'), {})
+
+    def test_outro_tipo_sanguineo(self):
+        self.assertEqual(list(self.assertMotoresIguais(self.doador, 'A+')), [self.outro_tipo.id])
+
+    def test_matriz_atualizada_apos_upload_e_exclusao(self):
+        matriz = MatrizMFI()
+        with patch('backend.crossmatch.matriz_mfi', matriz):
+            matriz.sincronizar()
+            relatorio = Relatorio(date(2025, 1, 1), [LinhaAlelo('A*24:02', 'A*', 24, 2, 12000.0),
+                                                     LinhaAlelo('B*07:02', 'B*', 7, 2, 10.0)], 0)
+            with self.captureOnCommitCallbacks(execute=True):
+                gravar_exame(self.sem_exames, relatorio)
+            # Alteração local: aplicada na matriz sem recarga
+            self.assertTrue(matriz.carregada)
+            self.assertEqual(matriz.versao, obter_versao())
+            doador = self.doador + [{'tipo': 'A*', 'numero': 24}]
+            resultado = self.assertMotoresIguais(doador, 'O+')
+            self.assertEqual(matriz.crossmatch(pares_do_doador(doador), 'O+'), resultado)
+            self.assertIn(self.sem_exames.id, resultado)
+
+            # Outro processo alterou os dados antes: a versão salta mais de 1 e a matriz é recarregada
+            with self.captureOnCommitCallbacks(execute=True):
+                incrementar_versao()
+                excluir_pacientes([self.empate.id])
+            self.assertFalse(matriz.carregada)
+            resultado = self.assertMotoresIguais(doador, 'O+')
+            self.assertEqual(matriz.crossmatch(pares_do_doador(doador), 'O+'), resultado)
+            self.assertNotIn(self.empate.id, resultado)
+            self.assertEqual(matriz.versao, obter_versao())
+
+    def test_versao_confirmada_com_os_dados(self):
+        matriz = MatrizMFI()
+        with patch('backend.crossmatch.matriz_mfi', matriz):
+            matriz.sincronizar()
+            versao = obter_versao()
+            relatorio = Relatorio(date(2025, 1, 1), [LinhaAlelo('A*24:02', 'A*', 24, 2, 12000.0)], 0)
+            # Um erro ao atualizar a matriz depois da confirmação não chega à requisição
+            with patch.object(matriz, '_atualizar_paciente', side_effect=DatabaseError("falha simulada")), \
+                    self.captureOnCommitCallbacks(execute=True) as callbacks:
+                gravar_exame(self.sem_exames, relatorio)
+                # A versão já mudou na transação da escrita, antes de qualquer on_commit
+                self.assertEqual(obter_versao(), versao + 1)
+            self.assertEqual(len(callbacks), 1)
+            self.assertFalse(matriz.carregada)
+            doador = self.doador + [{'tipo': 'A*', 'numero': 24}]
+            resultado = self.assertMotoresIguais(doador, 'O+')
+            self.assertEqual(matriz.crossmatch(pares_do_doador(doador), 'O+'), resultado)
+            self.assertIn(self.sem_exames.id, resultado)
+            self.assertEqual(matriz.versao, versao + 1)
+
+
+class CpraTest(TestCase):
+    """
+    cPRA comparado com valores calculados à mão sobre um painel pequeno e recálculo do valor
+    gravado quando o último exame do paciente ou o painel de doadores mudam.
+    """
+
+    # Frequência total 10: cada doador vale frequência * 10 pontos percentuais
+    PAINEL = [
+        ('A*01 B*07', 1),
+        ('A*02,B*08', 2),
+        ('A*02; DRB1*04', 3),
+        ('A*03 DR*07 X99', 4),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alelos = {}
+        for nome in ['A*01:01', 'A*02:01', 'A*03:01', 'B*07:02', 'B*08:01', 'C*05:01', 'DRB1*04:01']:
+            tipo, numero1, numero2 = interpretar_alelo(nome)
+            cls.alelos[nome] = Alelo.objects.create(nome=nome, tipo=tipo, numero1=numero1, numero2=numero2)
+
+        criar = lambda nome: Paciente.objects.create(nome=nome, data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+        cls.a02 = criar('A*02 no último exame')
+        cls.exame(cls.a02, date(2023, 1, 1), {'B*07:02': 8000.0})
+        cls.exame(cls.a02, date(2024, 1, 1), {'A*02:01': 5000.0, 'B*07:02': 100.0})
+        cls.limiar = criar('No limiar')
+        cls.exame(cls.limiar, date(2024, 1, 1), {'A*01:01': LIMIAR_MFI, 'A*03:01': LIMIAR_MFI - 0.01,
+                                                 'DRB1*04:01': 2500.0, 'C*05:01': 9000.0})
+        cls.negativo = criar('Sem antígenos inaceitáveis')
+        cls.exame(cls.negativo, date(2024, 1, 1), {'A*02:01': 300.0, 'B*08:01': 999.0})
+        cls.sem_exames = criar('Sem exames')
+        reconstruir_resumos()
+
+    @classmethod
+    def exame(cls, paciente, data_exame, valores):
+        registro = Exame.objects.create(paciente=paciente, data_exame=data_exame)
+        ExameAlelo.objects.bulk_create([ExameAlelo(exame=registro, alelo=cls.alelos[nome], valor=valor)
+                                        for nome, valor in valores.items()])
+        return registro
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        self.caminho_painel = os.path.join(self.pasta, 'painel.csv')
+        self.escrever_painel(self.PAINEL)
+        configuracao = override_settings(CPRA_PAINEL=self.caminho_painel)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def escrever_painel(self, linhas):
+        mtime = os.path.getmtime(self.caminho_painel) + 10 if os.path.exists(self.caminho_painel) else None
+        with open(self.caminho_painel, 'w', newline='') as arquivo:
+            escritor = csv.writer(arquivo)
+            escritor.writerow(['antigenos', 'frequencia'])
+            escritor.writerows(linhas)
+        if mtime is not None:
+            # Garante uma nova data de modificação mesmo em sistemas de arquivos com resolução de segundos
+            os.utime(self.caminho_painel, (mtime, mtime))
+
+    def valores(self):
+        return {cpra.paciente_id: (round(cpra.cpra, 6), cpra.antigenos_inaceitaveis)
+                for cpra in CpraPaciente.objects.all()}
+
+    def test_valores_do_painel(self):
+        self.assertEqual(calcular_cpra(), 3)
+        self.assertEqual(self.valores(), {
+            # Doadores 2 e 3 (frequências 2 + 3); o B*07 do exame antigo não conta
+            self.a02.id: (50.0, ['A*02']),
+            # Doadores 1 (A*01 no limiar) e 3 (DR04); A*03 abaixo do limiar e C*05 fora do painel
+            self.limiar.id: (40.0, ['A*01', 'C*05', 'DR04']),
+            self.negativo.id: (0.0, []),
+        })
+        self.assertEqual(calcular_cpra([self.a02.id, self.sem_exames.id]), 1)
+        self.assertIsNone(cpra_atual(self.sem_exames.id))
+
+    def test_recalcula_com_novo_exame(self):
+        calcular_cpra()
+        # A gravação de um exame recalcula o cPRA do paciente na mesma transação
+        gravar_exame(self.a02, Relatorio(date(2025, 1, 1), [LinhaAlelo('A*03:01', 'A*', 3, 1, 4000.0)], 0))
+        self.assertEqual(self.valores()[self.a02.id], (40.0, ['A*03']))
+
+        # Exame gravado por fora da ingestão: o valor gravado fica defasado até a próxima leitura
+        exame = self.exame(self.negativo, date(2025, 1, 1), {'B*08:01': 1200.0, 'B*07:02': 1000.0})
+        reconstruir_resumos()
+        self.assertEqual(CpraPaciente.objects.get(paciente=self.negativo).cpra, 0.0)
+        cpra = cpra_atual(self.negativo.id)
+        self.assertEqual((cpra.cpra, cpra.antigenos_inaceitaveis, cpra.ultimo_exame_id), (30.0, ['B*07', 'B*08'], exame.id))
+        self.assertEqual(self.valores()[self.limiar.id], (40.0, ['A*01', 'C*05', 'DR04']))
+
+    def test_recalcula_com_novo_painel(self):
+        calcular_cpra()
+        painel = CpraPaciente.objects.get(paciente=self.a02).painel
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(cpra_atual(self.a02.id).cpra, 50.0)
+        self.assertFalse(any(consulta['sql'].startswith(('INSERT', 'DELETE')) for consulta in consultas.captured_queries))
+
+        # Doador 2 passa a ter frequência 7: total 15, A*02 incompatível com 10
+        self.escrever_painel([self.PAINEL[0], ('A*02,B*08', 7), *self.PAINEL[2:]])
+        cpra = cpra_atual(self.a02.id)
+        self.assertNotEqual(cpra.painel, painel)
+        self.assertAlmostEqual(cpra.cpra, 100 * 10 / 15)
+        # Os demais pacientes só são recalculados quando lidos
+        self.assertEqual(CpraPaciente.objects.get(paciente=self.limiar).painel, painel)
+        self.assertAlmostEqual(self.client.get(f'/api/pacientes/{self.limiar.id}/cpra/').json()['cpra'], 100 * 4 / 15)
+        self.assertNotEqual(CpraPaciente.objects.get(paciente=self.limiar).painel, painel)
+
+
+class CacheCrossmatchTest(TestCase):
+    """
+    Cada caminho de escrita (upload, exclusão e carga sintética) torna inalcançáveis os
+    resultados de crossmatch guardados no cache, depois de executados os callbacks `on_commit`.
+    """
+
+    DOADOR = {'alelos': [{'tipo': 'A*', 'numero': 2}, {'tipo': 'B*', 'numero': 7}], 'donor_blood_type': 'O+'}
+
+    @classmethod
+    def setUpTestData(cls):
+        for nome in ['A*02:01', 'B*07:02']:
+            tipo, numero1, numero2 = interpretar_alelo(nome)
+            Alelo.objects.create(nome=nome, tipo=tipo, numero1=numero1, numero2=numero2)
+        cls.pacientes = [Paciente.objects.create(nome=f"Paciente {i}", data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+                         for i in range(3)]
+        for i, paciente in enumerate(cls.pacientes):
+            gravar_exame(paciente, Relatorio(date(2024, 1, 1), [LinhaAlelo('A*02:01', 'A*', 2, 1, 4000.0 * i)], 0))
+
+    def setUp(self):
+        cache_resultados.limpar()
+        matriz = patch('backend.crossmatch.matriz_mfi', MatrizMFI())
+        matriz.start()
+        self.addCleanup(matriz.stop)
+
+    def crossmatch(self):
+        resposta = self.client.post('/api/newvxm/virtual_crossmatch/', self.DOADOR, content_type='application/json')
+        self.assertEqual(resposta.status_code, 200)
+        return resposta.json()
+
+    def assertInvalidado(self, escrita):
+        """
+        Guarda o resultado no cache, executa `escrita` e verifica que a consulta seguinte é
+        recalculada e igual ao resultado do motor SQL sobre os dados novos.
+        """
+        antes = self.crossmatch()
+        self.assertEqual(self.crossmatch(), antes)
+        self.assertEqual((cache_resultados.acertos, cache_resultados.falhas), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            escrita()
+        depois = self.crossmatch()
+        self.assertEqual((cache_resultados.acertos, cache_resultados.falhas), (1, 2))
+        esperado = crossmatch_sql(pares_do_doador(self.DOADOR['alelos']), 'O+')
+        self.assertEqual(depois, json.loads(json.dumps(esperado)))
+        self.assertNotEqual(depois, antes)
+        return antes, depois
+
+    def test_upload(self):
+        conteudo = relatorio_excel(['A*02:01', 'B*07:02'], date(2025, 1, 1), random.Random(1))
+        enviar = lambda: self.client.post(f'/api/pacientes/{self.pacientes[0].id}/exames/upload/',
+                                          {'file': SimpleUploadedFile('relatorio.xlsx', conteudo)})
+        antes, depois = self.assertInvalidado(lambda: self.assertEqual(enviar().status_code, 201))
+        self.assertNotEqual(depois[str(self.pacientes[0].id)], antes[str(self.pacientes[0].id)])
+
+    def test_exclusao(self):
+        excluir = lambda: self.assertEqual(self.client.delete(f'/api/pacientes/{self.pacientes[1].id}/').status_code, 204)
+        antes, depois = self.assertInvalidado(excluir)
+        self.assertNotIn(str(self.pacientes[1].id), depois)
+
+    def test_exclusao_em_lote(self):
+        excluir = lambda: self.assertEqual(self.client.post('/api/pacientes/excluir/', {'ids': [self.pacientes[2].id]},
+                                                            content_type='application/json').status_code, 200)
+        antes, depois = self.assertInvalidado(excluir)
+        self.assertNotIn(str(self.pacientes[2].id), depois)
+
+    def test_carga_sintetica(self):
+        antes, depois = self.assertInvalidado(lambda: gerar_dataset(escala=0.002, carregador=Carregador(usar_copy=False)))
+        self.assertGreater(len(depois), len(antes))
+
+    def test_limpeza_dos_dados_sinteticos(self):
+        self.assertEqual(len(executar_crossmatch(self.DOADOR['alelos'], 'O+')), 3)
+        salvar_resultado({'donor_id': 1, 'donor_name': 'Doador', 'donor_sex': 'F', 'donor_birth_date': '1980-01-01',
+                          'donor_blood_type': 'O+'}, {self.pacientes[0].id: {'nome': 'Paciente', 'alelos_correspondentes': [
+                              {'nome': 'A*99:99', 'valor': 10.0, 'compatibilidade': True}]}})
+        with self.captureOnCommitCallbacks(execute=True):
+            limpar_dados()
+        for modelo in (ExameAlelo, CrossmatchAlleleResult, CrossmatchPatientResult, Crossmatch, ResumoPaciente, Exame, Paciente):
+            self.assertFalse(modelo.objects.exists(), modelo.__name__)
+        self.assertEqual(Alelo.objects.count(), 2)
+        self.assertFalse(executar_crossmatch(self.DOADOR['alelos'], 'O+'))
+        self.assertEqual((cache_resultados.acertos, cache_resultados.falhas), (0, 2))
+
+
+class RespostasCondicionaisTest(TestCase):
+    """
+    Respostas 304 sem executar a view e ETags que mudam após uma escrita, quando os
+    callbacks `on_commit` que incrementam as versões são executados.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = Paciente.objects.create(nome="Paciente", data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+        gravar_exame(cls.paciente, Relatorio(date(2024, 1, 1), [LinhaAlelo('A*02:01', 'A*', 2, 1, 4000.0)], 0))
+
+    def setUp(self):
+        matriz = patch('backend.crossmatch.matriz_mfi', MatrizMFI())
+        matriz.start()
+        self.addCleanup(matriz.stop)
+
+    def etag(self, url):
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.status_code, 200)
+        return resposta['ETag']
+
+    def test_nao_modificado(self):
+        for url in ['/api/pacientes/', f'/api/pacientes/{self.paciente.id}/', '/api/exames/', '/api/vxm-history/']:
+            etag = self.etag(url)
+            # Apenas a consulta das versões: a view não é executada
+            with self.assertNumQueries(1):
+                resposta = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(resposta.status_code, 304)
+            self.assertEqual(resposta.content, b'')
+            self.assertEqual(resposta['ETag'], etag)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"outra"').status_code, 200)
+        # Escritas nunca são respondidas com 304
+        corpo = {'nome': 'Novo', 'data_nascimento': '1990-01-01', 'tipo_sanguineo': 'A+'}
+        resposta = self.client.post('/api/pacientes/', corpo, content_type='application/json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 201)
+
+    def test_etag_apos_escrita(self):
+        lista, detalhe, exames = '/api/pacientes/', f'/api/pacientes/{self.paciente.id}/', '/api/exames/'
+        antes = {url: self.etag(url) for url in (lista, detalhe, exames)}
+
+        # As versões são gravadas na transação dos dados: uma escrita desfeita não muda os ETags
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            gravar_exame(self.paciente, Relatorio(date(2025, 1, 1), [LinhaAlelo('A*02:01', 'A*', 2, 1, 10.0)], 0))
+            raise RuntimeError("falha simulada")
+        self.assertEqual({url: self.etag(url) for url in antes}, antes)
+        # e uma falha ao incrementar a versão desfaz a escrita, em vez de ocorrer depois de confirmada
+        with patch('backend.versoes.incrementar_versao', side_effect=DatabaseError("falha simulada")), \
+                self.assertRaises(DatabaseError):
+            gravar_exame(self.paciente, Relatorio(date(2025, 1, 1), [LinhaAlelo('A*02:01', 'A*', 2, 1, 10.0)], 0))
+        self.assertEqual(Exame.objects.filter(paciente=self.paciente).count(), 1)
+        self.assertEqual({url: self.etag(url) for url in antes}, antes)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            gravar_exame(self.paciente, Relatorio(date(2025, 2, 1), [LinhaAlelo('A*02:01', 'A*', 2, 1, 10.0)], 0))
+        depois = {url: self.etag(url) for url in antes}
+        # Um novo exame muda a lista de pacientes (sensibilização) e a de exames, mas não o detalhe do paciente
+        self.assertNotEqual(depois[lista], antes[lista])
+        self.assertNotEqual(depois[exames], antes[exames])
+        self.assertEqual(depois[detalhe], antes[detalhe])
+        self.assertEqual(self.client.get(lista, HTTP_IF_NONE_MATCH=antes[lista]).status_code, 200)
+        self.assertEqual(self.client.get(lista, HTTP_IF_NONE_MATCH=depois[lista]).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.put(detalhe, {'nome': 'Alterado', 'data_nascimento': '1980-01-01', 'tipo_sanguineo': 'O+'},
+                                       content_type='application/json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(self.etag(detalhe), antes[detalhe])
+        self.assertEqual(self.client.get(detalhe, HTTP_IF_NONE_MATCH=antes[detalhe]).json()['nome'], 'Alterado')
+        self.assertEqual(self.etag(exames), depois[exames])
+
+        # Last-Modified vem da última alteração registrada
+        resposta = self.client.get(detalhe)
+        self.assertEqual(self.client.get(detalhe, HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified']).status_code, 304)
+
+
+def alelos_do_resultado(dados):
+    # Alelos de um resultado de paciente no formato de `salvar_resultado` convertidos para o da API
+    return [{'allele_name': alelo['nome'], 'allele_value': alelo['valor'], 'compatibility': alelo['compatibilidade']}
+            for alelo in dados['alelos_correspondentes']]
+
+
+class AlelosEmpacotadosTest(TestCase):
+    """
+    Alelos dos resultados de crossmatch gravados em arrays empacotados (nomes do catálogo)
+    ou em linhas de `CrossmatchAlleleResult` (nomes desconhecidos), sem alterar o catálogo.
+    """
+
+    DOADOR = {'donor_id': 1, 'donor_name': 'Doador', 'donor_sex': 'F', 'donor_birth_date': '1980-01-01',
+              'donor_blood_type': 'O+'}
+
+    @classmethod
+    def setUpTestData(cls):
+        for nome in ['A*02:01', 'B*07:02', 'DRB1*04:01']:
+            tipo, numero1, numero2 = interpretar_alelo(nome)
+            Alelo.objects.create(nome=nome, tipo=tipo, numero1=numero1, numero2=numero2)
+        alelo = lambda nome, valor, compativel: {'nome': nome, 'valor': valor, 'compatibilidade': compativel}
+        cls.resultados = {
+            # Ordem diferente da do catálogo, alelo repetido e MFI sem arredondamento
+            1: {'nome': 'Empacotado', 'alelos_correspondentes': [
+                alelo('DRB1*04:01', 1234.5678901234, False), alelo('A*02:01', 0.0, True),
+                alelo('B*07:02', 15000.0, False), alelo('A*02:01', 999.999, True)]},
+            # Nomes fora do catálogo (bem formado e malformado) mantêm o formato antigo
+            2: {'nome': 'Formato antigo', 'alelos_correspondentes': [
+                alelo('A*02:01', 3000.0, False), alelo('A*68:01', 2000.0, False), alelo('Xyz', 10.0, True)]},
+            3: {'nome': 'Sem alelos', 'alelos_correspondentes': []},
+        }
+
+    def test_empacotar_e_desempacotar(self):
+        for tamanho in [0, 1, 7, 8, 9, 64, 1001]:
+            aleatorio = random.Random(tamanho)
+            ids = [aleatorio.randint(1, 2 ** 40) for _ in range(tamanho)]
+            valores = [aleatorio.uniform(-1, 20000) for _ in range(tamanho)]
+            compatibilidades = [aleatorio.random() < 0.5 for _ in range(tamanho)]
+            resultado = CrossmatchPatientResult()
+            resultado.alelos, resultado.valores, resultado.compatibilidades = empacotar_alelos(ids, valores, compatibilidades)
+            self.assertEqual(len(resultado.compatibilidades), -(-tamanho // 8))
+            decodificados = desempacotar_alelos(resultado)
+            self.assertEqual([lista.tolist() for lista in decodificados], [ids, valores, compatibilidades])
+
+    def test_salvar_e_ler(self):
+        catalogo = list(Alelo.objects.order_by('id').values_list('id', 'nome'))
+        with self.captureOnCommitCallbacks(execute=True):
+            crossmatch = salvar_resultado(self.DOADOR, self.resultados)
+        self.assertEqual(list(Alelo.objects.order_by('id').values_list('id', 'nome')), catalogo)
+
+        resultados = {resultado.patient_id: resultado for resultado in crossmatch.patient_results.all()}
+        self.assertIsNotNone(resultados[1].alelos)
+        self.assertIsNone(resultados[2].alelos)
+        self.assertIsNotNone(resultados[3].alelos)
+        self.assertEqual(list(CrossmatchAlleleResult.objects.values_list('patient_result__patient_id', 'allele_name')),
+                         [(2, 'A*02:01'), (2, 'A*68:01'), (2, 'Xyz')])
+
+        lido = carregar_crossmatch(crossmatch.id)
+        for resultado in lido.patient_results.all():
+            self.assertEqual(resultado.alelos_resultado, alelos_do_resultado(self.resultados[resultado.patient_id]))
+            self.assertEqual((resultado.total_compatible_alleles, resultado.total_incompatible_alleles),
+                             {1: (2, 2), 2: (1, 2), 3: (0, 0)}[resultado.patient_id])
+
+    def test_salvar_e_ler_pela_api(self):
+        resultados = {str(paciente_id): dados for paciente_id, dados in self.resultados.items()}
+        resposta = self.client.post('/api/save_crossmatch_result/', {**self.DOADOR, 'results': resultados},
+                                    content_type='application/json')
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(Alelo.objects.count(), 3)
+        detalhe = self.client.get(f"/api/vxm-details/{resposta.json()['id']}/").json()
+        self.assertEqual(detalhe, resposta.json())
+        self.assertEqual({resultado['patient_id']: resultado['allele_results'] for resultado in detalhe['patient_results']},
+                         {paciente_id: alelos_do_resultado(dados) for paciente_id, dados in self.resultados.items()})
+
+
+class GravacaoExameTest(TestCase):
+    """
+    `gravar_exame` consulta apenas os alelos do relatório e grava tudo ou nada.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = Paciente.objects.create(nome="Paciente", data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+        for nome in ['A*02:01', 'A*02:01.1', 'A*02:06', 'B*07:02']:
+            tipo, numero1, numero2 = interpretar_alelo(nome.split('.')[0])
+            Alelo.objects.create(nome=nome, tipo=tipo, numero1=numero1, numero2=numero2)
+
+    def test_alelos_repetidos_recebem_sufixo(self):
+        linha = LinhaAlelo('A*02:01', 'A*', 2, 1, 100.0)
+        with CaptureQueriesContext(connection) as consultas:
+            gravar_exame(self.paciente, Relatorio(date(2024, 1, 1), [linha, linha._replace(valor=200.0)], 0))
+        # O catálogo não é carregado inteiro: toda consulta aos alelos tem filtro
+        consultas_alelos = [consulta['sql'] for consulta in consultas.captured_queries
+                            if consulta['sql'].startswith('SELECT') and 'FROM "alelos"' in consulta['sql']]
+        self.assertTrue(consultas_alelos)
+        for sql in consultas_alelos:
+            self.assertIn('WHERE', sql)
+        # Um novo envio na mesma data continua a sequência de sufixos
+        gravar_exame(self.paciente, Relatorio(date(2024, 1, 1), [linha._replace(valor=300.0)], 0))
+
+        valores = dict(ExameAlelo.objects.filter(exame__paciente=self.paciente).values_list('alelo__nome', 'valor'))
+        self.assertEqual(valores, {'A*02:01': 100.0, 'A*02:01.2': 200.0, 'A*02:01.3': 300.0})
+        self.assertEqual(Exame.objects.filter(paciente=self.paciente).count(), 1)
+
+    def test_erro_desfaz_o_exame(self):
+        relatorio = Relatorio(date(2024, 1, 1), [LinhaAlelo('A*02:01', 'A*', 2, 1, 100.0),
+                                                 LinhaAlelo('A*24:02', 'A*', 24, 2, 200.0)], 0)
+        alelos = Alelo.objects.count()
+        with patch('backend.ingestao.atualizar_resumos', side_effect=DatabaseError("falha simulada")):
+            with self.assertRaises(DatabaseError):
+                gravar_exame(self.paciente, relatorio)
+        self.assertFalse(Exame.objects.exists())
+        self.assertFalse(ExameAlelo.objects.exists())
+        self.assertEqual(Alelo.objects.count(), alelos)
+
+
+class PreparacaoLoteTest(TestCase):
+    """
+    Leitura dos arquivos de um envio em lote: .zip, manifesto, limites e leitura em paralelo.
+    """
+
+    def pacote(self, arquivos, nome='lote.zip'):
+        conteudo = io.BytesIO()
+        with zipfile.ZipFile(conteudo, 'w', zipfile.ZIP_DEFLATED) as pacote:
+            for nome_arquivo, dados in arquivos.items():
+                pacote.writestr(nome_arquivo, dados)
+        return SimpleUploadedFile(nome, conteudo.getvalue())
+
+    @override_settings(UPLOAD_LOTE_TAMANHO_MAXIMO=100)
+    def test_tamanho_maximo_lido_do_conteudo(self):
+        manifesto = json.dumps({'a.xlsx': 1})
+        self.assertEqual(preparar_lote([self.pacote({'a.xlsx': b'x' * 100, 'manifesto.json': manifesto})]),
+                         [('a.xlsx', b'x' * 100, 1)])
+        # Conteúdo muito compressível: o limite vale para os bytes descompactados
+        for arquivos in [{'a.xlsx': b'x' * 101, 'manifesto.json': manifesto},
+                         {'a.xlsx': b'x', 'manifesto.json': manifesto + ' ' * 100}]:
+            with self.assertRaisesMessage(ErroRelatorio, "excede o tamanho máximo"):
+                preparar_lote([self.pacote(arquivos)])
+        with self.assertRaisesMessage(ErroRelatorio, "excede o tamanho máximo"):
+            preparar_lote([SimpleUploadedFile('a.xlsx', b'x' * 101)], manifesto)
+
+    def test_manifesto_ausente_ou_invalido(self):
+        with self.assertRaisesMessage(ErroRelatorio, "Manifesto não enviado."):
+            preparar_lote([self.pacote({'a.xlsx': b'x'})])
+        for manifesto in ['nao e json', '["a.xlsx"]', '{"a.xlsx": "um"}', b'\xff\xfe{']:
+            with self.assertRaisesMessage(ErroRelatorio, "Manifesto inválido."):
+                preparar_lote([self.pacote({'a.xlsx': b'x', 'manifesto.json': manifesto})])
+        with self.assertRaisesMessage(ErroRelatorio, "não é um .zip válido"):
+            preparar_lote([SimpleUploadedFile('lote.zip', b'nao e zip')], '{}')
+
+    def test_ignora_metadados_do_zip(self):
+        pacote = self.pacote({'relatorios/a.xlsx': b'a', 'relatorios/b.xls': b'b', '__MACOSX/relatorios/._a.xlsx': b'm',
+                              'relatorios/.DS_Store': b'd', 'relatorios/manifest.json': json.dumps({'a.xlsx': 1})})
+        avulso = SimpleUploadedFile('c.xlsx', b'c')
+        # O manifesto do .zip vale para os arquivos avulsos; os que não estão nele ficam sem paciente
+        self.assertEqual(preparar_lote([pacote, avulso]), [('a.xlsx', b'a', 1), ('b.xls', b'b', None), ('c.xlsx', b'c', None)])
+        # O manifesto enviado no campo tem prioridade sobre o do .zip
+        self.assertEqual(preparar_lote([pacote], '{"relatorios/b.xls": "2"}'), [('a.xlsx', b'a', None), ('b.xls', b'b', 2)])
+
+    @override_settings(UPLOAD_LOTE_PROCESSOS=2)
+    def test_pool_compartilhado_entre_lotes(self):
+        self.addCleanup(ingestao._descartar_pool, ingestao._pool_leitura())
+        conteudo = relatorio_excel(['A*02:01', 'B*07:02'], date(2024, 1, 1), random.Random(1))
+        for _ in range(2):
+            relatorios = ingestao._ler_em_paralelo([('a.xlsx', conteudo), ('b.xlsx', b'invalido'), ('c.xlsx', conteudo)])
+            self.assertEqual([linha.nome for linha in relatorios[0].linhas], ['A*02:01', 'B*07:02'])
+            self.assertIsInstance(relatorios[1], Exception)
+            self.assertEqual(relatorios[2], relatorios[0])
+        self.assertIs(ingestao._pool_leitura(), ingestao._pool_leitura())
+        self.assertEqual(ingestao._pool_leitura()._max_workers, 2)
+
+
+@override_settings(UPLOAD_LOTE_PROCESSOS=1, UPLOAD_LOTE_TRANSACAO=20)
+class ImportacaoLoteTest(TestCase):
+    """
+    `importar_lote` consulta o catálogo uma vez e atualiza os pacientes uma vez por transação.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        criar = lambda nome: Paciente.objects.create(nome=nome, data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+        cls.pacientes = [criar(f"Paciente {i}") for i in range(3)]
+
+    def setUp(self):
+        matriz = patch('backend.crossmatch.matriz_mfi', MatrizMFI())
+        matriz.start()
+        self.addCleanup(matriz.stop)
+
+    def lote(self, alelos=('A*02:01', 'B*07:02')):
+        aleatorio = random.Random(1)
+        arquivos = [(f"{paciente.id}.xlsx", relatorio_excel(alelos, date(2024, 1, 1), aleatorio), paciente.id)
+                    for paciente in self.pacientes]
+        arquivos.append(('segundo.xlsx', relatorio_excel(alelos, date(2024, 6, 1), aleatorio), self.pacientes[0].id))
+        return arquivos
+
+    def test_catalogo_e_pacientes_atualizados_uma_vez(self):
+        with patch('backend.ingestao._consultar_catalogo', wraps=ingestao._consultar_catalogo) as catalogo, \
+                patch('backend.ingestao.atualizar_resumos', wraps=ingestao.atualizar_resumos) as resumos, \
+                patch('backend.ingestao.atualizar_cpra', wraps=ingestao.atualizar_cpra) as cpra, \
+                self.captureOnCommitCallbacks(execute=True):
+            resultados = importar_lote(self.lote())
+        self.assertEqual([resultado['status'] for resultado in resultados], ['ok'] * 4)
+        self.assertEqual(catalogo.call_count, 1)
+        resumos.assert_called_once_with([paciente.id for paciente in self.pacientes])
+        cpra.assert_called_once_with([paciente.id for paciente in self.pacientes])
+        self.assertEqual(Exame.objects.count(), 4)
+        self.assertEqual(Alelo.objects.count(), 2)
+
+        # Os resumos gravados em lote são os mesmos de uma reconstrução completa
+        gravados = list(ResumoPaciente.objects.order_by('paciente_id').values_list('paciente_id', 'ultimo_exame_id'))
+        reconstruir_resumos()
+        self.assertEqual(list(ResumoPaciente.objects.order_by('paciente_id').values_list('paciente_id', 'ultimo_exame_id')),
+                         gravados)
+
+    def test_erro_em_um_arquivo_nao_afeta_os_demais(self):
+        arquivos = self.lote()
+        arquivos[1] = (arquivos[1][0], b'nao e planilha', arquivos[1][2])
+        arquivos += [('sem_paciente.xlsx', arquivos[0][1], None), ('desconhecido.xlsx', arquivos[0][1], 0)]
+        resultados = importar_lote(arquivos)
+        self.assertEqual([resultado['status'] for resultado in resultados], ['ok', 'erro', 'ok', 'ok', 'erro', 'erro'])
+        self.assertIn("Erro ao processar o arquivo Excel", resultados[1]['erro'])
+        self.assertEqual(resultados[4]['erro'], "Arquivo sem paciente no manifesto.")
+        self.assertEqual(resultados[5]['erro'], "Paciente não encontrado.")
+        self.assertEqual([resultado['arquivo'] for resultado in resultados], [nome for nome, _, _ in arquivos])
+        self.assertEqual(sorted(Exame.objects.values_list('paciente_id', flat=True)),
+                         sorted([self.pacientes[0].id, self.pacientes[0].id, self.pacientes[2].id]))
+
+    @override_settings(UPLOAD_LOTE_PROCESSOS=2, UPLOAD_LOTE_TRANSACAO=2)
+    def test_leitura_em_paralelo(self):
+        self.addCleanup(ingestao._descartar_pool, ingestao._pool_leitura())
+        arquivos = self.lote()
+        arquivos[2] = (arquivos[2][0], b'nao e planilha', arquivos[2][2])
+        resultados = importar_lote(arquivos)
+        self.assertEqual([resultado['status'] for resultado in resultados], ['ok', 'ok', 'erro', 'ok'])
+        self.assertEqual([resultado['inseridos'] for resultado in resultados if resultado['status'] == 'ok'], [2, 2, 2])
+        self.assertEqual(Exame.objects.count(), 3)
+        self.assertEqual(ExameAlelo.objects.count(), 6)
+
+    def test_exame_desfeito_nao_deixa_alelos_no_catalogo(self):
+        # O primeiro exame cria os alelos e falha depois: o savepoint os desfaz e o próximo exame os cria de novo
+        inserir = ingestao._inserir_exame
+        chamadas = []
+
+        def falha_no_primeiro(*args):
+            resultado = inserir(*args)
+            chamadas.append(resultado)
+            if len(chamadas) == 1:
+                raise DatabaseError("falha simulada")
+            return resultado
+
+        with patch('backend.ingestao._inserir_exame', side_effect=falha_no_primeiro):
+            resultados = importar_lote(self.lote())
+        self.assertEqual([resultado['status'] for resultado in resultados], ['erro', 'ok', 'ok', 'ok'])
+        self.assertEqual(set(ExameAlelo.objects.values_list('alelo__nome', flat=True)), {'A*02:01', 'B*07:02'})
+        self.assertEqual(Exame.objects.count(), 3)
+
+    def test_erro_ao_atualizar_pacientes_desfaz_a_transacao(self):
+        with patch('backend.ingestao.atualizar_cpra', side_effect=DatabaseError("falha simulada")):
+            resultados = importar_lote(self.lote())
+        self.assertEqual([resultado['status'] for resultado in resultados], ['erro'] * 4)
+        self.assertFalse(Exame.objects.exists())
+        self.assertFalse(Alelo.objects.exists())
+
+
+class LogsTest(TestCase):
+    """
+    Amostragem, formatadores e descarte de registros com a fila de logs cheia.
+    """
+
+    def registro(self, nome, nivel=logging.INFO, **extras):
+        return logging.makeLogRecord({'name': nome, 'levelno': nivel, 'levelname': logging.getLevelName(nivel),
+                                      'msg': "Mensagem %s", 'args': (1,), **extras})
+
+    def test_amostragem_por_prefixo(self):
+        for taxas in ["backend=0, backend.views=1", {'backend': 0.0, 'backend.views': 1.0}]:
+            filtro = FiltroAmostragem(taxas)
+            mantidos = {nome: filtro.filter(self.registro(nome))
+                        for nome in ['backend', 'backend.crossmatch', 'backend.views', 'backend.views.lote', 'backendx', 'django']}
+            self.assertEqual(mantidos, {'backend': False, 'backend.crossmatch': False, 'backend.views': True,
+                                        'backend.views.lote': True, 'backendx': True, 'django': True})
+            # Avisos e erros nunca são descartados
+            self.assertTrue(filtro.filter(self.registro('backend.crossmatch', logging.WARNING)))
+            self.assertTrue(filtro.filter(self.registro('backend', logging.ERROR)))
+
+    def test_amostragem_por_taxa(self):
+        filtro = FiltroAmostragem("backend=0.25")
+        with patch('backend.logs.random.random', side_effect=[0.2, 0.3, 0.25]):
+            self.assertEqual([filtro.filter(self.registro('backend.views')) for _ in range(3)], [True, False, False])
+        self.assertTrue(filtro.filter(self.registro('backend.views', logging.WARNING)))
+
+    def test_formatadores(self):
+        try:
+            raise ValueError("falha simulada")
+        except ValueError:
+            excecao = sys.exc_info()
+        registro = self.registro('backend.views', logging.ERROR, caminho='/api/', duracao_ms=12.5, exc_info=excecao)
+
+        dados = json.loads(FormatadorJSON().format(registro))
+        self.assertEqual({chave: dados[chave] for chave in ['nivel', 'logger', 'mensagem', 'caminho', 'duracao_ms']},
+                         {'nivel': 'ERROR', 'logger': 'backend.views', 'mensagem': "Mensagem 1",
+                          'caminho': '/api/', 'duracao_ms': 12.5})
+        self.assertIn("ValueError: falha simulada", dados['excecao'])
+        self.assertIn('momento', dados)
+
+        linha = FormatadorTexto('%(levelname)s - %(name)s - %(message)s').format(self.registro('backend', caminho='/api/'))
+        self.assertEqual(linha, "INFO - backend - Mensagem 1 caminho=/api/")
+
+    def test_fila_cheia_descarta_e_conta(self):
+        # Sem a thread de escrita (enqueue direto), a fila com uma posição enche no primeiro registro
+        manipulador = ManipuladorFila(tamanho_fila=1, espera_aviso=0.01)
+        manipulador.enqueue(self.registro('backend'))
+        inicio = time.perf_counter()
+        manipulador.enqueue(self.registro('backend', logging.ERROR))
+        self.assertLess(time.perf_counter() - inicio, 1)
+        self.assertEqual(manipulador.descartados, 1)
+
+        def registrar():
+            for _ in range(500):
+                manipulador.enqueue(self.registro('backend'))
+
+        threads = [threading.Thread(target=registrar) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(manipulador.descartados, 2001)
+        self.assertEqual(manipulador.queue.qsize(), 1)
+
+
+class CrossmatchPersistidoTest(TestCase):
+    """
+    Virtual crossmatch com persist=true: grava o resultado ou rejeita dados do doador incompletos.
+    """
+
+    DOADOR = {'donor_id': 7, 'donor_name': 'Doador', 'donor_sex': 'F', 'donor_birth_date': '1980-01-01',
+              'donor_blood_type': 'O+', 'alelos': [{'tipo': 'A*', 'numero': 2}]}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = Paciente.objects.create(nome="Paciente", data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+        gravar_exame(cls.paciente, Relatorio(date(2024, 1, 1), [LinhaAlelo('A*02:01', 'A*', 2, 1, 4000.0)], 0))
+
+    def setUp(self):
+        cache_resultados.limpar()
+        matriz = patch('backend.crossmatch.matriz_mfi', MatrizMFI())
+        matriz.start()
+        self.addCleanup(matriz.stop)
+
+    def persistir(self, doador):
+        return self.client.post('/api/newvxm/virtual_crossmatch/?persist=true', doador, content_type='application/json')
+
+    def test_grava_o_crossmatch(self):
+        resposta = self.persistir(self.DOADOR)
+        self.assertEqual(resposta.status_code, 201)
+        crossmatch = Crossmatch.objects.get()
+        self.assertEqual((resposta.json()['id'], crossmatch.donor_id), (crossmatch.id, 7))
+        self.assertEqual(resposta.json(), self.client.get(f'/api/vxm-details/{crossmatch.id}/').json())
+        self.assertEqual([resultado['patient_id'] for resultado in resposta.json()['patient_results']], [self.paciente.id])
+
+    def test_doador_sem_id(self):
+        sem_id = {campo: valor for campo, valor in self.DOADOR.items() if campo != 'donor_id'}
+        for doador in [sem_id, {**self.DOADOR, 'donor_id': None}, {**self.DOADOR, 'donor_id': '7'},
+                       {**self.DOADOR, 'donor_id': True}]:
+            resposta = self.persistir(doador)
+            self.assertEqual(resposta.status_code, 400)
+            self.assertIn('error', resposta.json())
+        self.assertFalse(Crossmatch.objects.exists())
+        # Sem persist, o id do doador continua opcional
+        resposta = self.client.post('/api/newvxm/virtual_crossmatch/', sem_id, content_type='application/json')
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_erro_ao_gravar(self):
+        with patch('backend.views.salvar_resultado', side_effect=RuntimeError("falha simulada")):
+            resposta = self.persistir(self.DOADOR)
+        self.assertEqual(resposta.status_code, 500)
+        self.assertEqual(resposta.json(), {'error': "Erro ao salvar crossmatch: falha simulada"})
+
+
+class MigracaoAlelosEmpacotadosTest(TransactionTestCase):
+    """
+    A migração 0010 converte as linhas de `CrossmatchAlleleResult` em arrays empacotados e,
+    revertida, recria as linhas a partir dos arrays.
+    """
+
+    antes = [('backend', '0009_alelos_empacotados')]
+    depois = [('backend', '0010_empacotar_alelos_crossmatch')]
+
+    def migrar(self, destino):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(destino)
+        return executor.loader.project_state(destino).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrar(executor.loader.graph.leaf_nodes())
+
+    def linhas(self, apps):
+        CrossmatchAlleleResult = apps.get_model('backend', 'CrossmatchAlleleResult')
+        return list(CrossmatchAlleleResult.objects.order_by('patient_result_id', 'id')
+                    .values_list('patient_result_id', 'allele_name', 'allele_value', 'compatibility'))
+
+    def test_migracao_e_reversao(self):
+        apps = self.migrar(self.antes)
+        for nome in ['A*02:01', 'B*07:02']:
+            apps.get_model('backend', 'Alelo').objects.create(nome=nome, tipo=nome[:2], numero1=int(nome[2:4]), numero2=int(nome[5:]))
+        crossmatch = apps.get_model('backend', 'Crossmatch').objects.create(
+            donor_id=1, donor_name='Doador', donor_sex='M', donor_birth_date=date(1980, 1, 1), donor_blood_type='O+')
+        CrossmatchPatientResult = apps.get_model('backend', 'CrossmatchPatientResult')
+        CrossmatchAlleleResult = apps.get_model('backend', 'CrossmatchAlleleResult')
+        alelos = {
+            1: [('B*07:02', 1500.25, False), ('A*02:01', 10.0, True), ('B*07:02', 0.5, True)],
+            2: [('A*02:01', 3000.0, False), ('A*68:01', 2000.0, False)],
+            3: [],
+        }
+        ids = {}
+        for paciente_id, linhas in alelos.items():
+            resultado = CrossmatchPatientResult.objects.create(
+                crossmatch=crossmatch, patient_id=paciente_id, patient_name=f"Paciente {paciente_id}",
+                total_compatible_alleles=sum(1 for linha in linhas if linha[2]),
+                total_incompatible_alleles=sum(1 for linha in linhas if not linha[2]))
+            ids[paciente_id] = resultado.id
+            for nome, valor, compativel in linhas:
+                CrossmatchAlleleResult.objects.create(patient_result=resultado, allele_name=nome, allele_value=valor,
+                                                      compatibility=compativel)
+        originais = [(resultado_id, nome, valor, compativel) for paciente_id, resultado_id in ids.items()
+                     for nome, valor, compativel in alelos[paciente_id]]
+        self.assertEqual(self.linhas(apps), originais)
+
+        apps = self.migrar(self.depois)
+        # Apenas o resultado com um nome fora do catálogo continua no formato antigo
+        self.assertEqual(self.linhas(apps), [linha for linha in originais if linha[0] == ids[2]])
+        empacotados = apps.get_model('backend', 'CrossmatchPatientResult').objects.filter(alelos__isnull=False)
+        self.assertEqual(sorted(empacotados.values_list('patient_id', flat=True)), [1, 3])
+        lido = carregar_crossmatch(crossmatch.id)
+        self.assertEqual({resultado.patient_id: [(alelo['allele_name'], alelo['allele_value'], alelo['compatibility'])
+                                                 for alelo in resultado.alelos_resultado]
+                          for resultado in lido.patient_results.all()}, alelos)
+
+        apps = self.migrar(self.antes)
+        self.assertEqual(sorted(self.linhas(apps)), sorted(originais))
+        self.assertFalse(apps.get_model('backend', 'CrossmatchPatientResult').objects.filter(alelos__isnull=False).exists())
+
+
+class ExclusaoPacientesTest(TestCase):
+    """
+    A exclusão em lote remove os dados dependentes dos pacientes, os crossmatches que ficam
+    sem pacientes e incrementa as versões, preservando os dados dos demais pacientes.
+    """
+
+    DOADOR = {'donor_id': 1, 'donor_name': 'Doador', 'donor_sex': 'F', 'donor_birth_date': '1980-01-01',
+              'donor_blood_type': 'O+'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pacientes = [Paciente.objects.create(nome=f"Paciente {i}", data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+                         for i in range(4)]
+        for paciente in cls.pacientes:
+            for data_exame in [date(2023, 1, 1), date(2024, 1, 1)]:
+                gravar_exame(paciente, Relatorio(data_exame, [LinhaAlelo('A*02:01', 'A*', 2, 1, 3000.0),
+                                                              LinhaAlelo('B*07:02', 'B*', 7, 2, 100.0)], 0))
+            CpraPaciente.objects.create(paciente=paciente, cpra=25.0, ultimo_exame=paciente.resumo.ultimo_exame, painel='teste')
+
+        def resultado(paciente, nome_alelo='A*02:01'):
+            return {'nome': paciente.nome, 'alelos_correspondentes': [{'nome': nome_alelo, 'valor': 3000.0, 'compatibilidade': False}]}
+
+        excluidos, mantido = cls.pacientes[:2], cls.pacientes[2]
+        # Apenas pacientes excluídos (um deles no formato antigo): o crossmatch é excluído
+        cls.so_excluidos = salvar_resultado(cls.DOADOR, {excluidos[0].id: resultado(excluidos[0]),
+                                                         excluidos[1].id: resultado(excluidos[1], 'A*99:99')})
+        # Pacientes excluídos e mantidos: o crossmatch fica com os resultados dos mantidos
+        cls.misto = salvar_resultado(cls.DOADOR, {excluidos[0].id: resultado(excluidos[0], 'A*99:99'),
+                                                  mantido.id: resultado(mantido, 'A*99:99')})
+        cls.outro = salvar_resultado(cls.DOADOR, {mantido.id: resultado(mantido)})
+
+    def setUp(self):
+        matriz = patch('backend.crossmatch.matriz_mfi', MatrizMFI())
+        matriz.start()
+        self.addCleanup(matriz.stop)
+
+    def contagens(self, paciente_ids):
+        return {
+            'exames': Exame.objects.filter(paciente_id__in=paciente_ids).count(),
+            'alelos_exames': ExameAlelo.objects.filter(exame__paciente_id__in=paciente_ids).count(),
+            'resumos': ResumoPaciente.objects.filter(paciente_id__in=paciente_ids).count(),
+            'cpra': CpraPaciente.objects.filter(paciente_id__in=paciente_ids).count(),
+            'resultados_crossmatch': CrossmatchPatientResult.objects.filter(patient_id__in=paciente_ids).count(),
+            'alelos_crossmatch': CrossmatchAlleleResult.objects.filter(patient_result__patient_id__in=paciente_ids).count(),
+        }
+
+    def test_exclusao_em_lote(self):
+        excluidos = [paciente.id for paciente in self.pacientes[:2]]
+        mantidos = [paciente.id for paciente in self.pacientes[2:]]
+        antes_mantidos = self.contagens(mantidos)
+        alelos = Alelo.objects.count()
+        versoes = {chave: obter_versao(chave) for chave in ('dados', 'pacientes', 'exames', 'crossmatch')}
+
+        with self.captureOnCommitCallbacks(execute=True):
+            totais = self.client.post('/api/pacientes/excluir/', {'ids': excluidos + [0]}, content_type='application/json').json()
+        self.assertEqual(totais, {'alelos_crossmatch': 2, 'resultados_crossmatch': 3, 'alelos_exames': 8, 'resumos': 2,
+                                  'cpra': 2, 'exames': 4, 'pacientes': 2, 'crossmatches': 1})
+
+        self.assertEqual(list(Paciente.objects.order_by('id').values_list('id', flat=True)), mantidos)
+        self.assertEqual(self.contagens(excluidos), dict.fromkeys(antes_mantidos, 0))
+        self.assertEqual(self.contagens(mantidos), antes_mantidos)
+        self.assertEqual(list(Crossmatch.objects.order_by('id').values_list('id', flat=True)), [self.misto.id, self.outro.id])
+        self.assertEqual([resultado['patient_id'] for resultado in self.client.get(f'/api/vxm-details/{self.misto.id}/').json()['patient_results']],
+                         [self.pacientes[2].id])
+        self.assertEqual(Alelo.objects.count(), alelos)
+        self.assertEqual({chave: obter_versao(chave) for chave in versoes}, {chave: versao + 1 for chave, versao in versoes.items()})
+
+    def test_consultas_independentes_do_volume(self):
+        # Contadores de versão já criados, como em um banco em uso
+        registrar_escrita('dados', 'pacientes', 'exames', 'crossmatch')
+        with CaptureQueriesContext(connection) as um:
+            excluir_pacientes([self.pacientes[2].id])
+        with CaptureQueriesContext(connection) as varios:
+            excluir_pacientes([self.pacientes[0].id, self.pacientes[1].id, self.pacientes[3].id])
+        self.assertEqual(len(um), len(varios))
+        self.assertFalse(Paciente.objects.exists())
+        self.assertFalse(Crossmatch.objects.exists())
+        self.assertEqual(excluir_pacientes([self.pacientes[0].id]), {'pacientes': 0})
+
+
+class MetricasMultiprocessoTest(TestCase):
+    """
+    Com METRICAS_DIRETORIO, /metrics soma as séries gravadas por todos os processos (workers).
+    """
+
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+        configuracao = override_settings(METRICAS_DIRETORIO=self.pasta)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def valor(self, texto, serie):
+        for linha in texto.splitlines():
+            if linha.startswith(serie + ' '):
+                return float(linha.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_soma_dos_processos(self):
+        self.assertEqual(self.client.get('/api/exames/').status_code, 200)
+        serie = 'http_requisicao_duracao_segundos_count{view="lista_exames",metodo="GET",status="200"}'
+        proprio = self.valor(self.client.get('/metrics').content.decode(), serie)
+        self.assertGreaterEqual(proprio, 1)
+
+        # Outro worker (já encerrado): 3 requisições em lista_exames e uma série só dele
+        encerrado = subprocess.Popen([sys.executable, '-c', 'pass'])
+        encerrado.wait()
+        baldes = len(metricas.BALDES_TEMPO) + 1
+        with open(os.path.join(self.pasta, f'metricas_{encerrado.pid}_teste.json'), 'w') as arquivo:
+            json.dump({'pid': encerrado.pid, 'cache': {'acertos': 5, 'falhas': 7, 'entradas': 100}, 'histogramas': {
+                'http_requisicao_duracao_segundos': [
+                    [['lista_exames', 'GET', '200'], [3] + [0] * (baldes - 1), 0.003],
+                    [['outro_worker', 'GET', '200'], [0] * (baldes - 1) + [2], 30.0],
+                ],
+            }}, arquivo)
+        cache_resultados.limpar()
+
+        texto = self.client.get('/metrics').content.decode()
+        self.assertEqual(self.valor(texto, serie), proprio + 3)
+        self.assertEqual(self.valor(texto, 'http_requisicao_duracao_segundos_bucket{view="outro_worker",metodo="GET",status="200",le="+Inf"}'), 2)
+        self.assertEqual(self.valor(texto, 'http_requisicao_duracao_segundos_sum{view="outro_worker",metodo="GET",status="200"}'), 30.0)
+        self.assertEqual(self.valor(texto, 'crossmatch_cache_acertos'), 5)
+        self.assertEqual(self.valor(texto, 'crossmatch_cache_falhas'), 7)
+        # O número de entradas do cache só considera os processos em execução
+        self.assertEqual(self.valor(texto, 'crossmatch_cache_entradas'), 0)
+        self.assertEqual(len(glob.glob(os.path.join(self.pasta, 'metricas_*.json'))), 2)
+
+        metricas.limpar_metricas()
+        self.assertEqual(os.listdir(self.pasta), [])
+
+
+# --- Fila de tarefas ----------------------------------------------------------------------
+
+@override_settings(TAREFAS_CONCORRENCIA_MAXIMA=2, TAREFAS_MAX_TENTATIVAS=3, TAREFAS_TEMPO_LIMITE=120)
+class FilaTarefasTest(TestCase):
+    """
+    Repetição com espera exponencial, limite global de execuções simultâneas e
+    recuperação das tarefas abandonadas pelos workers.
+    """
+
+    def setUp(self):
+        self.instante = datetime(2026, 1, 1, 12, 0, tzinfo=dt_timezone.utc)
+        self.executados = []
+
+        def falhar(tarefa):
+            raise RuntimeError("falha simulada")
+
+        def concluir(tarefa):
+            self.executados.append(tarefa.tentativas)
+            return 200, {'ok': True}
+
+        self.executores = patch.dict(tarefas.EXECUTORES, {'falha': falhar, 'teste': concluir})
+        self.executores.start()
+        self.addCleanup(self.executores.stop)
+
+    def em(self, segundos):
+        # Congela o relógio da fila `segundos` após o instante inicial
+        return patch('backend.tarefas.now', return_value=self.instante + timedelta(seconds=segundos))
+
+    def test_repeticao_com_espera_exponencial(self):
+        with self.em(0):
+            tarefa = tarefas.enfileirar('falha', {})
+            Tarefa.objects.filter(id=tarefa.id).update(disponivel_em=self.instante)
+        decorrido = 0
+        for tentativa in (1, 2):
+            with self.em(decorrido):
+                tarefa = tarefas.executar_tarefa(tarefas.reservar_proxima())
+            self.assertEqual((tarefa.status, tarefa.tentativas), (Tarefa.PENDENTE, tentativa))
+            espera = 2 ** tentativa
+            self.assertEqual(Tarefa.objects.get(id=tarefa.id).disponivel_em, self.instante + timedelta(seconds=decorrido + espera))
+            with self.em(decorrido + espera - 1):
+                self.assertIsNone(tarefas.reservar_proxima())
+            decorrido += espera
+
+        with self.em(decorrido):
+            tarefas.executar_tarefa(tarefas.reservar_proxima())
+        tarefa = Tarefa.objects.get(id=tarefa.id)
+        self.assertEqual((tarefa.status, tarefa.tentativas, tarefa.erro), (Tarefa.FALHOU, 3, "falha simulada"))
+        self.assertEqual(tarefa.concluida_em, self.instante + timedelta(seconds=decorrido))
+        with self.em(decorrido + 3600):
+            self.assertIsNone(tarefas.reservar_proxima())
+
+    def test_upload_repetido_grava_uma_vez(self):
+        paciente = Paciente.objects.create(nome="Paciente", data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+        conteudo = relatorio_excel(['A*02:01', 'B*07:02'], date(2024, 3, 15), random.Random(1))
+        tarefa = tarefas.enfileirar('upload_excel', {'patient_id': paciente.id}, SimpleUploadedFile('relatorio.xlsx', conteudo))
+        tarefa = tarefas.reservar_proxima()
+        # Mesma tarefa executada de novo (ex.: o worker caiu depois de gravar o exame)
+        primeira = tarefas.executar_upload_excel(tarefa)
+        segunda = tarefas.executar_upload_excel(tarefa)
+        self.assertEqual(primeira, segunda)
+        self.assertEqual(primeira[1]['exame_id'], Exame.objects.get(paciente=paciente).id)
+        self.assertEqual(ExameAlelo.objects.filter(exame__paciente=paciente).count(), 2)
+        self.assertFalse(Alelo.objects.filter(nome__contains='.').exists())
+        self.assertEqual(Tarefa.objects.get(id=tarefa.id).efeito,
+                         {campo: valor for campo, valor in primeira[1].items() if campo != 'message'})
+
+    def test_crossmatch_persistido_repetido_grava_uma_vez(self):
+        paciente = Paciente.objects.create(nome="Paciente", data_nascimento=date(1980, 1, 1), tipo_sanguineo='O+')
+        gravar_exame(paciente, Relatorio(date(2024, 1, 1), [LinhaAlelo('A*02:01', 'A*', 2, 1, 4000.0)], 0))
+        doador = {'donor_id': 7, 'donor_name': 'Doador', 'donor_sex': 'F', 'donor_birth_date': '1980-01-01',
+                  'donor_blood_type': 'O+', 'alelos': [{'tipo': 'A*', 'numero': 2}], 'persist': True}
+        with self.em(0):
+            tarefa = tarefas.enfileirar('virtual_crossmatch', doador)
+            Tarefa.objects.filter(id=tarefa.id).update(disponivel_em=self.instante)
+        # Erro depois da gravação: a tarefa é repetida e não grava um segundo crossmatch
+        with self.em(0), patch('backend.tarefas.carregar_crossmatch', side_effect=RuntimeError("falha simulada")), \
+                patch('backend.crossmatch.matriz_mfi', MatrizMFI()):
+            tarefa = tarefas.executar_tarefa(tarefas.reservar_proxima())
+        self.assertEqual(tarefa.status, Tarefa.PENDENTE)
+        self.assertEqual(Crossmatch.objects.count(), 1)
+        with self.em(2), patch('backend.crossmatch.matriz_mfi', MatrizMFI()):
+            tarefa = tarefas.executar_tarefa(tarefas.reservar_proxima())
+        self.assertEqual((tarefa.status, tarefa.status_http, tarefa.tentativas), (Tarefa.CONCLUIDA, 201, 2))
+        crossmatch = Crossmatch.objects.get()
+        self.assertEqual(tarefa.resultado['id'], crossmatch.id)
+        self.assertEqual(Tarefa.objects.get(id=tarefa.id).efeito, {'crossmatch_id': crossmatch.id})
+
+    def test_limite_de_concorrencia(self):
+        ids = [tarefas.enfileirar('teste', {}).id for _ in range(3)]
+        primeira, segunda = tarefas.reservar_proxima(), tarefas.reservar_proxima()
+        self.assertEqual([primeira.id, segunda.id], ids[:2])
+        self.assertIsNone(tarefas.reservar_proxima())
+
+        tarefas.executar_tarefa(primeira)
+        self.assertEqual(Tarefa.objects.get(id=primeira.id).status, Tarefa.CONCLUIDA)
+        self.assertEqual(tarefas.reservar_proxima().id, ids[2])
+        self.assertEqual(Tarefa.objects.filter(status=Tarefa.EXECUTANDO).count(), 2)
+        self.assertTrue(Trava.objects.filter(chave=tarefas.TRAVA_FILA).exists())
+
+    def test_abandonadas_liberam_o_limite(self):
+        with self.em(0):
+            ids = [tarefas.enfileirar('teste', {}).id for _ in range(3)]
+            Tarefa.objects.update(disponivel_em=self.instante)
+            reservadas = [tarefas.reservar_proxima(), tarefas.reservar_proxima()]
+        # A primeira continua enviando sinal de vida; a segunda foi abandonada pelo worker
+        with self.em(100):
+            self.assertTrue(tarefas.renovar_reserva(reservadas[0]))
+        with self.em(119):
+            self.assertIsNone(tarefas.reservar_proxima())
+        with self.em(200):
+            proxima = tarefas.reservar_proxima()
+            # A abandonada volta ao fim da fila e ocupa o lugar liberado na reserva seguinte
+            self.assertEqual(proxima.id, ids[2])
+            self.assertEqual(Tarefa.objects.get(id=ids[1]).status, Tarefa.PENDENTE)
+            tarefas.executar_tarefa(proxima)
+            recuperada = tarefas.reservar_proxima()
+        self.assertEqual((recuperada.id, recuperada.tentativas), (ids[1], 2))
+        self.assertEqual(Tarefa.objects.get(id=ids[0]).status, Tarefa.EXECUTANDO)
+
+    def test_abandonada_sem_tentativas_falha(self):
+        with self.em(0):
+            tarefa = tarefas.enfileirar('teste', {})
+            Tarefa.objects.filter(id=tarefa.id).update(disponivel_em=self.instante, tentativas=2)
+            tarefas.reservar_proxima()
+        with self.em(500):
+            self.assertIsNone(tarefas.reservar_proxima())
+        tarefa = Tarefa.objects.get(id=tarefa.id)
+        self.assertEqual((tarefa.status, tarefa.erro), (Tarefa.FALHOU, "Tempo limite de execução excedido."))
+
+    def test_reserva_perdida_nao_grava_resultado(self):
+        # A execução lenta perde a reserva e a tarefa é executada por outro worker
+        with self.em(0):
+            tarefas.enfileirar('teste', {})
+            Tarefa.objects.update(disponivel_em=self.instante)
+            lenta = tarefas.reservar_proxima()
+        with self.em(300):
+            nova = tarefas.reservar_proxima()
+        self.assertEqual((nova.id, nova.tentativas), (lenta.id, 2))
+        self.assertFalse(tarefas.renovar_reserva(lenta))
+
+        tarefas.executar_tarefa(lenta)
+        self.assertEqual(Tarefa.objects.get(id=lenta.id).status, Tarefa.EXECUTANDO)
+        tarefas.executar_tarefa(nova)
+        tarefa = Tarefa.objects.get(id=lenta.id)
+        self.assertEqual((tarefa.status, tarefa.status_http, tarefa.resultado), (Tarefa.CONCLUIDA, 200, {'ok': True}))
+        self.assertEqual(self.executados, [1, 2])
+
+    @override_settings(TAREFAS_TEMPO_LIMITE=0.2)
+    def test_reserva_renovada_durante_a_execucao(self):
+        tarefas.enfileirar('teste', {})
+        renovacoes = []
+        with patch('backend.tarefas.renovar_reserva', side_effect=lambda tarefa: renovacoes.append(tarefa.id) or True):
+            with patch.dict(tarefas.EXECUTORES, {'teste': lambda tarefa: time.sleep(0.3) or (200, {})}):
+                tarefa = tarefas.executar_tarefa(tarefas.reservar_proxima())
+        self.assertEqual(tarefa.status, Tarefa.CONCLUIDA)
+        self.assertGreaterEqual(len(renovacoes), 2)
+
+
+# --- Leitura dos relatórios ---------------------------------------------------------------
+
+# Linhas de alelos do relatório de teste: (célula de alelos, valor), a partir da linha 11
+LINHAS_RELATORIO = [
+    ('A*02:01', 5321.5),
+    ('A*02:06, A*24:02', '1234,5'),  # Vários alelos na mesma célula e valor com vírgula decimal
+    ('-', 10.0),
+    (None, None),
+    ('B*07:02', 'n/a'),  # Valor inválido
+    ('XYZ', 42.0),  # Alelo malformado
+    ('DRB1*04:01 , -', 0.0),
+    ('B*44:03', 999.99),
+    ('DQB1*06:02', 15000),
+]
+
+
+def linhas_legado(conteudo, extensao):
+    """
+    Leitura do relatório como na view `upload_excel` original (DataFrame do pandas com a
+    planilha inteira). Retorna a data do exame e os pares (alelo, valor) aceitos.
+    """
+    import pandas as pd
+
+    df = pd.read_excel(io.BytesIO(conteudo), engine='openpyxl' if extensao == 'xlsx' else 'xlrd').fillna('')
+    celula_data = df[df.apply(lambda row: row.astype(str).str.contains('TEST DATE', case=False).any(), axis=1)]
+    coluna = df.columns.get_loc(celula_data.columns[celula_data.iloc[0].astype(str).str.contains('TEST DATE', case=False)][0])
+    data_exame = df.iat[celula_data.index[0], coluna + 4]
+    data_exame = datetime.strptime(data_exame, "%d/%m/%Y").date() if isinstance(data_exame, str) else data_exame.date()
+
+    linhas = []
+    for alelo_celula, valor in zip(df.iloc[9:, 35], df.iloc[9:, 15]):
+        if not alelo_celula or alelo_celula.strip() in ["-", ""]:
+            continue
+        for alelo in alelo_celula.split(","):
+            alelo = alelo.strip()
+            if alelo in ["-", ""] or interpretar_alelo(alelo) is None:
+                continue
+            try:
+                linhas.append((alelo, float(str(valor).replace(',', '.'))))
+            except ValueError:
+                continue
+    return data_exame, linhas
+
+
+class LeituraRelatoriosTest(TestCase):
+    """
+    Os leitores em streaming (openpyxl para .xlsx e xlrd para .xls) devem produzir as
+    mesmas linhas que a leitura original com o pandas.
+    """
+
+    DATA_EXAME = date(2024, 3, 15)
+
+    def planilha_xlsx(self, data_exame):
+        import openpyxl
+
+        planilha_excel = openpyxl.Workbook()
+        planilha = planilha_excel.active
+        planilha.cell(1, 1, 'LABScreen Single Antigen')
+        planilha.cell(3, 2, 'TEST DATE:')
+        planilha.cell(3, 2 + DESLOCAMENTO_DATA, data_exame)
+        for i, (alelos, valor) in enumerate(LINHAS_RELATORIO):
+            planilha.cell(LINHA_INICIAL_ALELOS + i, COLUNA_VALOR, valor)
+            planilha.cell(LINHA_INICIAL_ALELOS + i, COLUNA_ALELO, alelos)
+        conteudo = io.BytesIO()
+        planilha_excel.save(conteudo)
+        return conteudo.getvalue()
+
+    def planilha_xls(self, data_exame):
+        try:
+            import xlwt
+        except ImportError:
+            self.skipTest("xlwt não instalado")
+
+        planilha_excel = xlwt.Workbook()
+        planilha = planilha_excel.add_sheet('Relatorio')
+        planilha.write(0, 0, 'LABScreen Single Antigen')
+        planilha.write(2, 1, 'TEST DATE:')
+        estilo = xlwt.easyxf(num_format_str='DD/MM/YYYY') if isinstance(data_exame, datetime) else xlwt.Style.default_style
+        planilha.write(2, 1 + DESLOCAMENTO_DATA, data_exame, estilo)
+        for i, (alelos, valor) in enumerate(LINHAS_RELATORIO):
+            if valor is not None:
+                planilha.write(LINHA_INICIAL_ALELOS - 1 + i, COLUNA_VALOR - 1, valor)
+            if alelos is not None:
+                planilha.write(LINHA_INICIAL_ALELOS - 1 + i, COLUNA_ALELO - 1, alelos)
+        conteudo = io.BytesIO()
+        planilha_excel.save(conteudo)
+        return conteudo.getvalue()
+
+    def assertMesmasLinhas(self, conteudo, extensao):
+        relatorio = ler_relatorio_bytes(f'relatorio.{extensao}', conteudo)
+        data_exame, linhas = linhas_legado(conteudo, extensao)
+        self.assertEqual(relatorio.data_exame, data_exame)
+        self.assertEqual(relatorio.data_exame, self.DATA_EXAME)
+        self.assertEqual([(linha.nome, linha.valor) for linha in relatorio.linhas], linhas)
+        self.assertEqual(relatorio.ignorados, 2)
+        return relatorio
+
+    def test_xlsx(self):
+        relatorio = self.assertMesmasLinhas(self.planilha_xlsx(self.DATA_EXAME.strftime('%d/%m/%Y')), 'xlsx')
+        self.assertEqual([linha.nome for linha in relatorio.linhas],
+                         ['A*02:01', 'A*02:06', 'A*24:02', 'DRB1*04:01', 'B*44:03', 'DQB1*06:02'])
+        self.assertEqual(relatorio.linhas[1], LinhaAlelo('A*02:06', 'A*', 2, 6, 1234.5))
+        self.assertMesmasLinhas(self.planilha_xlsx(datetime(2024, 3, 15)), 'xlsx')
+
+    def test_xls(self):
+        self.assertMesmasLinhas(self.planilha_xls(self.DATA_EXAME.strftime('%d/%m/%Y')), 'xls')
+        self.assertMesmasLinhas(self.planilha_xls(datetime(2024, 3, 15)), 'xls')
+
+    def test_erros(self):
+        with self.assertRaisesMessage(ErroRelatorio, "Formato de arquivo não suportado"):
+            ler_relatorio_bytes('relatorio.csv', b'a,b')
+        with self.assertRaisesMessage(ErroRelatorio, "Data do exame ausente"):
+            ler_relatorio_bytes('relatorio.xlsx', self.planilha_xlsx('2024-03-15'))
+
+
+# --- Desempenho dos endpoints -----------------------------------------------------------
+# Fora da suíte padrão (os limites de tempo dependem da máquina). Apenas esta suíte:
+# `BENCHMARK_ENDPOINTS=1 python manage.py test backend --tag desempenho` (DB_ENGINE=sqlite para
+# rodar localmente; sem a variável, usa o PostgreSQL configurado). Volumes e limites podem ser
+# ajustados por variáveis de ambiente; com BENCHMARK_SAIDA, os resultados de cada execução são
+# acrescentados (uma linha JSON por execução) a esse arquivo, para comparar execuções ao longo do tempo.
+
+BENCHMARK_ENDPOINTS = os.environ.get('BENCHMARK_ENDPOINTS', '') not in ('', '0')
+BENCHMARK_PACIENTES = int(os.environ.get('BENCHMARK_PACIENTES', 2000))
+BENCHMARK_REPETICOES = int(os.environ.get('BENCHMARK_REPETICOES', 3))
+BENCHMARK_FATOR_LATENCIA = float(os.environ.get('BENCHMARK_FATOR_LATENCIA', 1))
+BENCHMARK_SAIDA = os.environ.get('BENCHMARK_SAIDA')
+
+
+def relatorio_excel(alelos, data_exame, aleatorio):
+    """
+    Relatório sintético no layout do equipamento: "TEST DATE" com a data quatro colunas à
+    direita e, a partir da linha 11, o valor na coluna P e os alelos na coluna AJ.
+    """
+    import openpyxl
+
+    planilha_excel = openpyxl.Workbook()
+    planilha = planilha_excel.active
+    planilha.cell(1, 1, 'LABScreen Single Antigen')
+    planilha.cell(3, 2, 'TEST DATE:')
+    planilha.cell(3, 2 + DESLOCAMENTO_DATA, data_exame.strftime('%d/%m/%Y'))
+    for i, nome in enumerate(alelos):
+        planilha.cell(LINHA_INICIAL_ALELOS + i, COLUNA_VALOR, round(aleatorio.uniform(0, 15000), 2))
+        planilha.cell(LINHA_INICIAL_ALELOS + i, COLUNA_ALELO, nome)
+    conteudo = io.BytesIO()
+    planilha_excel.save(conteudo)
+    return conteudo.getvalue()
+
+
+def consultas_insercao(linhas):
+    # INSERTs de um bulk_create com até `linhas` linhas: no SQLite cada comando aceita
+    # no máximo 999 parâmetros (cerca de 100 linhas nas tabelas gravadas pelas views)
+    return -(-linhas // 100) if connection.vendor == 'sqlite' else -(-linhas // 1000)
+
+
+@tag('desempenho')
+@skipUnless(BENCHMARK_ENDPOINTS, "defina BENCHMARK_ENDPOINTS=1 para medir os endpoints")
+@override_settings(UPLOAD_LOTE_PROCESSOS=1, CROSSMATCH_ENGINE='matriz', REQUISICAO_LENTA_MS=60000)
+class DesempenhoEndpointsTest(TestCase):
+    """
+    Executa cada endpoint de `backend/urls.py` sobre um volume realista de dados e verifica
+    a quantidade máxima de consultas SQL e o tempo máximo (mediana) de cada um.
+    """
+
+    resultados = []
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pasta = tempfile.mkdtemp()
+        aleatorio = random.Random(7)
+        caminho_painel = os.path.join(cls.pasta, 'painel.csv')
+        with open(caminho_painel, 'w', newline='') as arquivo:
+            escritor = csv.writer(arquivo)
+            escritor.writerow(['antigenos', 'frequencia'])
+            for _ in range(500):
+                fenotipo = [f"{locus}{numero1:02d}" for locus, alelos in PAINEL_SAB.items()
+                            for numero1, _ in aleatorio.sample(alelos, 2)]
+                escritor.writerow([' '.join(fenotipo), round(aleatorio.uniform(0.1, 2), 3)])
+        cls.configuracao = override_settings(CPRA_PAINEL=caminho_painel)
+        cls.configuracao.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.configuracao.disable()
+        shutil.rmtree(cls.pasta, ignore_errors=True)
+        if cls.resultados and BENCHMARK_SAIDA:
+            with open(BENCHMARK_SAIDA, 'a', encoding='utf-8') as saida:
+                saida.write(json.dumps({
+                    'data': datetime.now().isoformat(timespec='seconds'),
+                    'banco': connection.vendor,
+                    'pacientes': BENCHMARK_PACIENTES,
+                    'repeticoes': BENCHMARK_REPETICOES,
+                    'endpoints': sorted(cls.resultados, key=lambda resultado: resultado['endpoint']),
+                }, ensure_ascii=False) + '\n')
+
+    @classmethod
+    def setUpTestData(cls):
+        aleatorio = random.Random(42)
+        Alelo.objects.bulk_create([
+            Alelo(nome=f"{locus}{numero1:02d}:{numero2:02d}", tipo=locus[:2], numero1=numero1, numero2=numero2)
+            for locus, alelos in PAINEL_SAB.items() for numero1, numero2 in alelos
+        ])
+        cls.nomes_alelos = list(Alelo.objects.order_by('id').values_list('nome', flat=True))
+        alelos = list(Alelo.objects.values_list('id', flat=True))
+
+        Paciente.objects.bulk_create([
+            Paciente(nome=f"Paciente {i:05d}", data_nascimento=date(1950, 1, 1) + timedelta(days=i * 7),
+                     tipo_sanguineo=aleatorio.choice(TIPOS_SANGUINEOS))
+            for i in range(BENCHMARK_PACIENTES)
+        ])
+        # Históricos de 1 a 4 exames por paciente, cada um com o painel completo
+        Exame.objects.bulk_create([
+            Exame(paciente_id=paciente_id, data_exame=date(2018, 1, 1) + timedelta(days=30 * k + aleatorio.randint(0, 20)))
+            for paciente_id in Paciente.objects.values_list('id', flat=True)
+            for k in range(aleatorio.randint(1, 4))
+        ])
+        # Maioria dos alelos negativos e alguns fortemente positivos, como em pacientes sensibilizados
+        ExameAlelo.objects.bulk_create([
+            ExameAlelo(exame_id=exame_id, alelo_id=alelo_id,
+                       valor=aleatorio.uniform(2000, 15000) if aleatorio.random() < 0.15 else aleatorio.uniform(0, 800))
+            for exame_id in Exame.objects.values_list('id', flat=True)
+            for alelo_id in alelos
+        ], batch_size=5000)
+        reconstruir_resumos()
+        calcular_cpra()
+
+        cls.doadores = [
+            {
+                'donor_id': i, 'donor_name': f"Doador {i}", 'donor_sex': 'M', 'donor_birth_date': '1980-01-01',
+                'donor_blood_type': aleatorio.choice(TIPOS_SANGUINEOS),
+                'alelos': [{'tipo': locus[:2], 'numero': numero1}
+                           for locus, alelos_locus in PAINEL_SAB.items() for numero1, _ in aleatorio.sample(alelos_locus, 2)],
+            }
+            for i in range(20)
+        ]
+        for doador in cls.doadores[:10]:
+            salvar_resultado(doador, executar_crossmatch(doador['alelos'], doador['donor_blood_type']))
+        cls.crossmatch = Crossmatch.objects.order_by('id').first()
+
+        # Pacientes com mais exames (os primeiros da lista são usados nos testes de leitura)
+        cls.pacientes = list(Paciente.objects.annotate(total=Count('exames')).order_by('-total', 'id').values_list('id', flat=True))
+        cls.exame = Exame.objects.filter(paciente_id=cls.pacientes[0]).order_by('-data_exame').first()
+        cls.tarefa = enfileirar('calcular_cpra', {'paciente_ids': cls.pacientes[:10]})
+        cls.relatorio = relatorio_excel(cls.nomes_alelos, date(2024, 3, 15), aleatorio)
+
+    def setUp(self):
+        cache_resultados.limpar()
+        # Matriz carregada, como nos workers aquecidos: as escritas a atualizam no on_commit
+        matriz = MatrizMFI()
+        patcher = patch('backend.crossmatch.matriz_mfi', matriz)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        matriz.sincronizar()
+
+    def medir(self, endpoint, requisicao, consultas, latencia_ms, repeticoes=None, aquecer=True):
+        """
+        Executa `requisicao` (função sem argumentos que retorna a resposta) e verifica o status,
+        a quantidade máxima de consultas e a mediana do tempo em relação aos limites. Os
+        callbacks `on_commit` das escritas (versões, matriz MFI) são executados e contados,
+        com os SAVEPOINTs que o TestCase acrescenta a cada transação.
+        """
+        if aquecer:
+            with self.captureOnCommitCallbacks(execute=True):
+                requisicao()
+        duracoes, maximo_consultas = [], 0
+        for _ in range(repeticoes or BENCHMARK_REPETICOES):
+            cache_resultados.limpar()
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                with self.captureOnCommitCallbacks(execute=True):
+                    resposta = requisicao()
+                duracoes.append((time.perf_counter() - inicio) * 1000)
+            self.assertLess(resposta.status_code, 400, getattr(resposta, 'content', b'')[:500])
+            maximo_consultas = max(maximo_consultas, len(capturadas))
+
+        limite_ms = latencia_ms * BENCHMARK_FATOR_LATENCIA
+        mediana = statistics.median(duracoes)
+        self.resultados.append({
+            'endpoint': endpoint, 'consultas': maximo_consultas, 'limite_consultas': consultas,
+            'mediana_ms': round(mediana, 2), 'maximo_ms': round(max(duracoes), 2), 'limite_ms': limite_ms,
+        })
+        self.assertLessEqual(maximo_consultas, consultas, f"{endpoint}: {maximo_consultas} consultas (limite {consultas})")
+        self.assertLessEqual(mediana, limite_ms, f"{endpoint}: {mediana:.1f} ms (limite {limite_ms:.0f} ms)")
+        return resposta
+
+    # Pacientes
+
+    def test_lista_pacientes(self):
+        self.medir('GET pacientes/', lambda: self.client.get('/api/pacientes/?limite=100'), 2, 100)
+
+    def test_lista_pacientes_sensibilizacao(self):
+        self.medir('GET pacientes/?sensibilizacao=1', lambda: self.client.get('/api/pacientes/?sensibilizacao=1&limite=100'), 2, 150)
+
+    def test_cria_paciente(self):
+        corpo = {'nome': 'Paciente novo', 'data_nascimento': '1990-05-01', 'tipo_sanguineo': 'O+'}
+        self.medir('POST pacientes/', lambda: self.client.post('/api/pacientes/', corpo, content_type='application/json'),
+                   16, 100, aquecer=False)
+
+    def test_detalhe_paciente(self):
+        paciente_id = self.pacientes[0]
+        self.medir('GET pacientes/<id>/', lambda: self.client.get(f'/api/pacientes/{paciente_id}/'), 2, 50)
+
+    def test_atualiza_paciente(self):
+        paciente_id = self.pacientes[0]
+        corpo = {'nome': 'Paciente alterado', 'data_nascimento': '1990-05-01', 'tipo_sanguineo': 'O+'}
+        self.medir('PUT pacientes/<id>/', lambda: self.client.put(f'/api/pacientes/{paciente_id}/', corpo, content_type='application/json'),
+                   18, 100, aquecer=False)
+
+    def test_exclui_paciente(self):
+        paciente_ids = iter(self.pacientes)
+        self.medir('DELETE pacientes/<id>/', lambda: self.client.delete(f'/api/pacientes/{next(paciente_ids)}/'),
+                   42, 300, aquecer=False)
+
+    def test_exclui_pacientes_lote(self):
+        lotes = iter([self.pacientes[i:i + 100] for i in range(0, len(self.pacientes), 100)])
+        self.medir('POST pacientes/excluir/', lambda: self.client.post('/api/pacientes/excluir/', {'ids': next(lotes)},
+                                                                      content_type='application/json'),
+                   41, 1500, aquecer=False)
+
+    # Exames
+
+    def test_exames_por_paciente(self):
+        paciente_id = self.pacientes[0]
+        self.medir('GET pacientes/<id>/exames/', lambda: self.client.get(f'/api/pacientes/{paciente_id}/exames/'), 2, 50)
+
+    def test_alelos_do_exame(self):
+        url = f'/api/pacientes/{self.exame.paciente_id}/exames/{self.exame.id}/alelos/'
+        self.medir('GET pacientes/<id>/exames/<id>/alelos/', lambda: self.client.get(url), 3, 100)
+
+    def test_alelos_do_exame_msgpack(self):
+        url = f'/api/pacientes/{self.exame.paciente_id}/exames/{self.exame.id}/alelos/'
+        self.medir('GET pacientes/<id>/exames/<id>/alelos/ (msgpack)',
+                   lambda: self.client.get(url, HTTP_ACCEPT='application/msgpack'), 3, 100)
+
+    def test_lista_exames(self):
+        self.medir('GET exames/', lambda: self.client.get('/api/exames/'), 2, 1000)
+
+    def test_detalhe_exame(self):
+        self.medir('GET exames/<id>/', lambda: self.client.get(f'/api/exames/{self.exame.id}/'), 2, 50)
+
+    def test_upload_excel(self):
+        paciente_ids = iter(self.pacientes[100:])
+
+        def enviar():
+            arquivo = SimpleUploadedFile('relatorio.xlsx', self.relatorio)
+            return self.client.post(f'/api/pacientes/{next(paciente_ids)}/exames/upload/', {'file': arquivo})
+
+        self.medir('POST pacientes/<id>/exames/upload/', enviar, 37, 1500, aquecer=False)
+
+    def test_upload_excel_lote(self):
+        def enviar():
+            pacientes = self.pacientes[200:210]
+            conteudo = io.BytesIO()
+            with zipfile.ZipFile(conteudo, 'w') as pacote:
+                for paciente_id in pacientes:
+                    pacote.writestr(f'paciente_{paciente_id}.xlsx', self.relatorio)
+                pacote.writestr('manifesto.json', json.dumps({f'paciente_{i}.xlsx': i for i in pacientes}))
+            return self.client.post('/api/exames/upload/lote/', {'files': SimpleUploadedFile('lote.zip', conteudo.getvalue())})
+
+        self.medir('POST exames/upload/lote/ (10 arquivos)', enviar, 10 * 34, 10000, repeticoes=1, aquecer=False)
+
+    # Virtual crossmatch
+
+    def test_virtual_crossmatch(self):
+        doador = self.doadores[10]
+        self.medir('POST newvxm/virtual_crossmatch/',
+                   lambda: self.client.post('/api/newvxm/virtual_crossmatch/', doador, content_type='application/json'), 2, 1000)
+
+    def test_virtual_crossmatch_persistido(self):
+        doador = self.doadores[11]
+        self.medir('POST newvxm/virtual_crossmatch/?persist=true',
+                   lambda: self.client.post('/api/newvxm/virtual_crossmatch/?persist=true', doador, content_type='application/json'),
+                   8 + consultas_insercao(BENCHMARK_PACIENTES), 3000, aquecer=False)
+
+    def test_virtual_crossmatch_lote(self):
+        corpo = {'doadores': self.doadores}
+        self.medir('POST newvxm/virtual_crossmatch/lote/ (20 doadores)',
+                   lambda: self.client.post('/api/newvxm/virtual_crossmatch/lote/', corpo, content_type='application/json'), 2, 5000)
+
+    def test_salva_crossmatch(self):
+        doador = self.doadores[12]
+        corpo = {**doador, 'results': executar_crossmatch(doador['alelos'], doador['donor_blood_type'])}
+        self.medir('POST save_crossmatch_result/',
+                   lambda: self.client.post('/api/save_crossmatch_result/', corpo, content_type='application/json'),
+                   8 + consultas_insercao(BENCHMARK_PACIENTES), 3000, aquecer=False)
+
+    def test_historico_vxm(self):
+        self.medir('GET vxm-history/', lambda: self.client.get('/api/vxm-history/'), 4, 3000)
+
+    def test_historico_vxm_resumo(self):
+        self.medir('GET vxm-history/?resumo=1', lambda: self.client.get('/api/vxm-history/?resumo=1'), 3, 500)
+
+    def test_detalhe_vxm(self):
+        self.medir('GET vxm-details/<id>/', lambda: self.client.get(f'/api/vxm-details/{self.crossmatch.id}/'), 4, 1000)
+
+    def test_detalhe_vxm_arrow(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow não instalado")
+        self.medir('GET vxm-details/<id>/ (arrow)', lambda: self.client.get(
+            f'/api/vxm-details/{self.crossmatch.id}/', HTTP_ACCEPT='application/vnd.apache.arrow.stream'), 4, 1000)
+
+    # cPRA e tarefas
+
+    def test_lista_cpra(self):
+        self.medir('GET cpra/', lambda: self.client.get('/api/cpra/?limite=100'), 1, 100)
+
+    def test_calcula_cpra(self):
+        self.medir('POST cpra/calcular/', lambda: self.client.post('/api/cpra/calcular/', {}, content_type='application/json'),
+                   4 + consultas_insercao(BENCHMARK_PACIENTES), 5000, repeticoes=1, aquecer=False)
+
+    def test_cpra_paciente(self):
+        paciente_id = self.pacientes[0]
+        self.medir('GET pacientes/<id>/cpra/', lambda: self.client.get(f'/api/pacientes/{paciente_id}/cpra/'), 3, 100)
+
+    def test_detalhe_tarefa(self):
+        self.medir('GET tarefas/<id>/', lambda: self.client.get(f'/api/tarefas/{self.tarefa.id}/'), 1, 50)
+
+
+# --- Compatibilidade das listas ----------------------------------------------------------
+
+class ListasSemPaginacaoTest(TestCase):
+    """
+    Sem `limite` nem `cursor`, as listas paginadas por cursor continuam respondendo como
+    antes da paginação: a lista completa, no formato original.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        alelo = Alelo.objects.create(nome='A*02:01', tipo='A*', numero1=2, numero2=1)
+        for i in range(3):
+            doador = {'donor_id': i, 'donor_name': f"Doador {i}", 'donor_sex': 'M', 'donor_birth_date': '1980-01-01',
+                      'donor_blood_type': 'O+'}
+            salvar_resultado(doador, {7: {'nome': 'Paciente', 'alelos_correspondentes': [
+                {'nome': alelo.nome, 'valor': 1500.0 + i, 'compatibilidade': False}]}})
+        # Mais pacientes que o limite padrão da paginação, com nomes repetidos
+        Paciente.objects.bulk_create([
+            Paciente(nome=f"Paciente {i % 40:02d}", data_nascimento=date(1970, 1, 1) + timedelta(days=i), tipo_sanguineo='A+')
+            for i in range(LIMITE_PADRAO + 20)
+        ])
+
+    def test_pacientes(self):
+        resposta = self.client.get('/api/pacientes/')
+        self.assertEqual(resposta.status_code, 200)
+        # Mesmo corpo da view original: PacienteSerializer de todos os pacientes em ordem alfabética
+        esperado = PacienteSerializer(Paciente.objects.order_by('nome', 'id'), many=True).data
+        self.assertEqual(resposta.json(), json.loads(json.dumps(esperado)))
+        self.assertEqual(len(resposta.json()), LIMITE_PADRAO + 20)
+
+        filtrados = self.client.get('/api/pacientes/?prefixo=paciente 1&sensibilizacao=1').json()
+        self.assertEqual([paciente['nome'] for paciente in filtrados], ['Paciente 10', 'Paciente 10', 'Paciente 11', 'Paciente 11',
+                                                                        'Paciente 12', 'Paciente 12', 'Paciente 13', 'Paciente 13',
+                                                                        'Paciente 14', 'Paciente 14', 'Paciente 15', 'Paciente 15',
+                                                                        'Paciente 16', 'Paciente 16', 'Paciente 17', 'Paciente 17',
+                                                                        'Paciente 18', 'Paciente 18', 'Paciente 19', 'Paciente 19'])
+        self.assertIsNone(filtrados[0]['sensibilizacao'])
+
+        pagina = self.client.get('/api/pacientes/?limite=30').json()
+        self.assertEqual(pagina['results'], resposta.json()[:30])
+        self.assertEqual(self.client.get(pagina['next']).json()['results'], resposta.json()[30:60])
+        self.assertEqual(len(self.client.get('/api/pacientes/?cursor=').json()['results']), LIMITE_PADRAO)
+        self.assertEqual(self.client.get('/api/pacientes/?nascimento_fim=ontem').status_code, 400)
+
+    def test_historico_vxm(self):
+        resposta = self.client.get('/api/vxm-history/')
+        self.assertEqual(resposta.status_code, 200)
+        esperado = CrossmatchSerializer(
+            [carregar_crossmatch(vxm.id) for vxm in Crossmatch.objects.order_by('-date_performed', '-id')], many=True).data
+        self.assertEqual(resposta.json(), json.loads(json.dumps(esperado)))
+        self.assertEqual(len(resposta.json()), 3)
+        self.assertEqual(resposta.json()[0]['patient_results'][0]['allele_results'][0]['allele_value'], 1502.0)
+
+        resumo = self.client.get('/api/vxm-history/?resumo=1&donor_id=1').json()
+        self.assertEqual([vxm['donor_id'] for vxm in resumo], [1])
+
+        pagina = self.client.get('/api/vxm-history/?limite=2').json()
+        self.assertEqual(set(pagina), {'next', 'results'})
+        self.assertEqual(pagina['results'], resposta.json()[:2])
+        self.assertEqual(self.client.get(pagina['next']).json()['results'], resposta.json()[2:])
+
+
+# --- Views assíncronas ------------------------------------------------------------------
+
+class ViewsAssincronasTest(TestCase):
+    """
+    As views de views_async devem responder exatamente como as views do DRF que substituem
+    (status, corpo, formato, ETag e autenticação JWT).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        aleatorio = random.Random(3)
+        Alelo.objects.bulk_create([
+            Alelo(nome=f"{locus}{numero1:02d}:{numero2:02d}", tipo=locus[:2], numero1=numero1, numero2=numero2)
+            for locus, alelos in PAINEL_SAB.items() for numero1, numero2 in alelos
+        ])
+        alelos = list(Alelo.objects.values_list('id', flat=True))
+        Paciente.objects.bulk_create([
+            Paciente(nome=f"Paciente {i:03d}", data_nascimento=date(1960, 1, 1) + timedelta(days=i * 90),
+                     tipo_sanguineo=aleatorio.choice(TIPOS_SANGUINEOS))
+            for i in range(40)
+        ])
+        Exame.objects.bulk_create([
+            Exame(paciente_id=paciente_id, data_exame=date(2022, 1, 1) + timedelta(days=aleatorio.randint(0, 700)))
+            for paciente_id in Paciente.objects.values_list('id', flat=True) for _ in range(2)
+        ])
+        ExameAlelo.objects.bulk_create([
+            ExameAlelo(exame_id=exame_id, alelo_id=alelo_id, valor=round(aleatorio.uniform(0, 5000), 2))
+            for exame_id in Exame.objects.values_list('id', flat=True) for alelo_id in alelos
+        ])
+        reconstruir_resumos()
+        for i in range(3):
+            doador = {
+                'donor_id': i, 'donor_name': f"Doador {i}", 'donor_sex': 'F', 'donor_birth_date': '1975-06-01',
+                'donor_blood_type': 'O+',
+                'alelos': [{'tipo': locus[:2], 'numero': numero1}
+                           for locus, alelos_locus in PAINEL_SAB.items() for numero1, _ in aleatorio.sample(alelos_locus, 2)],
+            }
+            salvar_resultado(doador, executar_crossmatch(doador['alelos'], doador['donor_blood_type']))
+        cls.paciente = Paciente.objects.order_by('id').first()
+        cls.exame = Exame.objects.filter(paciente=cls.paciente).first()
+        cls.crossmatch = Crossmatch.objects.order_by('id').first()
+        cls.usuario = User.objects.create_user('usuario', password='senha-de-teste')
+
+    def comparar(self, nome, caminho, cabecalhos=None, **kwargs):
+        sincrona = getattr(views, nome)(RequestFactory().get(caminho, headers=cabecalhos), **kwargs)
+        if hasattr(sincrona, 'render'):
+            sincrona.render()
+        assincrona = async_to_sync(getattr(views_async, nome))(AsyncRequestFactory().get(caminho, headers=cabecalhos), **kwargs)
+        self.assertEqual(assincrona.status_code, sincrona.status_code, assincrona.content[:300])
+        self.assertEqual(assincrona.content, sincrona.content)
+        for cabecalho in ('Content-Type', 'ETag', 'Allow', 'WWW-Authenticate'):
+            self.assertEqual(assincrona.get(cabecalho), sincrona.get(cabecalho), cabecalho)
+        return assincrona
+
+    def test_pacientes(self):
+        self.comparar('lista_cria_pacientes', '/api/pacientes/')
+        self.comparar('lista_cria_pacientes', '/api/pacientes/?limite=7')
+        self.comparar('lista_cria_pacientes', '/api/pacientes/?sensibilizacao=1&q=00&nascimento_inicio=1961-01-01')
+        self.comparar('lista_cria_pacientes', '/api/pacientes/?nascimento_fim=ontem')
+        resposta = async_to_sync(views_async.lista_cria_pacientes)(AsyncRequestFactory().get('/api/pacientes/?limite=7'))
+        cursor = json.loads(resposta.content)['next'].split('cursor=')[1]
+        self.comparar('lista_cria_pacientes', f'/api/pacientes/?limite=7&cursor={cursor}')
+        self.comparar('detalhe_paciente', '/', paciente_id=self.paciente.id)
+        self.comparar('detalhe_paciente', '/', paciente_id=0)
+
+    def test_exames(self):
+        self.comparar('exames_por_paciente', '/', paciente_id=self.paciente.id)
+        self.comparar('lista_exames', '/api/exames/')
+        self.comparar('detalhe_exame', '/', exame_id=self.exame.id)
+        self.comparar('detalhe_exame', '/', exame_id=0)
+        self.comparar('exames_alelos_por_paciente_exame', '/', paciente_id=self.paciente.id, exame_id=self.exame.id)
+        self.comparar('exames_alelos_por_paciente_exame', '/', paciente_id=self.paciente.id + 1, exame_id=self.exame.id)
+        self.comparar('exames_alelos_por_paciente_exame', '/', {'Accept': 'image/png'},
+                      paciente_id=self.paciente.id, exame_id=self.exame.id)
+
+    def test_formato_binario(self):
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            self.skipTest("msgpack não instalado")
+        cabecalhos = {'Accept': 'application/msgpack'}
+        self.comparar('exames_alelos_por_paciente_exame', '/', cabecalhos, paciente_id=self.paciente.id, exame_id=self.exame.id)
+        self.comparar('detail_vxm', '/', cabecalhos, vxm_id=self.crossmatch.id)
+
+    def test_vxm(self):
+        self.comparar('list_vxm', '/api/vxm-history/')
+        self.comparar('list_vxm', '/api/vxm-history/?resumo=1&limite=2')
+        self.comparar('list_vxm', f'/api/vxm-history/?patient_id={self.paciente.id}&data_inicio=2020-01-01')
+        self.comparar('list_vxm', '/api/vxm-history/?donor_id=x')
+        self.comparar('detail_vxm', '/', vxm_id=self.crossmatch.id)
+        self.comparar('detail_vxm', '/', vxm_id=0)
+
+    def test_autenticacao_jwt(self):
+        self.assertEqual(self.comparar('lista_exames', '/api/exames/', {'Authorization': 'Bearer invalido'}).status_code, 401)
+        self.comparar('lista_exames', '/api/exames/', {'Authorization': 'Bearer com espacos'})
+        token = str(AccessToken.for_user(self.usuario))
+        self.assertEqual(self.comparar('lista_exames', '/api/exames/', {'Authorization': f'Bearer {token}'}).status_code, 200)
+        self.usuario.delete()
+        self.assertEqual(self.comparar('lista_exames', '/api/exames/', {'Authorization': f'Bearer {token}'}).status_code, 401)
+
+    def test_resposta_condicional(self):
+        etag = self.comparar('lista_exames', '/api/exames/')['ETag']
+        self.assertEqual(self.comparar('lista_exames', '/api/exames/', {'If-None-Match': etag}).status_code, 304)
+
+    def test_escritas_repassadas_as_views_do_drf(self):
+        resposta = async_to_sync(views_async.detalhe_paciente)(AsyncRequestFactory().put(
+            '/', {'nome': 'Novo nome', 'data_nascimento': '1970-01-01', 'tipo_sanguineo': 'A+'},
+            content_type='application/json'), paciente_id=self.paciente.id)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(Paciente.objects.get(id=self.paciente.id).nome, 'Novo nome')
+        resposta = async_to_sync(views_async.lista_exames)(AsyncRequestFactory().post('/api/exames/'))
+        self.assertEqual(resposta.status_code, 405)
+
+    async def test_middleware_assincrono_conta_consultas(self):
+        resposta = await self.async_client.get('/api/pacientes/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertRegex(resposta['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* consultas"')
@@ -1,23 +1,39 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, views_async
+
+# Sob ASGI (VIEWS_ASSINCRONAS=True), as leituras são atendidas pelas views assíncronas, com as
+# mesmas rotas, nomes e respostas; as escritas continuam nas views do DRF
+leitura = views_async if getattr(settings, 'VIEWS_ASSINCRONAS', False) else views
 
 urlpatterns = [
 
     # Pacientes
-    path('pacientes/', views.lista_cria_pacientes, name='lista_cria_pacientes'),  # Listar e criar pacientes
-    path('pacientes/<int:paciente_id>/', views.detalhe_paciente, name='detalhe_paciente'),  # Visualizar e atualizar paciente específico
-    path('pacientes/<int:paciente_id>/exames/', views.exames_por_paciente, name='exames_por_paciente'),  # Exames de um paciente
-    path('pacientes/<int:paciente_id>/exames/<int:exame_id>/alelos/', views.exames_alelos_por_paciente_exame, name='exames_alelos_por_paciente_exame'),  # Alelos de um exame específico
+    path('pacientes/', leitura.lista_cria_pacientes, name='lista_cria_pacientes'),  # Listar e criar pacientes
+    path('pacientes/excluir/', views.excluir_pacientes_lote, name='excluir_pacientes_lote'),  # Excluir vários pacientes e seus dados
+    path('pacientes/<int:paciente_id>/', leitura.detalhe_paciente, name='detalhe_paciente'),  # Visualizar e atualizar paciente específico
+    path('pacientes/<int:paciente_id>/exames/', leitura.exames_por_paciente, name='exames_por_paciente'),  # Exames de um paciente
+    path('pacientes/<int:paciente_id>/exames/<int:exame_id>/alelos/', leitura.exames_alelos_por_paciente_exame, name='exames_alelos_por_paciente_exame'),  # Alelos de um exame específico
     path('pacientes/<int:patient_id>/exames/upload/', views.upload_excel, name='upload_excel'),  # Upload de exames via Excel
+    path('pacientes/<int:paciente_id>/cpra/', views.cpra_paciente, name='cpra_paciente'),  # cPRA de um paciente
+    path('exames/upload/lote/', views.upload_excel_lote, name='upload_excel_lote'),  # Upload de vários exames (.zip ou vários arquivos + manifesto)
 
     # Virtual Crossmatch
     path('newvxm/virtual_crossmatch/', views.virtual_crossmatch, name='virtual_crossmatch'),  # Realizar novo Virtual Crossmatch
+    path('newvxm/virtual_crossmatch/lote/', views.virtual_crossmatch_lote, name='virtual_crossmatch_lote'),  # Virtual Crossmatch de vários doadores
     path('save_crossmatch_result/', views.save_crossmatch_result, name='save_crossmatch_result'),  # Salvar resultados do Virtual Crossmatch
 
     # VXM History and Details
-    path('vxm-history/', views.list_vxm, name='vxm_history'),  # Listar todos os VXMs
-    path('vxm-details/<int:vxm_id>/', views.detail_vxm, name='vxm_details'),  # Detalhes de um VXM específico
+    path('vxm-history/', leitura.list_vxm, name='vxm_history'),  # Listar todos os VXMs
+    path('vxm-details/<int:vxm_id>/', leitura.detail_vxm, name='vxm_details'),  # Detalhes de um VXM específico
+
+    # cPRA (calculated panel-reactive antibody)
+    path('cpra/', views.lista_cpra, name='lista_cpra'),  # cPRA gravado dos pacientes
+    path('cpra/calcular/', views.calcular_cpra_lista, name='calcular_cpra'),  # Recalcular o cPRA da lista de espera
+
+    # Tarefas assíncronas
+    path('tarefas/<int:tarefa_id>/', views.detalhe_tarefa, name='detalhe_tarefa'),  # Situação e resultado de uma tarefa
 
-    path('exames/', views.lista_exames, name='lista_exames'),
-    path('exames/<int:exame_id>/', views.detalhe_exame, name='detalhe_exame'),
+    path('exames/', leitura.lista_exames, name='lista_exames'),
+    path('exames/<int:exame_id>/', leitura.detalhe_exame, name='detalhe_exame'),
 ]
@@ -0,0 +1,106 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.db import transaction
+from django.db.models import F
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from .models import VersaoDados
+
+# Chave global: qualquer alteração em pacientes, exames ou alelos de exames
+DADOS = 'dados'
+
+# Chaves por recurso, usadas nas respostas condicionais (ETag / Last-Modified) das views de leitura
+PACIENTES = 'pacientes'
+EXAMES = 'exames'  # Exames e seus alelos
+CROSSMATCHES = 'crossmatch'
+
+
+def obter_versao(chave=DADOS):
+    """
+    Retorna a versão atual de um conjunto de dados (0 se nunca foi alterado).
+    """
+    versao = VersaoDados.objects.filter(chave=chave).values_list('versao', flat=True).first()
+    return versao or 0
+
+
+def incrementar_versao(chave=DADOS):
+    """
+    Incrementa atomicamente a versão de um conjunto de dados e retorna o novo valor.
+    """
+    with transaction.atomic():
+        registro, _ = VersaoDados.objects.select_for_update().get_or_create(chave=chave)
+        registro.versao = F('versao') + 1
+        registro.save(update_fields=['versao', 'atualizado_em'])
+        registro.refresh_from_db(fields=['versao'])
+    return registro.versao
+
+
+def registrar_escrita(*chaves):
+    """
+    Incrementa as versões dos recursos alterados dentro da transação atual, que deve ser a
+    mesma que gravou os dados: as novas versões são confirmadas (ou desfeitas) junto com eles.
+    Os registros ficam travados até o fim da transação e são sempre travados na mesma ordem
+    (a versão global primeiro), para que escritas simultâneas não entrem em deadlock.
+    """
+    for chave in sorted(set(chaves), key=lambda chave: (chave != DADOS, chave)):
+        incrementar_versao(chave)
+
+
+def _validadores(request, chaves, registros):
+    # ETag e data da última alteração a partir de {chave: (versao, atualizado_em)}
+    etag = '-'.join(f"{chave}.{registros.get(chave, (0,))[0]}" for chave in chaves)
+    # Representações diferentes do mesmo recurso (JSON, Arrow, MessagePack) têm ETags diferentes
+    formato = getattr(getattr(request, 'accepted_renderer', None), 'format', 'json')
+    etag = quote_etag(etag if formato in ('json', 'api') else f"{etag}-{formato}")
+    datas = [atualizado_em for _, atualizado_em in registros.values()]
+    return etag, int(max(datas).timestamp()) if datas else None
+
+
+def _completar_resposta(resposta, etag, ultima_alteracao):
+    # A resposta 304 também informa o ETag atual, como a resposta 200 que ela substitui
+    if resposta.status_code in (200, 304):
+        resposta.headers.setdefault('ETag', etag)
+        if ultima_alteracao is not None:
+            resposta.headers.setdefault('Last-Modified', http_date(ultima_alteracao))
+    patch_vary_headers(resposta, ['Accept'])
+    return resposta
+
+
+def condicional(*chaves):
+    """
+    Decorador de views de leitura: responde 304 Not Modified quando o ETag ou a data
+    enviados pelo cliente correspondem às versões atuais dos recursos, sem executar
+    a view. Também adiciona os cabeçalhos ETag e Last-Modified às respostas 200.
+    Aceita views síncronas e assíncronas (estas consultam as versões com o ORM assíncrono).
+    """
+    def decorador(view):
+        versoes = VersaoDados.objects.filter(chave__in=chaves).values_list('chave', 'versao', 'atualizado_em')
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def view_condicional_async(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+
+                registros = {chave: (versao, atualizado_em) async for chave, versao, atualizado_em in versoes.all()}
+                etag, ultima_alteracao = _validadores(request, chaves, registros)
+                resposta = get_conditional_response(request, etag=etag, last_modified=ultima_alteracao)
+                if resposta is None:
+                    resposta = await view(request, *args, **kwargs)
+                return _completar_resposta(resposta, etag, ultima_alteracao)
+            return view_condicional_async
+
+        @wraps(view)
+        def view_condicional(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            registros = {chave: (versao, atualizado_em) for chave, versao, atualizado_em in versoes.all()}
+            etag, ultima_alteracao = _validadores(request, chaves, registros)
+            resposta = get_conditional_response(request, etag=etag, last_modified=ultima_alteracao)
+            if resposta is None:
+                resposta = view(request, *args, **kwargs)
+            return _completar_resposta(resposta, etag, ultima_alteracao)
+        return view_condicional
+    return decorador
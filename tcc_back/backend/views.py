@@ -5,19 +5,105 @@ from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import User
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.conf import settings  # Import settings to access SECRET_KEY
-import pandas as pd
 from django.http import JsonResponse
-from .models import Paciente, Exame, ExameAlelo, Alelo, Crossmatch, CrossmatchPatientResult, CrossmatchAlleleResult
-from .serializers import PacienteSerializer, ExameSerializer, ExameAleloSerializer, CrossmatchSerializer, CrossmatchPatientResultSerializer, CrossmatchAlleleResultSerializer, UserSerializer
-from datetime import datetime
+from django.db import transaction
+from django.db.models import Prefetch
+from .models import Paciente, Exame, ExameAlelo, Alelo, CpraPaciente, Crossmatch, CrossmatchPatientResult, Tarefa
+from .serializers import PacienteSerializer, ExameSerializer, ExameAleloSerializer, CrossmatchSerializer, CrossmatchPatientResultSerializer, CrossmatchAlleleResultSerializer, UserSerializer, TarefaSerializer, CrossmatchResumoSerializer, CpraPacienteSerializer
+from .crossmatch import (
+    executar_crossmatch, executar_crossmatch_lote, registrar_alteracao,
+    CAMPOS_DOADOR, validar_resultados, salvar_resultado, carregar_crossmatch, anexar_alelos,
+)
+from .ingestao import gravar_exame, preparar_lote, importar_lote
+from .relatorios import ErroRelatorio, ler_relatorio
+from .tarefas import enfileirar
+from .cpra import ErroPainel, calcular_cpra, cpra_atual
+from .exclusao import MAXIMO_LOTE, excluir_pacientes
+from .renderizadores import RENDERIZADORES, formato_binario, tabela_crossmatch, tabela_exames_alelos, tabela_vxm
+from .leitura import resposta_json, valores_pacientes, linhas_pacientes, linhas_exames, linhas_exames_alelos
+from .versoes import PACIENTES, EXAMES, CROSSMATCHES, condicional, registrar_escrita
+from .paginacao import ErroPaginacao, paginar, paginacao_solicitada, ler_limite, url_proxima_pagina
+from datetime import date
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 import logging
-import json
-from rest_framework.decorators import permission_classes
+from rest_framework.decorators import permission_classes, renderer_classes
 
-# Configuração do logger
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _opcao(request, nome):
+    # Opções booleanas podem vir na query string (?nome=1) ou no corpo da requisição
+    valor = request.query_params.get(nome)
+    if valor is None and isinstance(request.data, dict):
+        valor = request.data.get(nome)
+    return str(valor).lower() in ('1', 'true')
+
+
+def _assincrono(request):
+    # Requisições com ?assincrono=1 são enfileiradas e respondidas com 202 Accepted
+    return _opcao(request, 'assincrono')
+
+
+def _resposta_tarefa(tarefa):
+    return Response({
+        "tarefa_id": tarefa.id,
+        "status": tarefa.status,
+        "url": reverse('detalhe_tarefa', args=[tarefa.id]),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+# Ordem da lista de pacientes: alfabética (o id desempata o cursor)
+ORDEM_PACIENTES = ['nome', 'id']
+
+
+def filtrar_pacientes(params):
+    """
+    Pacientes filtrados pelos parâmetros da busca: q (trecho do nome), prefixo (início do nome),
+    tipo_sanguineo, nascimento_inicio e nascimento_fim (AAAA-MM-DD). Datas inválidas geram ValueError.
+    """
+    pacientes = Paciente.objects.all()
+    if params.get('q'):
+        pacientes = pacientes.filter(nome__icontains=params['q'])
+    if params.get('prefixo'):
+        pacientes = pacientes.filter(nome__istartswith=params['prefixo'])
+    if params.get('tipo_sanguineo'):
+        pacientes = pacientes.filter(tipo_sanguineo=params['tipo_sanguineo'])
+    if params.get('nascimento_inicio'):
+        pacientes = pacientes.filter(data_nascimento__gte=date.fromisoformat(params['nascimento_inicio']))
+    if params.get('nascimento_fim'):
+        pacientes = pacientes.filter(data_nascimento__lte=date.fromisoformat(params['nascimento_fim']))
+    return pacientes
+
+
+# Ordem do histórico de VXMs: do mais recente para o mais antigo (o id desempata o cursor)
+ORDEM_VXMS = ['-date_performed', '-id']
+
+
+def filtrar_vxms(params, resumo=False):
+    """
+    Crossmatches filtrados por data_inicio e data_fim (AAAA-MM-DD), donor_id, donor_name e patient_id,
+    com os resultados dos pacientes pré-carregados. Valores inválidos geram ValueError.
+    """
+    vxms = Crossmatch.objects.all()
+    if params.get('data_inicio'):
+        vxms = vxms.filter(date_performed__date__gte=date.fromisoformat(params['data_inicio']))
+    if params.get('data_fim'):
+        vxms = vxms.filter(date_performed__date__lte=date.fromisoformat(params['data_fim']))
+    if params.get('donor_id'):
+        vxms = vxms.filter(donor_id=int(params['donor_id']))
+    if params.get('patient_id'):
+        vxms = vxms.filter(id__in=CrossmatchPatientResult.objects.filter(
+            patient_id=int(params['patient_id'])).values('crossmatch_id'))
+    if params.get('donor_name'):
+        vxms = vxms.filter(donor_name__icontains=params['donor_name'])
+
+    # Os níveis aninhados são carregados com uma consulta cada, independentemente do tamanho da página
+    if resumo:
+        # O resumo não usa os alelos: os arrays empacotados não são lidos
+        return vxms.prefetch_related(Prefetch('patient_results', queryset=CrossmatchPatientResult.objects.defer(
+            'alelos', 'valores', 'compatibilidades')))
+    return vxms.prefetch_related('patient_results')
+
 
 class CreateUserView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -26,21 +112,48 @@ class CreateUserView(generics.CreateAPIView):
 
 @api_view(['GET', 'POST'])
 @permission_classes([])
+@condicional(PACIENTES, EXAMES)
 def lista_cria_pacientes(request):
     if request.method == 'GET':
-        pacientes = Paciente.objects.all().order_by('nome')  # Ordena os pacientes em ordem alfabética
-        serializer = PacienteSerializer(pacientes, many=True)
-        return JsonResponse(serializer.data, safe=False, json_dumps_params={'ensure_ascii': False})
+        # Busca em ordem alfabética. Com limite e/ou cursor, a resposta é paginada por cursor
+        # ({"next", "results"}); sem eles, retorna a lista completa, como antes da paginação.
+        # Filtros: q (trecho do nome), prefixo (início do nome), tipo_sanguineo,
+        # nascimento_inicio e nascimento_fim (AAAA-MM-DD).
+        # Com ?sensibilizacao=1 inclui o resumo do último exame de cada paciente
+        params = request.query_params
+        sensibilizacao = _opcao(request, 'sensibilizacao')
+        paginado = paginacao_solicitada(request)
+        try:
+            pacientes = valores_pacientes(filtrar_pacientes(params), sensibilizacao)
+            if paginado:
+                pagina, proximo = paginar(pacientes, ORDEM_PACIENTES, params.get('cursor'), ler_limite(request))
+            else:
+                pagina = pacientes.order_by(*ORDEM_PACIENTES)
+        except (ErroPaginacao, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Caminho rápido: mesmos campos de PacienteSerializer, sem instanciar os modelos
+        linhas = linhas_pacientes(pagina, sensibilizacao)
+        if not paginado:
+            return resposta_json(linhas)
+        return resposta_json({
+            "next": url_proxima_pagina(request, proximo),
+            "results": linhas,
+        })
     elif request.method == 'POST':
         serializer = PacienteSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                paciente = serializer.save()
+                registrar_alteracao([paciente.id])
+                registrar_escrita(PACIENTES)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([])
+@condicional(PACIENTES)
 def detalhe_paciente(request, paciente_id):
     try:
         # Buscar o paciente pelo ID
@@ -57,60 +170,76 @@ def detalhe_paciente(request, paciente_id):
         # Atualizar os dados do paciente
         serializer = PacienteSerializer(paciente, data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                registrar_alteracao([paciente_id])
+                registrar_escrita(PACIENTES)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'DELETE':
-        # Excluir os crossmatches relacionados ao paciente
-        crossmatch_patient_results = CrossmatchPatientResult.objects.filter(patient_id=paciente_id)
-        for result in crossmatch_patient_results:
-            # Deletar os alelos associados ao resultado
-            CrossmatchAlleleResult.objects.filter(patient_result=result).delete()
-            # Deletar o resultado do paciente no crossmatch
-            result.delete()
+        # Excluir o paciente, seus exames e seus resultados de crossmatch em uma única transação
+        excluir_pacientes([paciente_id])
+        return Response({"mensagem": "Paciente e dados relacionados deletados com sucesso"}, status=status.HTTP_204_NO_CONTENT)
 
-        # Excluir o paciente e seus exames (cascata devido a `on_delete=models.CASCADE`)
-        paciente.delete()
 
-        return Response({"mensagem": "Paciente e dados relacionados deletados com sucesso"}, status=status.HTTP_204_NO_CONTENT)
+@api_view(['POST'])
+@permission_classes([])
+def excluir_pacientes_lote(request):
+    """
+    Exclui vários pacientes e seus dados relacionados: {"ids": [1, 2, 3]}.
+    Retorna a quantidade de registros excluídos de cada tabela.
+    """
+    ids = request.data.get('ids') if isinstance(request.data, dict) else None
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return Response({"error": "Informe os pacientes no formato {\"ids\": [1, 2, 3]}."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > MAXIMO_LOTE:
+        return Response({"error": f"No máximo {MAXIMO_LOTE} pacientes por requisição."}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(excluir_pacientes(ids), status=status.HTTP_200_OK)
 
 
 @api_view(['GET'])
 @permission_classes([])
+@condicional(EXAMES)
 def exames_por_paciente(request, paciente_id):
     exames = Exame.objects.filter(paciente_id=paciente_id).order_by('-data_exame')
-    serializer = ExameSerializer(exames, many=True)
-    return JsonResponse(serializer.data, safe=False, json_dumps_params={'ensure_ascii': False})
+    return resposta_json(linhas_exames(exames))
 
 @api_view(['GET'])
+@renderer_classes(RENDERIZADORES)
 @permission_classes([])
+@condicional(EXAMES)
 def exames_alelos_por_paciente_exame(request, paciente_id, exame_id):
+    formato = formato_binario(request)
     exames = Exame.objects.filter(id=exame_id, paciente_id=paciente_id)
-    
+
     if not exames.exists():
         return Response({"erro": "Exame não encontrado para este paciente"}, status=status.HTTP_404_NOT_FOUND)
 
+    # Os dados do alelo vêm na mesma consulta (antes era uma consulta por alelo)
     exames_alelos = ExameAlelo.objects.filter(exame_id=exame_id).order_by('alelo__nome')
-    serializer = ExameAleloSerializer(exames_alelos, many=True)
-    return JsonResponse(serializer.data, safe=False, json_dumps_params={'ensure_ascii': False})
+    if formato:
+        return Response(tabela_exames_alelos(exames_alelos))
+    return resposta_json(linhas_exames_alelos(exames_alelos))
 
 
 @api_view(['GET'])
 @permission_classes([])  # Atualize a permissão conforme necessário (ex.: [IsAuthenticated])
+@condicional(EXAMES)
 def lista_exames(request):
     """
     Retorna a lista de todos os exames.
     """
     try:
         exames = Exame.objects.all().order_by('-data_exame')  # Ordena por data decrescente
-        serializer = ExameSerializer(exames, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return resposta_json(linhas_exames(exames))
     except Exception as e:
         return Response({"error": f"Erro ao buscar exames: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 @permission_classes([])  
+@condicional(EXAMES)
 def detalhe_exame(request, exame_id):
     """
     Retorna os detalhes de um exame específico.
@@ -124,140 +253,120 @@ def detalhe_exame(request, exame_id):
 
 
 @api_view(['POST'])
+@renderer_classes(RENDERIZADORES)
 @permission_classes([])
 def virtual_crossmatch(request):
-    
+    # Com Accept: application/vnd.apache.arrow.stream ou application/msgpack a resposta é colunar
+    formato = formato_binario(request)
+
     # Recebe a lista de alelos específicos com tipo e número do front-end
     alelos_especificos = request.data.get('alelos', [])
-    logger.info(f"Payload recebido: {json.dumps(request.data)}")
     donor_blood_type = request.data.get('donor_blood_type')  # Recebe o tipo sanguíneo do doador
     if donor_blood_type is None:
         logger.info("Tipo sanguíneo ausente ou inválido")
 
-    # Log do tipo sanguíneo do doador
-    logger.info(f"Tipo sanguíneo do doador: {donor_blood_type}")
+    # Com persist=true o resultado é gravado no servidor, sem precisar reenviá-lo a save_crossmatch_result
+    persistir = _opcao(request, 'persist')
+    # O crossmatch gravado exige o id do doador (inteiro), além dos demais dados
+    donor_id = request.data.get('donor_id')
+    if persistir and (not all(campo in request.data for campo in CAMPOS_DOADOR)
+                      or not isinstance(donor_id, int) or isinstance(donor_id, bool)):
+        logger.error("Dados do doador incompletos ou inválidos.")
+        return Response({"error": "Dados do doador incompletos ou inválidos."}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Filtrar `Alelos` que correspondam ao tipo e número dos alelos enviados
-    alelo_filters = [
-        (alelo['tipo'], int(alelo['numero']))
-        for alelo in alelos_especificos if alelo['numero'] != "0"
-    ]
+    # Crossmatch pesado (ex.: lista de espera inteira) pode ser executado pela fila de tarefas
+    if _assincrono(request):
+        parametros = {campo: request.data.get(campo) for campo in ['alelos', 'donor_id', *CAMPOS_DOADOR]}
+        tarefa = enfileirar('virtual_crossmatch', {**parametros, 'persist': persistir})
+        return _resposta_tarefa(tarefa)
 
-    # Carregar dados para os DataFrames, incluindo filtro por tipo sanguíneo
-    pacientes = Paciente.objects.filter(tipo_sanguineo=donor_blood_type).values('id', 'nome', 'tipo_sanguineo')
-    pacientes_df = pd.DataFrame(list(pacientes))
-
-    # Log dos tipos sanguíneos dos pacientes encontrados
-    logger.info(f"Pacientes com tipo sanguíneo compatível: {list(pacientes)}")
+    # Executa o crossmatch com o motor configurado (matriz residente em memória por padrão)
+    pacientes_compatibilidade = executar_crossmatch(alelos_especificos, donor_blood_type)
 
     # Caso não existam pacientes com o tipo sanguíneo correspondente, retornar vazio
-    if pacientes_df.empty:
+    if pacientes_compatibilidade is None:
         logger.warning("Nenhum paciente encontrado com o tipo sanguíneo compatível.")
         return Response({"message": "Nenhum paciente encontrado com o tipo sanguíneo compatível."}, status=404)
 
-    exames_df = pd.DataFrame(list(Exame.objects.all().values('id', 'paciente_id', 'data_exame')))
-
-    # Filtra os alelos que correspondem ao `tipo` e `numero1` enviados
-    exames_alelos_df = pd.DataFrame(list(
-        ExameAlelo.objects.select_related('alelo')
-        .filter(alelo__tipo__in=[f[0] for f in alelo_filters], alelo__numero1__in=[f[1] for f in alelo_filters])
-        .values('exame_id', 'alelo__nome', 'valor', 'exame__paciente_id')
-    ))
-
-    # Encontra o último exame de cada paciente
-    ultimos_exames = exames_df.loc[exames_df.groupby('paciente_id')['data_exame'].idxmax()]
-
-    # Filtra os alelos específicos nos últimos exames de cada paciente com tipo sanguíneo igual ao do doador
-    exames_alelos_filtrados = exames_alelos_df[
-        exames_alelos_df['exame_id'].isin(ultimos_exames['id']) &
-        exames_alelos_df['exame__paciente_id'].isin(pacientes_df['id'])
-    ]
-
-    # Para cada paciente, armazena os alelos correspondentes e seus valores
-    pacientes_compatibilidade = {}
-    for paciente_id, grupo in exames_alelos_filtrados.groupby('exame__paciente_id'):
-        correspondencias = []
-        for _, row in grupo.iterrows():
-            correspondencias.append({
-                'nome': row['alelo__nome'],
-                'valor': row['valor'],
-                'compatibilidade': row['valor'] < 1000  # True se o valor for < 1000, False caso contrário
-            })
-        pacientes_compatibilidade[paciente_id] = {
-            'nome': pacientes_df[pacientes_df['id'] == paciente_id]['nome'].values[0],
-            'alelos_correspondentes': correspondencias
-        }
-
-    # Log dos resultados finais
-    logger.info(f"Compatibilidade dos pacientes: {pacientes_compatibilidade}")
+    # Resumo do resultado (sem os dados dos pacientes), em campos estruturados
+    logger.info("Virtual crossmatch concluído", extra={
+        'alelos_doador': len(alelos_especificos),
+        'tipo_sanguineo': donor_blood_type,
+        'pacientes': len(pacientes_compatibilidade),
+    })
+
+    if persistir:
+        try:
+            crossmatch = salvar_resultado(request.data, pacientes_compatibilidade)
+            crossmatch = carregar_crossmatch(crossmatch.id)
+        except Exception as e:
+            logger.error("Erro ao salvar crossmatch: %s", str(e))
+            return Response({"error": f"Erro ao salvar crossmatch: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if formato:
+            return Response(tabela_vxm(crossmatch), status=status.HTTP_201_CREATED)
+        return Response(CrossmatchSerializer(crossmatch).data, status=status.HTTP_201_CREATED)
+
+    if formato:
+        return Response(tabela_crossmatch(pacientes_compatibilidade))
 
     # Retorna a compatibilidade para cada paciente no formato JSON
     return Response(pacientes_compatibilidade)
 
 
+@api_view(['POST'])
+@permission_classes([])
+def virtual_crossmatch_lote(request):
+    """
+    Executa o Virtual Crossmatch para vários doadores com uma única carga dos dados.
+    Cada item de `doadores` tem `alelos` e `donor_blood_type`, como em `virtual_crossmatch`.
+    """
+    doadores = request.data.get('doadores')
+    if not isinstance(doadores, list) or not doadores:
+        return Response({"error": "Informe a lista de doadores."}, status=status.HTTP_400_BAD_REQUEST)
+
+    logger.info("Crossmatch em lote recebido para %d doadores", len(doadores))
+    try:
+        resultados = executar_crossmatch_lote(doadores)
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        logger.warning("Dados de doador inválidos no crossmatch em lote: %s", e)
+        return Response({"error": f"Dados de doador inválidos: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    resposta = []
+    for doador, pacientes_compatibilidade in zip(doadores, resultados):
+        item = {'donor_id': doador.get('donor_id'), 'donor_blood_type': doador.get('donor_blood_type')}
+        if pacientes_compatibilidade is None:
+            item['message'] = "Nenhum paciente encontrado com o tipo sanguíneo compatível."
+        else:
+            item['resultado'] = pacientes_compatibilidade
+        resposta.append(item)
+
+    return Response(resposta)
+
+
 @api_view(['POST'])
 @permission_classes([])
 def save_crossmatch_result(request):
     data = request.data
-    logger.info("Dados recebidos no backend: %s", data)  # Log dos dados recebidos
+    logger.info("Resultado de crossmatch recebido para o doador %s", data.get('donor_name'))
 
     try:
         # Verificação de campos obrigatórios no Crossmatch
-        required_fields = ['donor_name', 'donor_sex', 'donor_birth_date', 'donor_blood_type', 'results']
+        required_fields = CAMPOS_DOADOR + ['results']
         if not all(field in data for field in required_fields):
             logger.error("Dados do doador incompletos ou inválidos.")
             return Response({"error": "Dados do doador incompletos ou inválidos."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Cria o registro de crossmatch usando os dados do doador
-        crossmatch = Crossmatch.objects.create(
-            donor_id=data.get('donor_id'),  # Inclui o donor_id, se fornecido
-            donor_name=data['donor_name'],
-            donor_sex=data['donor_sex'],
-            donor_birth_date=data['donor_birth_date'],
-            donor_blood_type=data['donor_blood_type'],
-            date_performed=datetime.now()
-        )
-        logger.info("Crossmatch criado com ID: %s", crossmatch.id)
-
-        # Processa cada resultado do paciente
-        for patient_id, patient_data in data['results'].items():
-            logger.info("Processando paciente ID: %s, Nome: %s", patient_id, patient_data.get('nome'))
-            if 'nome' not in patient_data or 'alelos_correspondentes' not in patient_data:
-                logger.error("Dados do paciente %s incompletos.", patient_id)
-                return Response({"error": f"Dados do paciente {patient_id} incompletos."}, status=status.HTTP_400_BAD_REQUEST)
-
-            total_compatible = sum(1 for alelo in patient_data['alelos_correspondentes'] if alelo['compatibilidade'])
-            total_incompatible = sum(1 for alelo in patient_data['alelos_correspondentes'] if not alelo['compatibilidade'])
-
-            # Cria o resultado do paciente
-            patient_result = CrossmatchPatientResult.objects.create(
-                crossmatch=crossmatch,
-                patient_id=patient_id,
-                patient_name=patient_data['nome'],
-                total_compatible_alleles=total_compatible,
-                total_incompatible_alleles=total_incompatible
-            )
-            logger.info("Resultado do paciente criado com ID: %s, Total Compatível: %d, Total Incompatível: %d",
-                        patient_result.id, total_compatible, total_incompatible)
-
-            # Processa cada alelo do paciente
-            for allele in patient_data['alelos_correspondentes']:
-                logger.info("Salvando alelo: Nome: %s, Valor: %s, Compatibilidade: %s",
-                            allele['nome'], allele['valor'], allele['compatibilidade'])
-                try:
-                    CrossmatchAlleleResult.objects.create(
-                        patient_result=patient_result,
-                        allele_name=allele['nome'],
-                        allele_value=allele['valor'],
-                        compatibility=allele['compatibilidade']
-                    )
-                    logger.info("Alelo salvo com sucesso: %s", allele['nome'])
-                except Exception as allele_error:
-                    logger.error("Erro ao salvar alelo %s: %s", allele['nome'], allele_error)
-                    raise allele_error
+        # Valida todos os pacientes antes de gravar qualquer registro
+        erro = validar_resultados(data['results'])
+        if erro:
+            logger.error(erro)
+            return Response({"error": erro}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Grava o crossmatch, os pacientes e os alelos em uma única transação
+        crossmatch = salvar_resultado(data, data['results'])
 
         # Serializa o resultado completo para retornar na resposta
-        crossmatch_serializer = CrossmatchSerializer(crossmatch)
+        crossmatch_serializer = CrossmatchSerializer(carregar_crossmatch(crossmatch.id))
         logger.info("Crossmatch processado com sucesso.")
         return Response(crossmatch_serializer.data, status=status.HTTP_201_CREATED)
 
@@ -266,28 +375,58 @@ def save_crossmatch_result(request):
         return Response({"error": f"Erro ao salvar crossmatch: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-
 @api_view(['GET'])
 @permission_classes([])
+@condicional(CROSSMATCHES)
 def list_vxm(request):
-    vxms = Crossmatch.objects.all().order_by('-date_performed')
-    serialized_vxms = CrossmatchSerializer(vxms, many=True)
-    return Response(serialized_vxms.data)
+    """
+    Histórico de VXMs do mais recente para o mais antigo.
+    Filtros: data_inicio e data_fim (AAAA-MM-DD), donor_id, donor_name e patient_id.
+    Com resumo=true, os alelos de cada paciente são omitidos.
+    Com limite e/ou cursor, a resposta é paginada por cursor ({"next", "results"});
+    sem eles, retorna a lista completa, como antes da paginação.
+    """
+    params = request.query_params
+    resumo = _opcao(request, 'resumo')
+    paginado = paginacao_solicitada(request)
+    try:
+        vxms = filtrar_vxms(params, resumo)
+        if paginado:
+            pagina, proximo = paginar(vxms, ORDEM_VXMS, params.get('cursor'), ler_limite(request))
+        else:
+            pagina = list(vxms.order_by(*ORDEM_VXMS))
+    except (ErroPaginacao, ValueError) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not resumo:
+        # Nomes dos alelos de todos os resultados da página em uma única consulta
+        anexar_alelos([resultado for vxm in pagina for resultado in vxm.patient_results.all()])
+
+    serializer_class = CrossmatchResumoSerializer if resumo else CrossmatchSerializer
+    dados = serializer_class(pagina, many=True).data
+    if not paginado:
+        return Response(dados)
+    return Response({
+        "next": url_proxima_pagina(request, proximo),
+        "results": dados,
+    })
 
 @api_view(['GET'])
+@renderer_classes(RENDERIZADORES)
 @permission_classes([])
+@condicional(CROSSMATCHES)
 def detail_vxm(request, vxm_id):
+    formato = formato_binario(request)
     try:
-        vxm = Crossmatch.objects.get(id=vxm_id)
+        vxm = carregar_crossmatch(vxm_id)
+        if formato:
+            return Response(tabela_vxm(vxm))
         serialized_vxm = CrossmatchSerializer(vxm)
         return Response(serialized_vxm.data)
     except Crossmatch.DoesNotExist:
         return Response({"error": "Crossmatch não encontrado"}, status=404)
     
 
-# Configurar logging
-logger = logging.getLogger(__name__)
-
 @api_view(['POST'])
 @permission_classes([])
 def upload_excel(request, patient_id):
@@ -295,116 +434,121 @@ def upload_excel(request, patient_id):
     if not file:
         return JsonResponse({"error": "Nenhum arquivo foi enviado."}, status=400)
 
-    # Verificar extensão do arquivo
-    file_extension = file.name.split('.')[-1].lower()
-    try:
-        if file_extension == 'xlsx':
-            df = pd.read_excel(file, engine='openpyxl')
-        elif file_extension == 'xls':
-            df = pd.read_excel(file, engine='xlrd')
-        else:
-            return JsonResponse({"error": "Formato de arquivo não suportado. Use arquivos .xls ou .xlsx."}, status=400)
-    except Exception as e:
-        return JsonResponse({"error": f"Erro ao processar o arquivo Excel: {str(e)}"}, status=400)
-
-    # Preencher valores NaN com strings vazias
-    df = df.fillna('')
+    # Uploads grandes podem ser processados pela fila de tarefas
+    if _assincrono(request):
+        tarefa = enfileirar('upload_excel', {'patient_id': patient_id}, arquivo=file)
+        return _resposta_tarefa(tarefa)
 
-    # Verificar a presença de "TEST DATE" para obter a data do exame
-    test_date_cell = df[df.apply(lambda row: row.astype(str).str.contains('TEST DATE', case=False).any(), axis=1)]
-    if not test_date_cell.empty:
-        row_idx = test_date_cell.index[0]
-        col_idx = df.columns.get_loc(
-            test_date_cell.columns[test_date_cell.iloc[0].astype(str).str.contains("TEST DATE", case=False)][0]
-        )
-        exam_date_str = df.iat[row_idx, col_idx + 4]
-
-        # Converter a data
-        try:
-            if isinstance(exam_date_str, str):
-                exam_date = datetime.strptime(exam_date_str, "%d/%m/%Y").date()
-            elif isinstance(exam_date_str, datetime):
-                exam_date = exam_date_str.date()
-            else:
-                raise ValueError
-        except ValueError:
-            return JsonResponse({"error": "Data do exame ausente ou em formato incorreto."}, status=400)
-    else:
-        return JsonResponse({"error": "Campo 'TEST DATE' não encontrado."}, status=400)
+    # Lê e interpreta o relatório inteiro antes de gravar qualquer dado
+    try:
+        relatorio = ler_relatorio(file)
+    except ErroRelatorio as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
     # Verificar se o paciente existe
     paciente = get_object_or_404(Paciente, id=patient_id)
 
     try:
-        # Definir as colunas de alelo e valor "normal"
-        alelo_col = df.iloc[9:, 35]  # Coluna AJ para 'Allele Specificity'
-        normal_col = df.iloc[9:, 15]     # Coluna P para 'normal'
-
-        # Criar ou obter o exame
-        exame, created = Exame.objects.get_or_create(paciente=paciente, data_exame=exam_date)
-
-        # Processar cada linha das colunas de alelos e valores
-        for alelo_name, normal_value in zip(alelo_col, normal_col):
-            # Ignorar células que só têm "-" ou espaços e vírgulas
-            if not alelo_name or alelo_name.strip() in ["-", "", None]:
-                continue
-            
-            # Separar múltiplos valores no campo de alelo
-            alelo_name = alelo_name.split(",")
-            
-            # Processar cada alelo válido na lista
-            for main_alelo in alelo_name:
-                main_alelo = main_alelo.strip()
-                if main_alelo in ["-", "", None]:
-                    continue  # Ignorar células vazias ou com marcador "-"
-
-                # Separar tipo, numero1 e numero2
-                if '*' in main_alelo:
-                    tipo = main_alelo[:2]  # Extrair apenas os dois primeiros caracteres para o campo `tipo`
-                    numeros = main_alelo.split('*')[1]
-                    try:
-                        numero1, numero2 = map(int, numeros.split(':'))
-                    except ValueError:
-                        logger.warning(f"Alelo malformado ignorado: {main_alelo}")
-                        continue  # Pular alelos com formato incorreto
-                else:
-                    logger.warning(f"Alelo malformado ignorado: {main_alelo}")
-                    continue  # Pular alelos malformados ou sem '*'
-
-                # Verificar ou criar alelo
-                alelo, created = Alelo.objects.get_or_create(
-                    nome=main_alelo,
-                    defaults={'tipo': tipo, 'numero1': numero1, 'numero2': numero2}
-                )
-
-                # Converter o valor para float, substituindo vírgula por ponto
-                try:
-                    normal_value = float(str(normal_value).replace(',', '.'))
-                except ValueError:
-                    logger.warning(f"Valor incorreto para o alelo {main_alelo}: {normal_value}")
-                    continue  # Ignorar valores inválidos
-
-                logger.info(f"Processando alelo: {main_alelo} com valor: {normal_value}")
-
-                # Verificar se já existe uma entrada para esse alelo no exame
-                if ExameAlelo.objects.filter(exame=exame, alelo=alelo).exists():
-                    # Se já existe, adicionar um sufixo para evitar duplicação
-                    sufixo = 1
-                    novo_nome = f"{main_alelo}.{sufixo}"
-                    while Alelo.objects.filter(nome=novo_nome).exists():
-                        sufixo += 1
-                        novo_nome = f"{main_alelo}.{sufixo}"
-                    alelo = Alelo.objects.create(
-                        nome=novo_nome,
-                        tipo=tipo,
-                        numero1=numero1,
-                        numero2=numero2
-                    )
-
-                # Associar o alelo ao exame
-                ExameAlelo.objects.create(exame=exame, alelo=alelo, valor=normal_value)
-
-        return JsonResponse({"message": "Exame e alelos processados com sucesso."}, status=201)
+        # Grava o exame e os alelos em uma única transação
+        resultado = gravar_exame(paciente, relatorio)
+        return JsonResponse({"message": "Exame e alelos processados com sucesso.", **resultado}, status=201)
     except Exception as e:
         logger.error(f"Erro ao processar o exame: {str(e)}")
         return JsonResponse({"error": f"Erro ao processar o exame: {str(e)}"}, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([])
+def upload_excel_lote(request):
+    """
+    Importa vários relatórios de uma vez: um .zip e/ou várias planilhas no campo `files`,
+    com um manifesto JSON ({"arquivo.xlsx": id_do_paciente}) no campo `manifesto`
+    ou como manifesto.json dentro do .zip.
+    """
+    arquivos = request.FILES.getlist('files')
+    if not arquivos:
+        return JsonResponse({"error": "Nenhum arquivo foi enviado."}, status=400)
+
+    try:
+        lote = preparar_lote(arquivos, request.data.get('manifesto'))
+    except ErroRelatorio as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    resultados = importar_lote(lote)
+    processados = sum(1 for resultado in resultados if resultado['status'] == 'ok')
+    logger.info("Upload em lote: %d de %d arquivos processados", processados, len(resultados))
+    return JsonResponse({
+        "processados": processados,
+        "com_erro": len(resultados) - processados,
+        "arquivos": resultados,
+    }, status=200)
+
+
+@api_view(['GET'])
+@permission_classes([])
+def lista_cpra(request):
+    """
+    cPRA gravado dos pacientes, do maior para o menor, paginado por cursor.
+    Filtro: minimo (cPRA mínimo, de 0 a 100).
+    """
+    params = request.query_params
+    calculos = CpraPaciente.objects.all()
+    try:
+        if params.get('minimo'):
+            calculos = calculos.filter(cpra__gte=float(params['minimo']))
+        pagina, proximo = paginar(calculos, ['-cpra', 'paciente_id'], params.get('cursor'), ler_limite(request))
+    except (ErroPaginacao, ValueError) as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        "next": url_proxima_pagina(request, proximo),
+        "results": CpraPacienteSerializer(pagina, many=True).data,
+    })
+
+
+@api_view(['POST'])
+@permission_classes([])
+def calcular_cpra_lista(request):
+    """
+    Recalcula o cPRA dos pacientes em `paciente_ids` ou, se omitido, de toda a lista de espera.
+    """
+    paciente_ids = request.data.get('paciente_ids')
+    if paciente_ids is not None and (not isinstance(paciente_ids, list) or not all(isinstance(i, int) for i in paciente_ids)):
+        return Response({"error": "paciente_ids deve ser uma lista de ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if _assincrono(request):
+        tarefa = enfileirar('calcular_cpra', {'paciente_ids': paciente_ids})
+        return _resposta_tarefa(tarefa)
+
+    try:
+        calculados = calcular_cpra(paciente_ids)
+    except ErroPainel as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response({"calculados": calculados})
+
+
+@api_view(['GET'])
+@permission_classes([])
+def cpra_paciente(request, paciente_id):
+    """
+    cPRA do paciente, recalculado se o último exame ou o painel mudaram desde o último cálculo.
+    """
+    get_object_or_404(Paciente, id=paciente_id)
+    try:
+        cpra = cpra_atual(paciente_id)
+    except ErroPainel as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if cpra is None:
+        return Response({"error": "Paciente sem exames."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(CpraPacienteSerializer(cpra).data)
+
+
+@api_view(['GET'])
+@permission_classes([])
+def detalhe_tarefa(request, tarefa_id):
+    """
+    Retorna a situação de uma tarefa assíncrona e, quando concluída, o seu resultado.
+    """
+    tarefa = get_object_or_404(Tarefa, id=tarefa_id)
+    serializer = TarefaSerializer(tarefa)
+    return Response(serializer.data)
@@ -0,0 +1,208 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import views
+from .crossmatch import anexar_alelos_async, carregar_crossmatch_async
+from .leitura import resposta_json, valores_pacientes, linhas_pacientes, linhas_exames_async, linhas_exames_alelos_async
+from .models import Paciente, Exame, ExameAlelo, Crossmatch
+from .paginacao import ErroPaginacao, paginar_async, paginacao_solicitada, ler_limite, url_proxima_pagina
+from .renderizadores import formato_binario, tabela_exames_alelos_async, tabela_vxm
+from .serializers import PacienteSerializer, ExameSerializer, CrossmatchSerializer, CrossmatchResumoSerializer
+from .versoes import PACIENTES, EXAMES, CROSSMATCHES, condicional
+
+# Versões assíncronas das views de leitura, servidas sob ASGI (VIEWS_ASSINCRONAS=True, ver urls.py).
+# As consultas usam o ORM assíncrono e o laço de eventos não fica preso a uma thread por requisição.
+# Rotas, autenticação JWT, formatos (JSON, Arrow, MessagePack), ETags e respostas são os mesmos das
+# views em views.py; escritas, OPTIONS e métodos não permitidos são repassados a elas.
+
+_jwt = JWTAuthentication()
+_negociacao = DefaultContentNegotiation()
+
+
+def _opcao(request, nome):
+    return str(request.GET.get(nome)).lower() in ('1', 'true')
+
+
+def _responder(request, dados, status=200):
+    # No formato negociado: os binários pelo renderizador do DRF, os demais em JSON
+    renderizador = getattr(request, 'accepted_renderer', None)
+    if getattr(renderizador, 'render_style', None) == 'binary':
+        return HttpResponse(renderizador.render(dados), status=status, content_type=renderizador.media_type)
+    return resposta_json(dados, status=status)
+
+
+def _resposta_excecao(request, excecao):
+    # Mesmo corpo e cabeçalhos do tratador de exceções do DRF
+    dados = excecao.detail if isinstance(excecao.detail, (dict, list)) else {'detail': excecao.detail}
+    resposta = _responder(request, dados, status=excecao.status_code)
+    if isinstance(excecao, AuthenticationFailed):
+        resposta['WWW-Authenticate'] = _jwt.authenticate_header(request)
+    return resposta
+
+
+async def _autenticar(request):
+    """
+    Mesma autenticação das views do DRF (JWTAuthentication): sem o cabeçalho Authorization a
+    requisição segue anônima; token inválido, expirado ou de usuário inexistente gera AuthenticationFailed.
+    """
+    cabecalho = _jwt.get_header(request)
+    if cabecalho is None:
+        return
+    token = _jwt.get_raw_token(cabecalho)
+    if token is None:
+        return
+    token_validado = _jwt.get_validated_token(token)
+    request.user = await sync_to_async(_jwt.get_user)(token_validado)
+
+
+def view_assincrona(view_sincrona):
+    """
+    Atende GET e HEAD com a view assíncrona decorada, fazendo antes a negociação de formato e a
+    autenticação como o DRF faria em `view_sincrona`; os demais métodos são repassados a ela.
+    """
+    renderizadores = [classe() for classe in view_sincrona.cls.renderer_classes]
+    permitidos = ', '.join(view_sincrona.cls().allowed_methods)
+
+    def decorador(view):
+        @csrf_exempt
+        @wraps(view)
+        async def view_api(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await sync_to_async(view_sincrona)(request, *args, **kwargs)
+            try:
+                request.accepted_renderer, request.accepted_media_type = _negociacao.select_renderer(
+                    Request(request), renderizadores)
+                await _autenticar(request)
+                resposta = await view(request, *args, **kwargs)
+            except APIException as excecao:
+                resposta = _resposta_excecao(request, excecao)
+            resposta.headers.setdefault('Allow', permitidos)
+            patch_vary_headers(resposta, ['Accept'])
+            return resposta
+        return view_api
+    return decorador
+
+
+@view_assincrona(views.lista_cria_pacientes)
+@condicional(PACIENTES, EXAMES)
+async def lista_cria_pacientes(request):
+    params = request.GET
+    sensibilizacao = _opcao(request, 'sensibilizacao')
+    paginado = paginacao_solicitada(request)
+    try:
+        pacientes = valores_pacientes(views.filtrar_pacientes(params), sensibilizacao)
+        if paginado:
+            pagina, proximo = await paginar_async(pacientes, views.ORDEM_PACIENTES, params.get('cursor'), ler_limite(request))
+        else:
+            pagina = [paciente async for paciente in pacientes.order_by(*views.ORDEM_PACIENTES)]
+    except (ErroPaginacao, ValueError) as e:
+        return resposta_json({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    linhas = linhas_pacientes(pagina, sensibilizacao)
+    if not paginado:
+        return resposta_json(linhas)
+    return resposta_json({
+        "next": url_proxima_pagina(request, proximo),
+        "results": linhas,
+    })
+
+
+@view_assincrona(views.detalhe_paciente)
+@condicional(PACIENTES)
+async def detalhe_paciente(request, paciente_id):
+    try:
+        paciente = await Paciente.objects.aget(id=paciente_id)
+    except Paciente.DoesNotExist:
+        return resposta_json({"erro": "Paciente não encontrado"}, status=status.HTTP_404_NOT_FOUND)
+    return JsonResponse(PacienteSerializer(paciente).data, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+@view_assincrona(views.exames_por_paciente)
+@condicional(EXAMES)
+async def exames_por_paciente(request, paciente_id):
+    exames = Exame.objects.filter(paciente_id=paciente_id).order_by('-data_exame')
+    return resposta_json(await linhas_exames_async(exames))
+
+
+@view_assincrona(views.exames_alelos_por_paciente_exame)
+@condicional(EXAMES)
+async def exames_alelos_por_paciente_exame(request, paciente_id, exame_id):
+    formato = formato_binario(request)
+    if not await Exame.objects.filter(id=exame_id, paciente_id=paciente_id).aexists():
+        return _responder(request, {"erro": "Exame não encontrado para este paciente"}, status=status.HTTP_404_NOT_FOUND)
+
+    exames_alelos = ExameAlelo.objects.filter(exame_id=exame_id).order_by('alelo__nome')
+    if formato:
+        return _responder(request, await tabela_exames_alelos_async(exames_alelos))
+    return resposta_json(await linhas_exames_alelos_async(exames_alelos))
+
+
+@view_assincrona(views.lista_exames)
+@condicional(EXAMES)
+async def lista_exames(request):
+    try:
+        return resposta_json(await linhas_exames_async(Exame.objects.all().order_by('-data_exame')))
+    except Exception as e:
+        return resposta_json({"error": f"Erro ao buscar exames: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@view_assincrona(views.detalhe_exame)
+@condicional(EXAMES)
+async def detalhe_exame(request, exame_id):
+    try:
+        exame = await aget_object_or_404(Exame, id=exame_id)
+        return resposta_json(ExameSerializer(exame).data)
+    except Exception as e:
+        return resposta_json({"error": f"Erro ao buscar detalhes do exame: {str(e)}"},
+                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@view_assincrona(views.list_vxm)
+@condicional(CROSSMATCHES)
+async def list_vxm(request):
+    params = request.GET
+    resumo = _opcao(request, 'resumo')
+    paginado = paginacao_solicitada(request)
+    try:
+        vxms = views.filtrar_vxms(params, resumo)
+        if paginado:
+            pagina, proximo = await paginar_async(vxms, views.ORDEM_VXMS, params.get('cursor'), ler_limite(request))
+        else:
+            pagina = [vxm async for vxm in vxms.order_by(*views.ORDEM_VXMS)]
+    except (ErroPaginacao, ValueError) as e:
+        return resposta_json({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not resumo:
+        await anexar_alelos_async([resultado for vxm in pagina for resultado in vxm.patient_results.all()])
+
+    serializer_class = CrossmatchResumoSerializer if resumo else CrossmatchSerializer
+    dados = serializer_class(pagina, many=True).data
+    if not paginado:
+        return resposta_json(dados)
+    return resposta_json({
+        "next": url_proxima_pagina(request, proximo),
+        "results": dados,
+    })
+
+
+@view_assincrona(views.detail_vxm)
+@condicional(CROSSMATCHES)
+async def detail_vxm(request, vxm_id):
+    formato = formato_binario(request)
+    try:
+        vxm = await carregar_crossmatch_async(vxm_id)
+    except Crossmatch.DoesNotExist:
+        return _responder(request, {"error": "Crossmatch não encontrado"}, status=status.HTTP_404_NOT_FOUND)
+    if formato:
+        return _responder(request, tabela_vxm(vxm))
+    return resposta_json(CrossmatchSerializer(vxm).data)
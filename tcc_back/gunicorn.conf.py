@@ -0,0 +1,51 @@
+"""
+Configuração do gunicorn para produção (Procfile: `gunicorn -c gunicorn.conf.py`).
+
+A aplicação é carregada uma vez no processo mestre (`preload_app`), aquecida (módulos, painel do
+cPRA e matriz MFI, ver backend/aquecimento.py) e só então os workers são criados por fork.
+Com GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker a aplicação servida é a ASGI.
+"""
+import multiprocessing
+import os
+import tempfile
+
+# `config` é o nome de uma configuração do próprio gunicorn; por isso o módulo é importado inteiro
+import decouple
+
+# O aquecimento em BackendConfig.ready() só é feito nos processos do servidor
+os.environ.setdefault('AQUECER_CACHES', 'True')
+# Métricas de /metrics somadas entre os workers (cada worker grava as suas nessa pasta)
+os.environ.setdefault('METRICAS_DIRETORIO', os.path.join(tempfile.gettempdir(), 'tcc_metricas'))
+
+bind = decouple.config('GUNICORN_BIND', default=f"0.0.0.0:{os.getenv('PORT', '8000')}")
+worker_class = decouple.config('GUNICORN_WORKER_CLASS', default='gthread')
+workers = decouple.config('WEB_CONCURRENCY', default=min(multiprocessing.cpu_count() * 2 + 1, 8), cast=int)
+threads = decouple.config('GUNICORN_THREADS', default=4, cast=int)  # Só no gthread
+if 'uvicorn' in worker_class:
+    # Sob ASGI, as leituras são atendidas pelas views assíncronas (backend/views_async.py)
+    wsgi_app = 'tcc_back.asgi:application'
+    os.environ.setdefault('VIEWS_ASSINCRONAS', 'True')
+else:
+    wsgi_app = 'tcc_back.wsgi:application'
+preload_app = True
+
+timeout = decouple.config('GUNICORN_TEMPO_LIMITE', default=120, cast=int)  # O upload em lote pode demorar
+graceful_timeout = 30
+keepalive = 5
+# Reinicia cada worker depois de algumas requisições (o novo worker também nasce aquecido do mestre)
+max_requests = decouple.config('GUNICORN_MAX_REQUISICOES', default=2000, cast=int)
+max_requests_jitter = max_requests // 10
+
+accesslog = decouple.config('GUNICORN_ACCESSLOG', default='-') or None  # Vazio desativa o log de acesso
+errorlog = '-'
+
+
+def when_ready(server):
+    # Depois do preload e antes do fork: carrega a matriz MFI e fecha as conexões do mestre, que
+    # não atende requisições (os workers abrem as suas)
+    from backend.aquecimento import aquecer_dados
+    from backend.metricas import limpar_metricas
+    aquecer_dados()
+    # As contagens recomeçam a cada inicialização do servidor
+    limpar_metricas()
+
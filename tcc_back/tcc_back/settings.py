@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
-from decouple import config
+from decouple import config, Csv
 from datetime import timedelta
 
 load_dotenv()
@@ -66,6 +66,7 @@ SIMPLE_JWT = {
 
 # Middleware
 MIDDLEWARE = [
+    'backend.metricas.MetricasMiddleware',  # Server-Timing, histogramas de /metrics e log de requisições lentas
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -74,34 +75,43 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    'backend.estaticos.WhiteNoiseAssincrono',  # WhiteNoise também em modo assíncrono (ASGI)
 ]
 
 # Configuração do CORS
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWS_CREDENTIALS = True
-
-# Logging
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified', 'Server-Timing']  # Requisições condicionais e tempos por requisição
+
+# Logging: os registros são enfileirados e escritos no console e em LOG_ARQUIVO por uma thread
+# (backend.logs.ManipuladorFila), fora do tempo de resposta das requisições.
+# LOG_NIVEIS ajusta o nível por logger ("django.db.backends=DEBUG,backend.views=WARNING") e
+# LOG_AMOSTRAGEM mantém só uma fração dos registros INFO/DEBUG ("backend.views=0.1").
+LOG_NIVEL = config('LOG_NIVEL', default='INFO')
+LOG_NIVEIS = config('LOG_NIVEIS', default='', cast=Csv())
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'handlers': {
-        'console': {
-            'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
+    'filters': {
+        'amostragem': {
+            '()': 'backend.logs.FiltroAmostragem',
+            'taxas': config('LOG_AMOSTRAGEM', default=''),
         },
-        'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': BASE_DIR / 'debug.log',
+    },
+    'handlers': {
+        'fila': {
+            '()': 'backend.logs.ManipuladorFila',
+            'arquivo': config('LOG_ARQUIVO', default=str(BASE_DIR / 'debug.log')),
+            'formato': config('LOG_FORMATO', default='texto'),  # 'texto' ou 'json'
+            'filters': ['amostragem'],
         },
     },
     'loggers': {
         '': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
-            'propagate': True,
+            'handlers': ['fila'],
+            'level': LOG_NIVEL,
         },
+        **{nome.strip(): {'level': nivel.strip()} for nome, nivel in (item.split('=', 1) for item in LOG_NIVEIS if '=' in item)},
     },
 }
 
@@ -137,6 +147,39 @@ DATABASES = {
     }
 }
 
+# Views de leitura assíncronas (backend/views_async.py), para servir sob ASGI (uvicorn)
+VIEWS_ASSINCRONAS = config('VIEWS_ASSINCRONAS', default=False, cast=bool)
+
+# Conexões com o PostgreSQL: com o psycopg 3 e o psycopg_pool instalados, cada processo mantém um pool
+# (DB_POOL_MIN a DB_POOL_MAX conexões) e cada conexão é verificada ao sair do pool. Sem eles (psycopg2),
+# as conexões são persistentes por DB_CONN_MAX_AGE segundos e verificadas no início de cada requisição.
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:  # Dependência opcional
+    ConnectionPool = None
+
+if config('DB_POOL', default=ConnectionPool is not None, cast=bool):
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX', default=8, cast=int),
+            'timeout': config('DB_POOL_TEMPO_LIMITE', default=10, cast=int),  # Segundos esperando uma conexão livre
+            'max_idle': 300,
+            'check': ConnectionPool.check_connection,
+        },
+    }
+else:
+    # Sob ASGI cada requisição usa uma thread nova: conexões persistentes ficariam abertas (sem o pool)
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=0 if VIEWS_ASSINCRONAS else 60, cast=int)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# SQLite local (ex.: DB_ENGINE=sqlite python manage.py test)
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -172,3 +215,35 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Motor do Virtual Crossmatch: 'matriz' (matriz MFI residente em memória), 'sql' (consulta única no banco) ou 'pandas'
+CROSSMATCH_ENGINE = config('CROSSMATCH_ENGINE', default='matriz')
+# Resultados de crossmatch mantidos em cache por processo (0 desativa); invalidados a cada alteração dos dados
+CROSSMATCH_CACHE_TAMANHO = config('CROSSMATCH_CACHE_TAMANHO', default=256, cast=int)
+
+# Upload em lote de exames: processos de leitura, exames por transação e tamanho máximo de cada arquivo
+UPLOAD_LOTE_PROCESSOS = config('UPLOAD_LOTE_PROCESSOS', default=os.cpu_count() or 1, cast=int)
+UPLOAD_LOTE_TRANSACAO = config('UPLOAD_LOTE_TRANSACAO', default=20, cast=int)
+UPLOAD_LOTE_TAMANHO_MAXIMO = 20 * 1024 * 1024
+
+# Fila de tarefas assíncronas (python manage.py processar_tarefas)
+TAREFAS_CONCORRENCIA_MAXIMA = config('TAREFAS_CONCORRENCIA_MAXIMA', default=4, cast=int)  # Tarefas simultâneas em todos os workers
+TAREFAS_MAX_TENTATIVAS = config('TAREFAS_MAX_TENTATIVAS', default=3, cast=int)
+# Segundos sem sinal de vida do worker até uma execução ser considerada abandonada e voltar à fila
+# (o worker renova a reserva a cada quarto desse tempo)
+TAREFAS_TEMPO_LIMITE = config('TAREFAS_TEMPO_LIMITE', default=120, cast=int)
+
+# Painel de doadores de referência do cPRA: CSV com a coluna `antigenos` (ex.: "A*02 A*24 B*07 DRB1*04")
+# e, opcionalmente, `frequencia` (peso de cada fenótipo na população)
+CPRA_PAINEL = config('CPRA_PAINEL', default=str(BASE_DIR / 'painel_cpra.csv'))
+
+# Requisições mais lentas que este limite (em ms) são registradas no log com suas consultas SQL
+REQUISICAO_LENTA_MS = config('REQUISICAO_LENTA_MS', default=1000, cast=int)
+
+# Pasta compartilhada pelos workers para as métricas de /metrics (ver backend/metricas.py). Vazio: métricas
+# apenas do processo que responde (um único worker). O gunicorn.conf.py define uma pasta temporária.
+METRICAS_DIRETORIO = config('METRICAS_DIRETORIO', default='')
+
+# Aquecimento na inicialização (ver backend/aquecimento.py): importa as bibliotecas pesadas e carrega
+# o painel do cPRA em BackendConfig.ready(). Ligado pelo gunicorn.conf.py; desligado nos comandos de gerenciamento.
+AQUECER_CACHES = config('AQUECER_CACHES', default=False, cast=bool)
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from backend.views import CreateUserView
+from backend.metricas import metricas
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
@@ -10,4 +11,5 @@ urlpatterns = [
     path("api/token/refresh/", TokenRefreshView.as_view(), name="refresh"),
     path("api-auth/", include("rest_framework.urls")),
     path('api/', include('backend.urls')),  # Inclui as URLs da app 'backend'
+    path('metrics', metricas, name='metricas'),  # Métricas no formato do Prometheus
 ]